@@ -0,0 +1,265 @@
+from __future__ import annotations
+
+import argparse
+import os
+import socket
+import tempfile
+import threading
+import time
+import tracemalloc
+from pathlib import Path
+
+from hyperdesk.network.protocol import (
+    decode_binary,
+    decode_message,
+    encode_binary,
+    encode_message,
+)
+from hyperdesk.transfer.channel import FileSender, receive_file
+from hyperdesk.transfer.digests import INTEGRITY_ONLY, new_hasher, supported_algorithms
+from hyperdesk.transfer.diskio import pread_into
+from hyperdesk.transfer.secure import SecureChannel
+from hyperdesk.transfer.wire import (
+    FRAME_DATA,
+    FRAME_END,
+    FrameReader,
+    payload_crc,
+    payload_limit,
+    read_frame,
+    send_frame,
+)
+
+RECEIVE_MODES = ("recv", "recv_into", "splice")
+
+
+def bench_hashes(size_mb: int, rounds: int) -> None:
+    chunk = memoryview(os.urandom(1024 * 1024))
+    print(f"Hashing {size_mb} MB x {rounds} round(s) in 1 MB updates")
+    print(f"{'algorithm':<12} {'MB/s':>10}")
+    for name in supported_algorithms():
+        best = 0.0
+        for _ in range(rounds):
+            hasher = new_hasher(name)
+            start = time.perf_counter()
+            for _ in range(size_mb):
+                hasher.update(chunk)
+            hasher.hexdigest()
+            elapsed = time.perf_counter() - start
+            best = max(best, size_mb / elapsed)
+        note = "  (integrity only)" if name in INTEGRITY_ONLY else ""
+        print(f"{name:<12} {best:>10.1f}{note}")
+
+
+def bench_receive(size_mb: int, algorithm: str, modes) -> None:
+    """Receive ``size_mb`` of 1 MB DATA frames over loopback per read mode.
+
+    ``recv`` allocates a payload per frame, ``recv_into`` reuses one pooled
+    buffer and ``splice`` moves payloads socket to file in the kernel and
+    hashes them back from the page cache. CPU is the receiving thread's;
+    peak is what tracemalloc saw allocated at once while receiving.
+    """
+    print(f"Receiving {size_mb} MB in 1 MB frames over loopback, {algorithm} digests")
+    print(f"{'mode':<10} {'MB/s':>8} {'CPU s/GB':>9} {'peak KB':>9}")
+    with tempfile.TemporaryDirectory() as directory:
+        for mode in modes:
+            if mode == "splice" and not hasattr(os, "splice"):
+                print(f"{mode:<10} {'(unsupported on this platform)':>28}")
+                continue
+            path = os.path.join(directory, f"{mode}.bin")
+            elapsed, cpu = _receive_once(path, size_mb, algorithm, mode, False)
+            _receive_once(path, min(size_mb, 64), algorithm, mode, True)
+            _current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            gigabytes = size_mb / 1024
+            print(
+                f"{mode:<10} {size_mb / elapsed:>8.1f} {cpu / gigabytes:>9.2f}"
+                f" {peak / 1024:>9.0f}"
+            )
+
+
+def _receive_once(path: str, size_mb: int, algorithm: str, mode: str, trace: bool):
+    listener = socket.create_server(("127.0.0.1", 0))
+    payload = os.urandom(1024 * 1024)
+
+    def send() -> None:
+        conn, _ = listener.accept()
+        with conn:
+            for index in range(size_mb):
+                send_frame(conn, FRAME_DATA, index * len(payload), len(payload), payload)
+            send_frame(conn, FRAME_END, size_mb * len(payload), 0)
+
+    sender = threading.Thread(target=send)
+    sender.start()
+    conn = socket.create_connection(listener.getsockname())
+    fd = os.open(path, os.O_RDWR | os.O_CREAT | os.O_TRUNC)
+    hasher = new_hasher(algorithm)
+    reader = FrameReader(conn)
+    reader.buffer(len(payload))
+    if trace:
+        tracemalloc.start()
+    start, cpu_start = time.perf_counter(), time.thread_time()
+    try:
+        while True:
+            if mode == "recv":
+                kind, offset, _raw_len, data = read_frame(conn, payload_limit(len(payload)))
+            else:
+                kind, offset, raw_len, wire_len, crc = reader.read_header()
+            if kind == FRAME_END:
+                break
+            if mode == "splice":
+                reader.splice_payload(fd, offset, wire_len)
+                data = reader.buffer()[:wire_len]
+                pread_into(fd, data, offset)
+            elif mode == "recv_into":
+                data = reader.read_payload(wire_len)
+            if mode != "recv" and payload_crc(data) != crc:
+                # read_frame checks the CRC itself.
+                raise ConnectionError("Frame failed its integrity check")
+            if mode != "splice":
+                os.pwrite(fd, data, offset)
+            hasher.update(data)
+        hasher.hexdigest()
+        return time.perf_counter() - start, time.thread_time() - cpu_start
+    finally:
+        reader.close()
+        conn.close()
+        os.close(fd)
+        sender.join()
+        listener.close()
+
+
+def bench_encryption(size_mb: int, rounds: int) -> None:
+    """Send a ``size_mb`` file with FileSender over loopback, in the clear
+    and over TLS, and time full and resumed handshakes.
+
+    CPU is the whole process's, sender and receiver together.
+    """
+    server, client = SecureChannel("bench"), SecureChannel("bench")
+    full = _handshake_ms(server, client)
+    resumed = min(_handshake_ms(server, client) for _ in range(5))
+    print(f"TLS handshake: {full:.1f} ms full, {resumed:.1f} ms resumed")
+    print(f"Sending {size_mb} MB over loopback, best of {rounds}")
+    print(f"{'mode':<10} {'MB/s':>8} {'CPU s/GB':>9}")
+    with tempfile.TemporaryDirectory() as directory:
+        source = Path(directory) / "source.bin"
+        with open(source, "wb") as handle:
+            for _ in range(size_mb):
+                handle.write(os.urandom(1024 * 1024))
+        for mode, secure in (("plaintext", None), ("tls", (server, client))):
+            best_rate, best_cpu = 0.0, 0.0
+            for _ in range(rounds):
+                elapsed, cpu = _send_once(source, Path(directory), secure)
+                if size_mb / elapsed > best_rate:
+                    best_rate, best_cpu = size_mb / elapsed, cpu
+            print(f"{mode:<10} {best_rate:>8.1f} {best_cpu / (size_mb / 1024):>9.2f}")
+
+
+def _handshake_ms(server: SecureChannel, client: SecureChannel) -> float:
+    listener = socket.create_server(("127.0.0.1", 0))
+    accepted = []
+    acceptor = threading.Thread(
+        target=lambda: accepted.append(server.wrap_server(listener.accept()[0]))
+    )
+    acceptor.start()
+    start = time.perf_counter()
+    conn = client.wrap_client(socket.create_connection(listener.getsockname()))
+    elapsed = time.perf_counter() - start
+    acceptor.join()
+    for sock in [conn, *accepted]:
+        sock.close()
+    listener.close()
+    return elapsed * 1000
+
+
+def _send_once(source: Path, directory: Path, secure):
+    sender = FileSender(host="127.0.0.1", secure=secure[0] if secure else None)
+    port = sender.open()
+    thread = threading.Thread(
+        target=sender.send_file, args=(source,), kwargs={"hash_algorithm": "crc32"}
+    )
+    thread.start()
+    dest = directory / "dest"
+    start, cpu_start = time.perf_counter(), time.process_time()
+    try:
+        receive_file(
+            "127.0.0.1", port, dest, conflict_rule="overwrite", hash_algorithm="crc32",
+            secure=secure[1] if secure else None,
+        )
+        return time.perf_counter() - start, time.process_time() - cpu_start
+    finally:
+        thread.join()
+        sender.close()
+
+
+def bench_protocol(count: int) -> None:
+    """Encode and decode ``count`` TRANSFER_STATUS messages per codec."""
+    payload = {
+        "job_id": "3f2b6a3e-8d1c-4f7e-9a61-0c5d2e7b9f14",
+        "path": "project-archive.tar",
+        "status": "receiving",
+        "progress": 0.4375,
+        "checksum": "",
+        "bytes_copied": 469762048,
+        "size": 1073741824,
+        "direction": "download",
+        "rate_mbps": 812.5,
+    }
+    print(f"{count} TRANSFER_STATUS messages per codec")
+    print(f"{'codec':<8} {'bytes':>6} {'encode us':>10} {'decode us':>10}")
+    for name, encode, decode in (
+        ("json", encode_message, decode_message),
+        ("binary", encode_binary, decode_binary),
+    ):
+        start = time.perf_counter()
+        for _ in range(count):
+            raw = encode("TRANSFER_STATUS", payload)
+        encoded = time.perf_counter() - start
+        start = time.perf_counter()
+        for _ in range(count):
+            decode(raw)
+        decoded = time.perf_counter() - start
+        print(
+            f"{name:<8} {len(raw):>6} {encoded / count * 1e6:>10.2f}"
+            f" {decoded / count * 1e6:>10.2f}"
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="HYPERDESK micro-benchmarks")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    hashes = commands.add_parser("hashes", help="Digest throughput per algorithm")
+    hashes.add_argument("--size-mb", type=int, default=256)
+    hashes.add_argument("--rounds", type=int, default=3)
+
+    receive = commands.add_parser(
+        "receive", help="CPU and allocations of the network receive path"
+    )
+    receive.add_argument("--size-mb", type=int, default=1024)
+    receive.add_argument("--algorithm", default="crc32")
+    receive.add_argument("--modes", nargs="+", choices=RECEIVE_MODES, default=RECEIVE_MODES)
+
+    encryption = commands.add_parser(
+        "encryption", help="Loopback send throughput in the clear and over TLS"
+    )
+    encryption.add_argument("--size-mb", type=int, default=512)
+    encryption.add_argument("--rounds", type=int, default=3)
+
+    protocol = commands.add_parser(
+        "protocol", help="Control message encode/decode cost, JSON vs binary"
+    )
+    protocol.add_argument("--count", type=int, default=100_000)
+
+    args = parser.parse_args()
+    if args.command == "hashes":
+        bench_hashes(args.size_mb, args.rounds)
+    elif args.command == "receive":
+        bench_receive(args.size_mb, args.algorithm, args.modes)
+    elif args.command == "encryption":
+        bench_encryption(args.size_mb, args.rounds)
+    elif args.command == "protocol":
+        bench_protocol(args.count)
+
+
+if __name__ == "__main__":
+    main()
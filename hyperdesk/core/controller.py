@@ -1,25 +1,51 @@
 from __future__ import annotations
 
 import asyncio
+import hmac
+import os
 import socket
 import threading
 import time
 import uuid
+from concurrent.futures import Future, InvalidStateError
 from pathlib import Path
 from typing import Optional
 
 from hyperdesk.core.hyperbox import HyperboxManager
 from hyperdesk.core.models import Device, FileRequest, PairingSession, TransferJob
+from hyperdesk.core.progress import PROGRESS_STATUSES, ProgressCoalescer
 from hyperdesk.core.requests import RequestQueue
 from hyperdesk.core.storage import Storage
 from hyperdesk.core.watcher import HyperboxWatcher
 from hyperdesk.network.control import ControlServer
 from hyperdesk.network.discovery import NetworkDiscovery, ZeroconfService
+from hyperdesk.network.local import control_socket_path, host_identity
 from hyperdesk.network.pairing import PairingManager
-from hyperdesk.network.protocol import encode_message
-from hyperdesk.transfer.channel import FileSender
-from hyperdesk.transfer.engine import TransferEngine
+from hyperdesk.transfer.channel import (
+    AsyncFileServer,
+    FileSender,
+    SessionDataServer,
+    SessionLink,
+)
+from hyperdesk.transfer.chunktree import ChunkTree
+from hyperdesk.transfer.compression import (
+    NO_COMPRESSION,
+    negotiate_codec,
+    supported_codecs,
+)
+from hyperdesk.transfer.digestcache import default_cache
+from hyperdesk.transfer.digests import DEFAULT_ALGORITHM, negotiate, supported_algorithms
+from hyperdesk.transfer.engine import TransferEngine, TransferResult, retry_delay
+from hyperdesk.transfer.finalize import DURABILITY_MODES
+from hyperdesk.transfer.secure import SecureChannel
+from hyperdesk.transfer.throttle import BandwidthGovernor, BandwidthShare
 
+# Seconds to wait for a peer on this host to take a file handed over by path.
+LOCAL_HANDOFF_TIMEOUT = 3600.0
+# Seconds to wait for the control loop to queue a control message.
+QUEUE_TIMEOUT = 10.0
+# Most data connections a peer may ask to stripe one file over.
+MAX_PEER_STREAMS = 16
 
 class AppController:
     def __init__(self, state) -> None:
@@ -37,19 +63,47 @@ class AppController:
         self._last_transfer_by_path: dict[str, float] = {}
         self._request_transfer_map: dict[str, str] = {}
         self._transfer_metrics: dict[str, tuple[int, float]] = {}
+        # Caps progress writes and UI updates per job, local or from peers.
+        self.progress = ProgressCoalescer()
         self._transfer_defaults = {
             "chunk_size_mb": 8,
             "max_bandwidth": "unlimited",
             "retry_policy": "exponential",
             "max_retries": 3,
             "encryption": False,
+            "parallel_workers": 1,
+            "range_size_mb": 64,
+            "network_streams": 4,
+            "chunk_hashes": False,
+            "hash_algorithm": DEFAULT_ALGORITHM,
+            "burst_mb": 0,
+            "compression": NO_COMPRESSION,
+            "durability": "file",
         }
+        # Every local copy and network send draws from this one bucket, so
+        # max_bandwidth caps the whole process rather than each job.
+        self.bandwidth = BandwidthGovernor()
+        self._apply_bandwidth_settings(self.get_transfer_settings())
+        # Digest algorithms and compression codecs advertised by the paired peer.
+        self._peer_hash_algorithms: list[str] = []
+        self._peer_compression_codecs: list[str] = []
+        self._peer_data_streams = 1
         self._control_loop: Optional[asyncio.AbstractEventLoop] = None
         self._control_thread: Optional[threading.Thread] = None
         self.control_server: Optional[ControlServer] = None
         self.control_host = "127.0.0.1"
         self.control_port = 8765
         self.mdns_service: Optional[ZeroconfService] = None
+        # Persistent, multiplexed data connections, one per paired session.
+        self.data_server: Optional[SessionDataServer] = None
+        # Serves single-stream sends without a session link on the control loop.
+        self.data_plane: Optional[AsyncFileServer] = None
+        # TLS state per session token, kept so later connections resume.
+        self._secure_channels: dict[str, SecureChannel] = {}
+        # Set once the peer proved over the Unix control socket that it runs
+        # on this host; files are then handed over by path.
+        self._peer_local = False
+        self._local_handoffs: dict[str, Future] = {}
 
         self.storage.record_device(self.local_device)
         if self.discovery.use_mdns:
@@ -60,6 +114,7 @@ class AppController:
                 self.mdns_service = None
         self.watcher.start()
         self.start_control_server(self.control_host, self.control_port)
+        self._start_data_server()
 
     def scan(self) -> None:
         devices = self.discovery.scan()
@@ -120,7 +175,20 @@ class AppController:
             self.storage.update_session_status(session_id, "disconnected")
             self.storage.record_audit_event(session_id, "session_disconnected", f"Disconnected from {peer}.")
             self.state.add_log(f"Disconnected from {peer}.")
-            self._broadcast_session_update("disconnected", "", False, "keep_both")
+            if self.data_server:
+                self.data_server.drop(session_id)
+            self._secure_channels.clear()
+            self._peer_local = False
+            self._fail_local_handoffs()
+            sent = self._broadcast_session_update(
+                "disconnected", "", False, "keep_both", session_id=session_id
+            )
+            if sent is not None:
+                # Forget the route only once the update is queued on it.
+                loop, server = self._control_loop, self.control_server
+                sent.add_done_callback(
+                    lambda _sent: loop.call_soon_threadsafe(server.forget_session, session_id)
+                )
 
     def simulate_transfer(self) -> None:
         if not self.state.session:
@@ -169,6 +237,7 @@ class AppController:
             direction="upload",
             request_id=updated.id,
             network_transfer=updated.requester != "local",
+            priority="interactive",
         )
 
     def approve_request_with_source(self, request_id: str, source_path: str) -> None:
@@ -191,6 +260,7 @@ class AppController:
             direction="upload",
             request_id=updated.id,
             network_transfer=updated.requester != "local",
+            priority="interactive",
         )
 
     def decline_request(self, request_id: str) -> None:
@@ -257,20 +327,55 @@ class AppController:
             loop = asyncio.new_event_loop()
             asyncio.set_event_loop(loop)
             self._control_loop = loop
-            self.control_server = ControlServer(host, port, self._handle_control_message)
+            unix_path = control_socket_path()
+            self.control_server = ControlServer(
+                host,
+                port,
+                self._handle_control_message,
+                str(unix_path) if unix_path else None,
+                on_session_closed=self._handle_session_closed,
+            )
             loop.run_until_complete(self.control_server.start())
+            self.data_plane = AsyncFileServer()
             self.state.add_log(f"Control server listening on {host}:{port}.")
+            if self.control_server.unix_path:
+                self.state.add_log(
+                    f"Local control socket at {self.control_server.unix_path}."
+                )
             loop.run_forever()
 
         self._control_thread = threading.Thread(target=runner, daemon=True)
         self._control_thread.start()
 
+    def _start_data_server(self) -> None:
+        server = SessionDataServer(self._authenticate_data_link)
+        try:
+            port = server.open()
+        except OSError as exc:
+            self.state.add_log(f"Session data channel unavailable: {exc}")
+            return
+        self.data_server = server
+        self.state.add_log(f"Session data channel listening on port {port}.")
+
+    def _authenticate_data_link(self, hello: dict) -> Optional[str]:
+        session = self.state.session
+        if not session or hello.get("session_id") != session.id:
+            return None
+        token = str(hello.get("session_token") or "")
+        if not hmac.compare_digest(token.encode(), session.token.encode()):
+            return None
+        return session.id
+
     def shutdown(self) -> None:
         self._closing = True
         try:
             self.watcher.stop()
         except Exception:
             pass
+        if self.data_server:
+            self.data_server.close()
+        if self.data_plane:
+            self.data_plane.close()
         if self.mdns_service:
             try:
                 self.mdns_service.stop()
@@ -300,6 +405,10 @@ class AppController:
                 self.state.add_log("No active pairing session found for code.")
                 return
             peer_device = self._build_peer_device(payload)
+            self._peer_hash_algorithms = list(payload.get("hash_algorithms") or [])
+            self._peer_compression_codecs = list(payload.get("compression_codecs") or [])
+            self._peer_data_streams = _peer_stream_count(payload.get("data_streams"))
+            self._peer_local = False
             mode, conflict_rule = self._get_device_sync_preset(peer_device.id)
             session = self.pairing.confirm_pairing(
                 pairing,
@@ -309,6 +418,8 @@ class AppController:
                 conflict_rule=conflict_rule,
             )
             self.pending_pairing = None
+            # Messages for this session go to the connection that paired.
+            self.control_server.bind_session(session.id, peer_device.id)
             self.state.set_session(session)
             self.state.set_pairing_code("")
             self.state.set_transfers([])
@@ -326,6 +437,34 @@ class AppController:
                 session.policy.approval_required,
                 session.policy.conflict_rule,
             )
+        elif message_type == "LOCAL_LINK" and self.state.session:
+            session = self.state.session
+            if not self.control_server.from_unix_socket():
+                # Reaching the Unix socket is the proof of being on this
+                # host, so a link over TCP proves nothing.
+                self.state.add_log("Rejected local link that did not use the Unix socket.")
+                return
+            token = str(payload.get("session_token") or "")
+            if (
+                payload.get("session_id") != session.id
+                or not hmac.compare_digest(token.encode(), session.token.encode())
+                or payload.get("host_identity") != host_identity()
+            ):
+                self.state.add_log("Rejected local link with bad session credentials.")
+                return
+            # Only a process of this user on this host can reach the socket.
+            self._peer_local = True
+            self.control_server.bind_session(session.id, session.peer_device.id)
+            # The peer keeps its TCP connection until this arrives on the socket.
+            await self.control_server.send_to(
+                session.id,
+                "LOCAL_LINK",
+                {"session_id": session.id, "session_token": "", "host_identity": host_identity()},
+            )
+            self.state.add_log(
+                "Peer is on this host: control over the Unix socket, "
+                "files handed over by path."
+            )
         elif message_type == "SESSION_UPDATE" and self.state.session:
             status = payload.get("status", self.state.session.status)
             mode = payload.get("mode", self.state.session.policy.mode)
@@ -348,6 +487,13 @@ class AppController:
             job_id = payload.get("job_id")
             if not job_id:
                 return
+            if payload.get("status") in PROGRESS_STATUSES:
+                if not self.progress.due(job_id):
+                    return
+            else:
+                self.progress.finish(job_id)
+            self._check_peer_chunk_tree(job_id, payload)
+            tree = ChunkTree.from_payload(payload)
             job = TransferJob(
                 id=job_id,
                 path=payload.get("path", ""),
@@ -358,10 +504,21 @@ class AppController:
                 progress=float(payload.get("progress", 0.0)),
                 checksum=payload.get("checksum"),
                 rate_mbps=float(payload.get("rate_mbps", 0.0)),
+                chunk_size=tree.chunk_size if tree else 0,
+                chunk_root=tree.root if tree else None,
+                chunk_digests=list(tree.digests) if tree else [],
+                hash_algorithm=payload.get("hash_algorithm") or DEFAULT_ALGORITHM,
             )
             self.state.update_transfer(job)
             if self.state.session:
                 self.storage.record_transfer(self.state.session.id, job)
+            handoff = self._local_handoffs.get(job_id)
+            if (
+                handoff
+                and not handoff.done()
+                and job.status in ("complete", "skipped", "failed")
+            ):
+                handoff.set_result(payload)
         elif message_type == "TRANSFER_REQUEST" and self.state.session:
             path = payload.get("path", "")
             requester = payload.get("requester", "peer")
@@ -405,6 +562,7 @@ class AppController:
                     direction="upload",
                     request_id=None,
                     network_transfer=False,
+                    priority="bulk",
                 )
             else:
                 self.state.add_log(f"Outbox file detected: {relative}")
@@ -423,6 +581,7 @@ class AppController:
         direction: str,
         request_id: Optional[str],
         network_transfer: bool,
+        priority: str = "normal",
     ) -> None:
         if not self.state.session:
             return
@@ -445,6 +604,17 @@ class AppController:
         )
         self.state.update_transfer(job)
         self.storage.record_transfer(self.state.session.id, job)
+        if network_transfer and self._uses_data_plane(
+            self._network_plan(source_path, settings), settings
+        ):
+            # A coroutine on the control loop; no thread waits on it.
+            asyncio.run_coroutine_threadsafe(
+                self._run_data_plane_job(
+                    self.state.session.id, job, source_path, settings, request_id, priority
+                ),
+                self._control_loop,
+            )
+            return
         worker = threading.Thread(
             target=self._run_transfer_job,
             args=(
@@ -452,12 +622,10 @@ class AppController:
                 job,
                 source_path,
                 dest_path,
-                settings["chunk_size_mb"],
-                settings["max_bandwidth"],
-                settings["retry_policy"],
-                settings["max_retries"],
+                settings,
                 request_id,
                 network_transfer,
+                priority,
             ),
             daemon=True,
         )
@@ -469,101 +637,186 @@ class AppController:
         job: TransferJob,
         source_path: Path,
         dest_path: Path,
-        chunk_size_mb: int,
-        max_bandwidth: str,
-        retry_policy: str,
-        max_retries: int,
+        settings: dict,
         request_id: Optional[str],
         network_transfer: bool,
+        priority: str = "normal",
     ) -> None:
+        # Contending jobs split the bandwidth cap by priority weight.
+        share = self.bandwidth.register(job.id, priority)
+
         def on_progress(bytes_copied: int, total_size: int) -> None:
-            progress = bytes_copied / total_size if total_size else 1.0
-            now = time.monotonic()
-            last_bytes, last_time = self._transfer_metrics.get(job.id, (0, now))
-            delta_bytes = bytes_copied - last_bytes
-            delta_time = max(now - last_time, 0.0001)
-            rate_mbps = (delta_bytes / delta_time) / (1024 * 1024)
-            self._transfer_metrics[job.id] = (bytes_copied, now)
-            updated = TransferJob(
-                id=job.id,
-                path=job.path,
-                direction=job.direction,
-                status="transferring",
-                size=total_size,
-                bytes_copied=bytes_copied,
-                progress=progress,
-                checksum=job.checksum,
-                rate_mbps=rate_mbps,
-            )
-            self.state.update_transfer(updated)
-            if not self._closing:
-                try:
-                    self.storage.record_transfer(session_id, updated)
-                except Exception:
-                    pass
+            self._report_progress(session_id, job, bytes_copied, total_size)
 
         try:
             if network_transfer:
                 result = self._send_over_network(
                     source_path,
-                    chunk_size_mb,
-                    max_bandwidth,
+                    settings,
                     on_progress,
                     job,
+                    share,
                 )
             else:
                 result = self.transfer.copy_with_checksum(
                     str(source_path),
                     str(dest_path),
-                    chunk_size=chunk_size_mb * 1024 * 1024,
+                    chunk_size=settings["chunk_size_mb"] * 1024 * 1024,
                     on_progress=on_progress,
                     resume=True,
-                    max_bandwidth=self._parse_bandwidth(max_bandwidth),
-                    retry_policy=retry_policy,
-                    max_retries=max_retries,
+                    governor=share,
+                    retry_policy=settings["retry_policy"],
+                    max_retries=settings["max_retries"],
+                    workers=settings["parallel_workers"],
+                    range_size=settings["range_size_mb"] * 1024 * 1024,
+                    chunk_hashes=settings["chunk_hashes"],
+                    verify=settings["chunk_hashes"],
+                    hash_algorithm=settings["hash_algorithm"],
+                    durability=settings["durability"],
                 )
-            finished = TransferJob(
-                id=job.id,
-                path=job.path,
-                direction=job.direction,
-                status="complete",
-                size=job.size,
-                bytes_copied=result.bytes_copied,
-                progress=1.0,
-                checksum=result.checksum,
-                rate_mbps=0.0,
-            )
-            self.state.update_transfer(finished)
-            if not self._closing:
-                try:
-                    self.storage.record_transfer(session_id, finished)
-                except Exception:
-                    pass
-            self._broadcast_transfer_status(finished)
-            if request_id:
-                self._finalize_request(request_id, "completed")
+            self._complete_job(session_id, job, result, request_id)
         except Exception as exc:
-            failed = TransferJob(
-                id=job.id,
-                path=job.path,
-                direction=job.direction,
-                status="failed",
-                size=job.size,
-                bytes_copied=job.bytes_copied,
-                progress=job.progress,
-                checksum=job.checksum,
-                rate_mbps=0.0,
-            )
-            self.state.update_transfer(failed)
-            if not self._closing:
+            self._fail_job(session_id, job, exc, request_id)
+        finally:
+            share.close()
+            self._end_progress(job.id)
+
+    async def _run_data_plane_job(
+        self,
+        session_id: str,
+        job: TransferJob,
+        source_path: Path,
+        settings: dict,
+        request_id: Optional[str],
+        priority: str = "normal",
+    ) -> None:
+        """``_run_transfer_job`` for a send served by the async data plane."""
+        share = self.bandwidth.register(job.id, priority)
+
+        def on_progress(bytes_copied: int, total_size: int) -> None:
+            self._report_progress(session_id, job, bytes_copied, total_size)
+
+        plan = self._network_plan(source_path, settings)
+        try:
+            attempt = 0
+            while True:
                 try:
-                    self.storage.record_transfer(session_id, failed)
-                except Exception:
-                    pass
-            self.state.add_log(f"Transfer failed: {exc}")
-            self._broadcast_transfer_status(failed)
-            if request_id:
-                self._finalize_request(request_id, "failed")
+                    result = await self._send_over_data_plane(
+                        source_path,
+                        plan["size"],
+                        plan["chunk_size"],
+                        on_progress,
+                        job,
+                        share,
+                        plan["tree_chunk_size"],
+                        plan["hash_algorithm"],
+                        plan["compression"],
+                    )
+                    break
+                except Exception as exc:
+                    attempt += 1
+                    if not self._should_retry(settings, attempt):
+                        raise
+                    self.state.add_log(
+                        f"{source_path.name}: send failed ({exc}); "
+                        f"retry {attempt}/{settings['max_retries']}"
+                    )
+                    await asyncio.sleep(retry_delay(attempt, settings["retry_policy"]))
+            self._log_send_result(source_path, plan["compression"], result)
+            self._complete_job(session_id, job, result, request_id)
+        except Exception as exc:
+            self._fail_job(session_id, job, exc, request_id)
+        finally:
+            share.close()
+            self._end_progress(job.id)
+
+    def _complete_job(
+        self, session_id: str, job: TransferJob, result, request_id: Optional[str]
+    ) -> None:
+        tree = result.chunk_tree
+        finished = TransferJob(
+            id=job.id,
+            path=job.path,
+            direction=job.direction,
+            status="complete",
+            size=job.size,
+            bytes_copied=result.bytes_copied,
+            progress=1.0,
+            checksum=result.checksum,
+            rate_mbps=0.0,
+            chunk_size=tree.chunk_size if tree else 0,
+            chunk_root=tree.root if tree else None,
+            chunk_digests=list(tree.digests) if tree else [],
+            hash_algorithm=result.hash_algorithm,
+        )
+        self.state.update_transfer(finished)
+        if not self._closing:
+            try:
+                self.storage.record_transfer(session_id, finished)
+            except Exception:
+                pass
+        self._broadcast_transfer_status(finished)
+        if request_id:
+            self._finalize_request(request_id, "completed")
+
+    def _fail_job(
+        self, session_id: str, job: TransferJob, exc: Exception, request_id: Optional[str]
+    ) -> None:
+        failed = TransferJob(
+            id=job.id,
+            path=job.path,
+            direction=job.direction,
+            status="failed",
+            size=job.size,
+            bytes_copied=job.bytes_copied,
+            progress=job.progress,
+            checksum=job.checksum,
+            rate_mbps=0.0,
+        )
+        self.state.update_transfer(failed)
+        if not self._closing:
+            try:
+                self.storage.record_transfer(session_id, failed)
+            except Exception:
+                pass
+        self.state.add_log(f"Transfer failed: {exc}")
+        self._broadcast_transfer_status(failed)
+        if request_id:
+            self._finalize_request(request_id, "failed")
+
+    def _report_progress(
+        self, session_id: str, job: TransferJob, bytes_copied: int, total_size: int
+    ) -> None:
+        if bytes_copied < total_size and not self.progress.due(job.id):
+            return
+        progress = bytes_copied / total_size if total_size else 1.0
+        now = time.monotonic()
+        last_bytes, last_time = self._transfer_metrics.get(job.id, (0, now))
+        delta_bytes = bytes_copied - last_bytes
+        delta_time = max(now - last_time, 0.0001)
+        rate_mbps = (delta_bytes / delta_time) / (1024 * 1024)
+        self._transfer_metrics[job.id] = (bytes_copied, now)
+        updated = TransferJob(
+            id=job.id,
+            path=job.path,
+            direction=job.direction,
+            status="transferring",
+            size=total_size,
+            bytes_copied=bytes_copied,
+            progress=progress,
+            checksum=job.checksum,
+            rate_mbps=rate_mbps,
+        )
+        self.state.update_transfer(updated)
+        if not self._closing:
+            try:
+                self.storage.record_transfer(session_id, updated)
+            except Exception:
+                pass
+
+    def _end_progress(self, job_id: str) -> None:
+        self.progress.finish(job_id)
+        self._transfer_metrics.pop(job_id, None)
 
     def _broadcast_session_update(
         self,
@@ -571,19 +824,23 @@ class AppController:
         mode: str,
         approval_required: bool,
         conflict_rule: str,
-    ) -> None:
-        if not self.control_server or not self._control_loop or not self.state.session:
-            return
+        session_id: Optional[str] = None,
+    ) -> Optional[Future]:
+        if not self.control_server or not self._control_loop:
+            return None
+        session_id = session_id or (self.state.session.id if self.state.session else None)
+        if not session_id:
+            return None
         payload = {
-            "session_id": self.state.session.id,
+            "session_id": session_id,
             "status": status,
             "mode": mode,
             "approval_required": approval_required,
             "conflict_rule": conflict_rule,
         }
-        message = encode_message("SESSION_UPDATE", payload)
-        asyncio.run_coroutine_threadsafe(
-            self.control_server.broadcast(message), self._control_loop
+        return asyncio.run_coroutine_threadsafe(
+            self.control_server.send_to(session_id, "SESSION_UPDATE", payload),
+            self._control_loop,
         )
 
     def _broadcast_pairing_accept(self, session) -> None:
@@ -594,9 +851,16 @@ class AppController:
             "device_id": self.local_device.id,
             "session_token": session.token,
         }
-        message = encode_message("PAIRING_ACCEPT", payload)
+        if self.data_server:
+            payload["data_port"] = self.data_server.port
+        if self.control_server.unix_path and self.control_server.is_loopback(session.id):
+            # A peer with the same identity switches to this socket; peers
+            # on other hosts never learn its path.
+            payload["host_identity"] = host_identity()
+            payload["local_control"] = self.control_server.unix_path
         asyncio.run_coroutine_threadsafe(
-            self.control_server.broadcast(message), self._control_loop
+            self.control_server.send_to(session.id, "PAIRING_ACCEPT", payload),
+            self._control_loop,
         )
 
     def _broadcast_transfer_status(self, job: TransferJob) -> None:
@@ -607,10 +871,15 @@ class AppController:
             "status": job.status,
             "progress": job.progress,
             "checksum": job.checksum,
+            "hash_algorithm": job.hash_algorithm,
         }
-        message = encode_message("TRANSFER_STATUS", payload)
+        if job.chunk_root:
+            payload["chunk_size"] = job.chunk_size
+            payload["chunk_root"] = job.chunk_root
+            payload["chunk_digests"] = job.chunk_digests
         asyncio.run_coroutine_threadsafe(
-            self.control_server.broadcast(message), self._control_loop
+            self.control_server.send_to(self.state.session.id, "TRANSFER_STATUS", payload),
+            self._control_loop,
         )
 
     def _broadcast_transfer_offer(
@@ -620,6 +889,14 @@ class AppController:
         size: int,
         host: str,
         port: int,
+        tree_chunk_size: int = 0,
+        hash_algorithm: str = DEFAULT_ALGORITHM,
+        compression: str = NO_COMPRESSION,
+        streams: int = 1,
+        range_size: int = 0,
+        stream_id: Optional[int] = None,
+        encrypted: bool = False,
+        frame_size: int = 0,
     ) -> None:
         if not self.control_server or not self._control_loop or not self.state.session:
             return
@@ -631,36 +908,402 @@ class AppController:
             "host": host,
             "port": port,
             "conflict_rule": self.state.session.policy.conflict_rule,
+            "hash_algorithm": hash_algorithm,
+            "compression": compression,
         }
-        message = encode_message("TRANSFER_OFFER", payload)
+        if tree_chunk_size:
+            payload["chunk_size"] = tree_chunk_size
+        if frame_size:
+            # The receiver refuses frames larger than this.
+            payload["frame_size"] = frame_size
+        if streams > 1:
+            payload["streams"] = streams
+            payload["range_size"] = range_size
+        if stream_id is not None:
+            # The data arrives on the session data connection, not host:port.
+            payload["stream_id"] = stream_id
+        if encrypted:
+            # Connect with TLS and prove the session token.
+            payload["encryption"] = True
         asyncio.run_coroutine_threadsafe(
-            self.control_server.broadcast(message), self._control_loop
+            self.control_server.send_to(self.state.session.id, "TRANSFER_OFFER", payload),
+            self._control_loop,
+        )
+
+    def _broadcast_local_offer(
+        self,
+        job_id: str,
+        source_path: Path,
+        size: int,
+        hash_algorithm: str,
+        checksum: str,
+    ) -> Optional[Future]:
+        """Queue the offer; the future says whether the peer's connection
+        was there to take it."""
+        if not self.control_server or not self._control_loop or not self.state.session:
+            return None
+        payload = {
+            "session_id": self.state.session.id,
+            "job_id": job_id,
+            "filename": source_path.name,
+            "size": size,
+            # Part of every offer; the peer takes this one by path instead.
+            "host": self.local_device.ip or "127.0.0.1",
+            "port": 0,
+            "conflict_rule": self.state.session.policy.conflict_rule,
+            "hash_algorithm": hash_algorithm,
+            "local_path": str(source_path.resolve()),
+            "checksum": checksum,
+            # Nobody can rewrite a read-only source in place, so the peer
+            # may share its inode.
+            "link": not os.access(source_path, os.W_OK),
+        }
+        return asyncio.run_coroutine_threadsafe(
+            self.control_server.send_to(self.state.session.id, "TRANSFER_OFFER", payload),
+            self._control_loop,
         )
 
     def _send_over_network(
         self,
         source_path: Path,
-        chunk_size_mb: int,
-        max_bandwidth: str,
+        settings: dict,
         on_progress,
         job: TransferJob,
+        share: BandwidthShare,
+    ):
+        plan = self._network_plan(source_path, settings)
+        chunk_size = plan["chunk_size"]
+        tree_chunk_size = plan["tree_chunk_size"]
+        hash_algorithm = plan["hash_algorithm"]
+        compression = plan["compression"]
+        size = plan["size"]
+        range_size = plan["range_size"]
+        streams = plan["streams"]
+        if self._peer_local:
+            try:
+                return self._send_locally(source_path, size, on_progress, job, hash_algorithm)
+            except Exception as exc:
+                self._peer_local = False
+                self.state.add_log(
+                    f"{source_path.name}: local handoff failed ({exc}); "
+                    "sending over the network from now on"
+                )
+        # Encrypted sends get TLS connections of their own from FileSender.
+        secure = self._secure_channel() if settings["encryption"] else None
+        # Striped sends need connections of their own; everything else
+        # rides the session's persistent data connection when the peer holds one.
+        attempt = 0
+        while True:
+            link = None
+            if streams == 1 and not secure and self.data_server and self.state.session:
+                link = self.data_server.link(self.state.session.id)
+            try:
+                if link:
+                    result = self._send_over_link(
+                        link,
+                        source_path,
+                        size,
+                        on_progress,
+                        job,
+                        share,
+                        tree_chunk_size,
+                        hash_algorithm,
+                        compression,
+                    )
+                else:
+                    result = self._send_over_new_connection(
+                        source_path,
+                        size,
+                        chunk_size,
+                        on_progress,
+                        job,
+                        share,
+                        tree_chunk_size,
+                        hash_algorithm,
+                        compression,
+                        streams,
+                        range_size,
+                        secure,
+                    )
+                break
+            except Exception as exc:
+                # Each new attempt resumes from what the peer already holds.
+                attempt += 1
+                if not self._should_retry(settings, attempt):
+                    raise
+                self.state.add_log(
+                    f"{source_path.name}: send failed ({exc}); "
+                    f"retry {attempt}/{settings['max_retries']}"
+                )
+                time.sleep(retry_delay(attempt, settings["retry_policy"]))
+        self._log_send_result(source_path, compression, result)
+        return result
+
+    def _network_plan(self, source_path: Path, settings: dict) -> dict:
+        """Parameters for sending ``source_path``, negotiated with the peer."""
+        chunk_size = settings["chunk_size_mb"] * 1024 * 1024
+        size = source_path.stat().st_size if source_path.exists() else 0
+        range_size = settings["range_size_mb"] * 1024 * 1024
+        # Striping only pays off for files spanning several ranges.
+        streams = min(settings["network_streams"], self._peer_data_streams)
+        if size <= range_size:
+            streams = 1
+        return {
+            "chunk_size": chunk_size,
+            "tree_chunk_size": chunk_size if settings["chunk_hashes"] else 0,
+            "hash_algorithm": negotiate(self._peer_hash_algorithms, settings["hash_algorithm"]),
+            "compression": negotiate_codec(
+                self._peer_compression_codecs, settings["compression"]
+            ),
+            "size": size,
+            "range_size": range_size,
+            "streams": streams,
+        }
+
+    def _uses_data_plane(self, plan: dict, settings: dict) -> bool:
+        """True if a send goes to its own connection on the async data plane:
+        a single unencrypted stream to a remote peer without a session link."""
+        if not self.data_plane or not self._control_loop or not self.state.session:
+            return False
+        if plan["streams"] != 1 or settings["encryption"] or self._peer_local:
+            return False
+        return not (self.data_server and self.data_server.link(self.state.session.id))
+
+    def _should_retry(self, settings: dict, attempt: int) -> bool:
+        return not (
+            self._closing
+            or settings["retry_policy"] == "none"
+            or attempt > settings["max_retries"]
+        )
+
+    def _log_send_result(self, source_path: Path, compression: str, result) -> None:
+        if result.resumed_bytes:
+            self.state.add_log(
+                f"{source_path.name}: resumed at {result.resumed_bytes} bytes"
+            )
+        if result.retransmitted_bytes:
+            self.state.add_log(
+                f"{source_path.name}: resent {result.retransmitted_bytes} bytes "
+                "the peer received corrupt"
+            )
+        if compression != NO_COMPRESSION:
+            self.state.add_log(
+                f"{source_path.name}: {compression} ratio "
+                f"{result.compression_ratio:.2f}, "
+                f"{result.compression_seconds:.2f}s CPU"
+            )
+
+    def _send_locally(
+        self,
+        source_path: Path,
+        size: int,
+        on_progress,
+        job: TransferJob,
+        hash_algorithm: str,
+    ) -> TransferResult:
+        """Have the peer on this host take ``source_path`` by its path.
+
+        Nothing is hashed here: the checksum is passed along only if the
+        digest cache already has it.
+        """
+        cached = default_cache().get(source_path.stat(), hash_algorithm)
+        checksum = cached[0] if cached else ""
+        handoff: Future = Future()
+        self._local_handoffs[job.id] = handoff
+        try:
+            # Registered first: a socket that drops from here on fails the
+            # handoff, and one that already dropped has cleared the flag.
+            if not self._peer_local:
+                raise ConnectionError("Peer on this host disconnected")
+            offered = self._broadcast_local_offer(
+                job.id, source_path, size, hash_algorithm, checksum
+            )
+            if not offered or not offered.result(timeout=QUEUE_TIMEOUT):
+                raise ConnectionError("Peer on this host has no control connection")
+            status = handoff.result(timeout=LOCAL_HANDOFF_TIMEOUT)
+        finally:
+            self._local_handoffs.pop(job.id, None)
+        if status.get("status") == "failed":
+            raise ConnectionError("Peer could not take the file by path")
+        strategy = status.get("strategy") or "local"
+        on_progress(size, size)
+        self.state.add_log(f"{source_path.name}: handed to the peer on this host via {strategy}")
+        return TransferResult(
+            bytes_copied=size,
+            checksum=checksum or status.get("checksum") or "",
+            strategy=strategy,
+            hash_algorithm=hash_algorithm,
+        )
+
+    def _handle_session_closed(self, session_id: str) -> None:
+        """The control connection bound to ``session_id`` dropped."""
+        if not self.state.session or self.state.session.id != session_id:
+            return
+        if self._peer_local:
+            self._peer_local = False
+            self.state.add_log("Peer on this host closed its control socket.")
+        self._fail_local_handoffs()
+
+    def _fail_local_handoffs(self) -> None:
+        # Their jobs fall back to sending over the network.
+        for handoff in list(self._local_handoffs.values()):
+            try:
+                handoff.set_exception(ConnectionError("Peer on this host disconnected"))
+            except InvalidStateError:
+                # The peer answered first.
+                pass
+
+    def _send_over_link(
+        self,
+        link: SessionLink,
+        source_path: Path,
+        size: int,
+        on_progress,
+        job: TransferJob,
+        share: BandwidthShare,
+        tree_chunk_size: int,
+        hash_algorithm: str,
+        compression: str,
+    ):
+        stream_id = link.new_stream()
+        self._broadcast_transfer_offer(
+            job.id,
+            source_path.name,
+            size,
+            self.local_device.ip or "127.0.0.1",
+            self.data_server.port,
+            tree_chunk_size,
+            hash_algorithm,
+            compression,
+            stream_id=stream_id,
+        )
+        return link.send_file(
+            stream_id,
+            source_path,
+            meta={
+                "job_id": job.id,
+                "conflict_rule": self.state.session.policy.conflict_rule,
+            },
+            on_progress=on_progress,
+            tree_chunk_size=tree_chunk_size or None,
+            hash_algorithm=hash_algorithm,
+            governor=share,
+            compression=compression,
+        )
+
+    def _send_over_new_connection(
+        self,
+        source_path: Path,
+        size: int,
+        chunk_size: int,
+        on_progress,
+        job: TransferJob,
+        share: BandwidthShare,
+        tree_chunk_size: int,
+        hash_algorithm: str,
+        compression: str,
+        streams: int,
+        range_size: int,
+        secure: Optional[SecureChannel] = None,
     ):
         sender = FileSender(
             host="0.0.0.0",
             port=0,
-            chunk_size=chunk_size_mb * 1024 * 1024,
+            chunk_size=chunk_size,
+            max_streams=streams,
+            secure=secure,
         )
         port = sender.open()
-        host_ip = self.local_device.ip or "127.0.0.1"
-        size = source_path.stat().st_size if source_path.exists() else 0
-        self._broadcast_transfer_offer(job.id, source_path.name, size, host_ip, port)
-        result = sender.send_file(
+        try:
+            host_ip = self.local_device.ip or "127.0.0.1"
+            self._broadcast_transfer_offer(
+                job.id,
+                source_path.name,
+                size,
+                host_ip,
+                port,
+                tree_chunk_size,
+                hash_algorithm,
+                compression,
+                streams,
+                range_size,
+                encrypted=secure is not None,
+                frame_size=chunk_size,
+            )
+            return sender.send_file(
+                source_path,
+                on_progress=on_progress,
+                governor=share,
+                tree_chunk_size=tree_chunk_size or None,
+                hash_algorithm=hash_algorithm,
+                compression=compression,
+                streams=streams,
+                range_size=range_size,
+            )
+        finally:
+            sender.close()
+
+    async def _send_over_data_plane(
+        self,
+        source_path: Path,
+        size: int,
+        chunk_size: int,
+        on_progress,
+        job: TransferJob,
+        share: BandwidthShare,
+        tree_chunk_size: int,
+        hash_algorithm: str,
+        compression: str,
+    ):
+        listener = await self.data_plane.listen()
+        self._broadcast_transfer_offer(
+            job.id,
+            source_path.name,
+            size,
+            self.local_device.ip or "127.0.0.1",
+            listener.port,
+            tree_chunk_size,
+            hash_algorithm,
+            compression,
+            frame_size=chunk_size,
+        )
+        return await self.data_plane.send_file(
+            listener,
             source_path,
             on_progress=on_progress,
-            max_bandwidth=self._parse_bandwidth(max_bandwidth),
+            tree_chunk_size=tree_chunk_size or None,
+            hash_algorithm=hash_algorithm,
+            governor=share,
+            compression=compression,
+            chunk_size=chunk_size,
+        )
+
+    def _secure_channel(self) -> SecureChannel:
+        token = self.state.session.token
+        if token not in self._secure_channels:
+            self._secure_channels[token] = SecureChannel(token)
+        return self._secure_channels[token]
+
+    def _check_peer_chunk_tree(self, job_id: str, payload: dict) -> None:
+        peer_tree = ChunkTree.from_payload(payload)
+        if not peer_tree or payload.get("status") != "complete":
+            return
+        local = next((job for job in self.state.transfers if job.id == job_id), None)
+        if not local or not local.chunk_root:
+            return
+        local_tree = ChunkTree(
+            local.chunk_size,
+            tuple(local.chunk_digests),
+            local.chunk_root,
+            local.hash_algorithm,
+        )
+        if local_tree.root == peer_tree.root:
+            return
+        bad = local_tree.mismatched(peer_tree)
+        self.state.add_log(
+            f"Peer checksum mismatch for {Path(local.path).name}: "
+            f"{len(bad)} bad chunk(s) {bad[:8]}"
         )
-        sender.close()
-        return result
 
     def _find_request(self, request_id: str) -> FileRequest | None:
         for request in self.state.requests:
@@ -759,15 +1402,59 @@ class AppController:
         settings["encryption"] = self.storage.get_preference(
             "transfer.encryption", str(settings["encryption"])
         ) in ("True", "true", "1")
+        settings["parallel_workers"] = int(
+            self.storage.get_preference(
+                "transfer.parallel_workers", str(settings["parallel_workers"])
+            )
+        )
+        settings["range_size_mb"] = int(
+            self.storage.get_preference(
+                "transfer.range_size_mb", str(settings["range_size_mb"])
+            )
+        )
+        settings["network_streams"] = int(
+            self.storage.get_preference(
+                "transfer.network_streams", str(settings["network_streams"])
+            )
+        )
+        settings["chunk_hashes"] = self.storage.get_preference(
+            "transfer.chunk_hashes", str(settings["chunk_hashes"])
+        ) in ("True", "true", "1")
+        settings["hash_algorithm"] = self.storage.get_preference(
+            "transfer.hash_algorithm", settings["hash_algorithm"]
+        )
+        if settings["hash_algorithm"] not in supported_algorithms():
+            settings["hash_algorithm"] = DEFAULT_ALGORITHM
+        settings["burst_mb"] = int(
+            self.storage.get_preference("transfer.burst_mb", str(settings["burst_mb"]))
+        )
+        settings["compression"] = self.storage.get_preference(
+            "transfer.compression", settings["compression"]
+        )
+        if settings["compression"] not in (NO_COMPRESSION, *supported_codecs()):
+            settings["compression"] = NO_COMPRESSION
+        settings["durability"] = self.storage.get_preference(
+            "transfer.durability", settings["durability"]
+        )
+        if settings["durability"] not in DURABILITY_MODES:
+            settings["durability"] = "file"
         return settings
 
     def get_transfer_limit_mbps(self) -> float | None:
-        settings = self.get_transfer_settings()
-        limit_bytes = self._parse_bandwidth(settings["max_bandwidth"])
+        limit_bytes = self.bandwidth.rate
         if not limit_bytes:
             return None
         return limit_bytes / (1024 * 1024)
 
+    def get_bandwidth_utilization(self) -> tuple[float, float | None]:
+        """Return the measured process-wide rate in MB/s and its share of the limit."""
+        return self.bandwidth.measured_rate() / (1024 * 1024), self.bandwidth.utilization()
+
+    def _apply_bandwidth_settings(self, settings: dict) -> None:
+        rate = self._parse_bandwidth(settings["max_bandwidth"])
+        burst = settings["burst_mb"] * 1024 * 1024 if settings["burst_mb"] else None
+        self.bandwidth.set_limit(rate, burst)
+
     def save_transfer_settings(self, settings: dict) -> None:
         self.storage.set_preference(
             "transfer.chunk_size_mb", str(settings["chunk_size_mb"])
@@ -784,9 +1471,43 @@ class AppController:
         self.storage.set_preference(
             "transfer.encryption", str(settings["encryption"])
         )
+        self.storage.set_preference(
+            "transfer.parallel_workers", str(settings["parallel_workers"])
+        )
+        self.storage.set_preference(
+            "transfer.range_size_mb", str(settings["range_size_mb"])
+        )
+        self.storage.set_preference(
+            "transfer.network_streams", str(settings["network_streams"])
+        )
+        self.storage.set_preference(
+            "transfer.chunk_hashes", str(settings["chunk_hashes"])
+        )
+        self.storage.set_preference(
+            "transfer.hash_algorithm", str(settings["hash_algorithm"])
+        )
+        self.storage.set_preference("transfer.burst_mb", str(settings["burst_mb"]))
+        self.storage.set_preference(
+            "transfer.compression", str(settings["compression"])
+        )
+        self.storage.set_preference(
+            "transfer.durability", str(settings["durability"])
+        )
+        self._apply_bandwidth_settings(settings)
         self.state.add_log("Transfer settings updated.")
 
 
+def _peer_stream_count(value) -> int:
+    """The data streams a peer offered, clamped to ``1..MAX_PEER_STREAMS``.
+
+    Peers that predate striping send nothing; anything that is not an
+    integer counts as a single stream.
+    """
+    if isinstance(value, bool) or not isinstance(value, int):
+        return 1
+    return max(1, min(value, MAX_PEER_STREAMS))
+
+
 def _build_local_device() -> Device:
     hostname = socket.gethostname()
     try:
@@ -51,6 +51,10 @@ class TransferJob:
     progress: float = 0.0
     checksum: Optional[str] = None
     rate_mbps: float = 0.0
+    chunk_size: int = 0
+    chunk_root: Optional[str] = None
+    chunk_digests: List[str] = field(default_factory=list)
+    hash_algorithm: str = "sha256"
 
 
 @dataclass(frozen=True)
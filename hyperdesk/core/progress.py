@@ -0,0 +1,42 @@
+from __future__ import annotations
+
+import os
+import threading
+import time
+from typing import Dict
+
+
+# Seconds between progress updates for one job, on the host and the peer.
+PROGRESS_INTERVAL = float(os.getenv("HYPERDESK_PROGRESS_INTERVAL", "0.25"))
+
+# Job statuses that are only progress; anything else is final.
+PROGRESS_STATUSES = frozenset({"transferring", "receiving", "sending"})
+
+
+class ProgressCoalescer:
+    """Let through at most one intermediate progress update per job per
+    ``interval`` seconds; the rest are dropped.
+
+    Final states are never held back: callers skip ``due`` for them and
+    ``finish`` the job instead, which also forgets it.
+    """
+
+    def __init__(self, interval: float = PROGRESS_INTERVAL) -> None:
+        self.interval = interval
+        self._last: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def due(self, job_id: str) -> bool:
+        """True if an update for ``job_id`` may go out now; starts the next
+        interval if so."""
+        now = time.monotonic()
+        with self._lock:
+            last = self._last.get(job_id)
+            if last is not None and now - last < self.interval:
+                return False
+            self._last[job_id] = now
+            return True
+
+    def finish(self, job_id: str) -> None:
+        with self._lock:
+            self._last.pop(job_id, None)
@@ -80,8 +80,9 @@ class Storage:
         self._execute(
             """
             INSERT OR REPLACE INTO transfers
-            (id, session_id, path, direction, status, progress, checksum, updated_at)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            (id, session_id, path, direction, status, progress, checksum,
+             hash_algorithm, chunk_size, chunk_root, chunk_digests, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
             """,
             (
                 job.id,
@@ -91,6 +92,10 @@ class Storage:
                 job.status,
                 job.progress,
                 job.checksum,
+                job.hash_algorithm,
+                job.chunk_size,
+                job.chunk_root,
+                ",".join(job.chunk_digests),
                 _utc_now(),
             ),
         )
@@ -255,6 +260,10 @@ class Storage:
                 status TEXT NOT NULL,
                 progress REAL NOT NULL,
                 checksum TEXT,
+                hash_algorithm TEXT,
+                chunk_size INTEGER,
+                chunk_root TEXT,
+                chunk_digests TEXT,
                 updated_at TEXT NOT NULL
             )
             """
@@ -286,6 +295,15 @@ class Storage:
                 "conflict_rule": "TEXT",
             },
         )
+        self._ensure_columns(
+            "transfers",
+            {
+                "hash_algorithm": "TEXT",
+                "chunk_size": "INTEGER",
+                "chunk_root": "TEXT",
+                "chunk_digests": "TEXT",
+            },
+        )
 
     def _execute(self, statement: str, params: Iterable = ()) -> None:
         with self.conn:
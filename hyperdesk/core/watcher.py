@@ -6,6 +6,8 @@ from typing import Callable, Optional
 from watchdog.events import FileSystemEventHandler
 from watchdog.observers import Observer
 
+from hyperdesk.transfer.finalize import is_transient
+
 
 EventCallback = Callable[[str, Path], None]
 
@@ -40,11 +42,20 @@ class _HyperboxEventHandler(FileSystemEventHandler):
         self.on_event = on_event
 
     def on_created(self, event) -> None:
-        if event.is_directory:
-            return
-        self.on_event("created", Path(event.src_path))
+        self._dispatch("created", event, event.src_path)
 
     def on_modified(self, event) -> None:
+        self._dispatch("modified", event, event.src_path)
+
+    def on_moved(self, event) -> None:
+        # Finished transfers are renamed into place from .incoming_ files,
+        # so the rename is the moment the file appears.
+        self._dispatch("created", event, event.dest_path)
+
+    def _dispatch(self, event_type: str, event, path: str) -> None:
         if event.is_directory:
             return
-        self.on_event("modified", Path(event.src_path))
+        path = Path(path)
+        if is_transient(path.name):
+            return
+        self.on_event(event_type, path)
@@ -1,64 +1,299 @@
 from __future__ import annotations
 
 import asyncio
-from typing import Awaitable, Callable, Optional, Set
+import ipaddress
+import os
+import time
+from contextvars import ContextVar
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple
 
 import websockets
 
-from hyperdesk.network.protocol import decode_message, encode_message
+from hyperdesk.network.protocol import (
+    CODEC_BINARY,
+    CODEC_JSON,
+    RawMessage,
+    decode_any,
+    encode_for,
+    supports_binary,
+)
 
 
 MessageHandler = Callable[[dict], Awaitable[None]]
+SessionClosedHandler = Callable[[str], None]
+
+# Messages queued for one connection before it is dropped as too slow.
+OUTBOX_DEPTH = 256
+# Seconds a queued message may wait, or one send may take, before the
+# connection is dropped as too slow.
+OUTBOX_MAX_LATENCY = 10.0
+
+# The connection whose message ``on_message`` is handling.
+_SENDER: ContextVar = ContextVar("hyperdesk_control_sender")
 
 
 class ControlServer:
-    def __init__(self, host: str, port: int, on_message: MessageHandler) -> None:
+    """Websocket control server on ``host:port``.
+
+    With ``unix_path`` it also listens on that Unix socket, for peers on the
+    same host (see ``hyperdesk.network.local``); ``unix_path`` is reset to
+    None if that fails. Messages from either kind of connection go to
+    ``on_message`` alike; ``from_unix_socket`` tells them apart while one
+    is handled, and ``is_loopback`` tells whether a session's peer is on
+    this host.
+
+    Messages go out through ``send_to``, only to the connection bound to a
+    session: ``bind_session`` ties a session and the peer's device id to
+    the connection that paired. When a bound connection drops,
+    ``on_session_closed`` is called with its session id. Each connection
+    gets JSON until its peer sends a message whose version supports the
+    binary codec, and binary from then on. ``broadcast_message`` goes to
+    every connection, paired or not, encoded once per codec.
+
+    Outgoing messages are queued per connection and sent by a writer task
+    of its own, so sending or broadcasting never waits on a peer. A
+    connection whose queue reaches ``outbox_depth``, or whose oldest message
+    or current send is older than ``max_latency`` seconds, is closed and
+    counted in ``slow_drops``.
+    """
+
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        on_message: MessageHandler,
+        unix_path: Optional[str] = None,
+        outbox_depth: int = OUTBOX_DEPTH,
+        max_latency: float = OUTBOX_MAX_LATENCY,
+        on_session_closed: Optional[SessionClosedHandler] = None,
+    ) -> None:
         self.host = host
         self.port = port
         self.on_message = on_message
+        self.on_session_closed = on_session_closed
+        self.unix_path = unix_path
+        self.outbox_depth = max(1, outbox_depth)
+        self.max_latency = max_latency
+        self.slow_drops = 0
         self._server: Optional[asyncio.AbstractServer] = None
+        self._unix_server: Optional[asyncio.AbstractServer] = None
         self._connections: Set[websockets.WebSocketServerProtocol] = set()
+        # Connections that came in over the Unix socket.
+        self._unix_connections: Set[websockets.WebSocketServerProtocol] = set()
+        self._codecs: Dict[websockets.WebSocketServerProtocol, str] = {}
+        # (time queued, message) waiting for each connection's writer task.
+        self._outboxes: Dict[websockets.WebSocketServerProtocol, asyncio.Queue] = {}
+        self._writers: Dict[websockets.WebSocketServerProtocol, asyncio.Task] = {}
+        # (device id, session id) of each paired connection, and back.
+        self._peers: Dict[websockets.WebSocketServerProtocol, Tuple[str, str]] = {}
+        self._routes: Dict[str, websockets.WebSocketServerProtocol] = {}
 
     async def start(self) -> None:
         self._server = await websockets.serve(self._handler, self.host, self.port)
+        if self.unix_path:
+            try:
+                if os.path.exists(self.unix_path):
+                    os.unlink(self.unix_path)
+                self._unix_server = await websockets.unix_serve(
+                    self._unix_handler, self.unix_path
+                )
+                os.chmod(self.unix_path, 0o600)
+            except OSError:
+                self.unix_path = None
 
     async def stop(self) -> None:
-        if self._server:
-            self._server.close()
-            await self._server.wait_closed()
-            self._server = None
-        self._connections.clear()
-
-    async def broadcast(self, message: str) -> None:
-        if not self._connections:
+        for server in (self._server, self._unix_server):
+            if server:
+                server.close()
+                await server.wait_closed()
+        self._server = None
+        self._unix_server = None
+        if self.unix_path:
+            try:
+                os.unlink(self.unix_path)
+            except OSError:
+                pass
+        for socket in list(self._connections):
+            self._drop(socket)
+
+    @property
+    def connection_count(self) -> int:
+        return len(self._connections)
+
+    @property
+    def session_ids(self) -> List[str]:
+        """Sessions that have a connection to send to."""
+        return list(self._routes)
+
+    def bind_session(self, session_id: str, device_id: str) -> bool:
+        """Route ``session_id`` to the connection whose message is being
+        handled; call it from ``on_message`` once the message is verified.
+
+        A later bind of the session, such as over the Unix socket, replaces
+        the earlier connection. False when no message is being handled.
+        """
+        websocket = _SENDER.get(None)
+        if websocket is None or websocket not in self._connections:
+            return False
+        self._unbind(websocket)
+        previous = self._routes.get(session_id)
+        if previous is not None:
+            self._peers.pop(previous, None)
+        self._peers[websocket] = (device_id, session_id)
+        self._routes[session_id] = websocket
+        return True
+
+    def from_unix_socket(self) -> bool:
+        """True while handling a message that came over the Unix socket."""
+        return _SENDER.get(None) in self._unix_connections
+
+    def is_loopback(self, session_id: str) -> bool:
+        """True if ``session_id``'s connection is on the Unix socket or
+        comes from a loopback address."""
+        websocket = self._routes.get(session_id)
+        if websocket is None:
+            return False
+        if websocket in self._unix_connections:
+            return True
+        address = getattr(websocket, "remote_address", None)
+        try:
+            return ipaddress.ip_address(address[0]).is_loopback
+        except (TypeError, IndexError, ValueError):
+            return False
+
+    def forget_session(self, session_id: str) -> None:
+        """Stop routing to ``session_id``; its connection stays open."""
+        websocket = self._routes.pop(session_id, None)
+        if websocket is not None:
+            self._peers.pop(websocket, None)
+
+    def device_id(self, session_id: str) -> Optional[str]:
+        websocket = self._routes.get(session_id)
+        peer = self._peers.get(websocket) if websocket is not None else None
+        return peer[0] if peer else None
+
+    def queue_lengths(self) -> List[int]:
+        """Messages waiting to be sent, per connection."""
+        return [outbox.qsize() for outbox in list(self._outboxes.values())]
+
+    async def broadcast(self, message: RawMessage) -> None:
+        """Queue an already encoded message for every connection as is."""
+        for socket in list(self._connections):
+            self._enqueue(socket, message)
+
+    async def broadcast_message(self, message_type: str, payload: dict) -> None:
+        """Queue a message for every connection in the codec it negotiated,
+        encoding it at most once per codec."""
+        encoded: Dict[str, RawMessage] = {}
+        for socket in list(self._connections):
+            codec = self._codecs.get(socket, CODEC_JSON)
+            if codec not in encoded:
+                encoded[codec] = encode_for(codec, message_type, payload)
+            self._enqueue(socket, encoded[codec])
+
+    async def send_to(self, session_id: str, message_type: str, payload: dict) -> bool:
+        """Queue a message for the connection bound to ``session_id`` only.
+
+        False if the session has no connection; the message is dropped.
+        """
+        websocket = self._routes.get(session_id)
+        if websocket is None:
+            return False
+        codec = self._codecs.get(websocket, CODEC_JSON)
+        self._enqueue(websocket, encode_for(codec, message_type, payload))
+        return True
+
+    def _enqueue(self, websocket, message: RawMessage) -> None:
+        outbox = self._outboxes.get(websocket)
+        if outbox is None:
             return
-        disconnected = set()
-        for socket in self._connections:
+        try:
+            outbox.put_nowait((time.monotonic(), message))
+        except asyncio.QueueFull:
+            self._drop_slow(websocket)
+
+    async def _write(self, websocket, outbox: asyncio.Queue) -> None:
+        """Send one connection's queued messages in order."""
+        while True:
+            queued_at, message = await outbox.get()
+            if time.monotonic() - queued_at > self.max_latency:
+                self._drop_slow(websocket)
+                return
             try:
-                await socket.send(message)
+                await asyncio.wait_for(websocket.send(message), self.max_latency)
+            except asyncio.TimeoutError:
+                self._drop_slow(websocket)
+                return
             except Exception:
-                disconnected.add(socket)
-        for socket in disconnected:
-            self._connections.discard(socket)
+                self._drop(websocket)
+                return
+
+    def _drop_slow(self, websocket) -> None:
+        if websocket not in self._connections:
+            return
+        self.slow_drops += 1
+        self._drop(websocket)
+        asyncio.ensure_future(websocket.close(1013, "slow consumer"))
+
+    async def _unix_handler(self, websocket) -> None:
+        self._unix_connections.add(websocket)
+        await self._handler(websocket)
 
     async def _handler(self, websocket) -> None:
         self._connections.add(websocket)
+        outbox: asyncio.Queue = asyncio.Queue(self.outbox_depth)
+        self._outboxes[websocket] = outbox
+        self._writers[websocket] = asyncio.create_task(self._write(websocket, outbox))
+        # Each connection is handled in a task of its own, so this is seen
+        # only while handling this connection's messages.
+        _SENDER.set(websocket)
         try:
             async for raw_message in websocket:
-                data = decode_message(raw_message)
+                data = decode_any(raw_message)
+                if supports_binary(data.get("version")):
+                    self._codecs[websocket] = CODEC_BINARY
                 await self.on_message(data)
                 await asyncio.sleep(0)
         finally:
-            self._connections.discard(websocket)
+            self._drop(websocket)
+
+    def _drop(self, websocket) -> None:
+        self._connections.discard(websocket)
+        self._unix_connections.discard(websocket)
+        self._codecs.pop(websocket, None)
+        self._outboxes.pop(websocket, None)
+        self._unbind(websocket)
+        writer = self._writers.pop(websocket, None)
+        if writer is not None and writer is not asyncio.current_task():
+            writer.cancel()
+
+    def _unbind(self, websocket) -> None:
+        peer = self._peers.pop(websocket, None)
+        if peer is not None and self._routes.get(peer[1]) is websocket:
+            del self._routes[peer[1]]
+            if self.on_session_closed and websocket not in self._connections:
+                self.on_session_closed(peer[1])
 
 
 class ControlClient:
-    def __init__(self, uri: str) -> None:
+    """Websocket control client; with ``unix_path`` it connects over that
+    Unix socket instead of TCP.
+
+    Sends JSON until the server sends a message whose version supports the
+    binary codec, and binary from then on.
+    """
+
+    def __init__(self, uri: str, unix_path: Optional[str] = None) -> None:
         self.uri = uri
+        self.unix_path = unix_path
+        self.codec = CODEC_JSON
         self._socket: Optional[websockets.WebSocketClientProtocol] = None
 
     async def connect(self) -> None:
-        self._socket = await websockets.connect(self.uri)
+        if self.unix_path:
+            self._socket = await websockets.unix_connect(self.unix_path, self.uri)
+        else:
+            self._socket = await websockets.connect(self.uri)
 
     async def disconnect(self) -> None:
         if self._socket:
@@ -68,11 +303,14 @@ class ControlClient:
     async def send(self, message_type: str, payload: dict, request_id: Optional[str] = None) -> None:
         if not self._socket:
             raise RuntimeError("ControlClient is not connected.")
-        message = encode_message(message_type, payload, request_id=request_id)
+        message = encode_for(self.codec, message_type, payload, request_id)
         await self._socket.send(message)
 
     async def recv(self) -> dict:
         if not self._socket:
             raise RuntimeError("ControlClient is not connected.")
         raw_message = await self._socket.recv()
-        return decode_message(raw_message)
+        data = decode_any(raw_message)
+        if supports_binary(data.get("version")):
+            self.codec = CODEC_BINARY
+        return data
@@ -0,0 +1,53 @@
+"""Detecting a peer that runs on the same host.
+
+The host puts ``host_identity()`` and the path of its Unix control socket in
+PAIRING_ACCEPT. A peer that computes the same identity connects to that
+socket and sends LOCAL_LINK with the session token; getting through the
+socket is what proves to the host that the peer shares its machine. From
+then on control messages use the socket, and files are handed over by path
+(see ``hyperdesk.transfer.channel.receive_local``) instead of over TCP.
+"""
+from __future__ import annotations
+
+import hashlib
+import os
+import socket
+import tempfile
+from pathlib import Path
+from typing import Optional
+
+
+_MACHINE_ID_PATHS = ("/etc/machine-id", "/var/lib/dbus/machine-id")
+_BOOT_ID_PATH = "/proc/sys/kernel/random/boot_id"
+
+
+def host_identity() -> str:
+    """A token shared by the processes of one user on one booted machine."""
+    parts = [socket.gethostname(), _read_first(_MACHINE_ID_PATHS), _read_first((_BOOT_ID_PATH,))]
+    if hasattr(os, "getuid"):
+        parts.append(str(os.getuid()))
+    return hashlib.sha256("\0".join(parts).encode("utf-8")).hexdigest()
+
+
+def control_socket_path() -> Optional[Path]:
+    """Where this process listens for local control connections.
+
+    None where Unix sockets are unavailable. The directory is private to
+    the user, so only their processes can reach the socket.
+    """
+    if not hasattr(socket, "AF_UNIX"):
+        return None
+    base = os.environ.get("XDG_RUNTIME_DIR") or tempfile.gettempdir()
+    directory = Path(base) / f"hyperdesk-{os.getuid()}"
+    directory.mkdir(mode=0o700, exist_ok=True)
+    return directory / f"control-{os.getpid()}.sock"
+
+
+def _read_first(paths) -> str:
+    for path in paths:
+        try:
+            with open(path, "r", encoding="ascii") as handle:
+                return handle.read().strip()
+        except OSError:
+            continue
+    return ""
@@ -1,17 +1,42 @@
+"""Control-channel messages.
+
+Every message is a type, an optional request id, a timestamp and a payload
+dict checked against ``MESSAGE_SCHEMAS``. Two codecs carry them: JSON text
+(``encode_message``) and, from protocol version 0.2, a binary one
+(``encode_binary``) with a struct-packed header, a type id and per-type
+field layouts compiled once at import. Each side of a connection starts
+with JSON and switches to binary once the other has sent a message with a
+version that supports it (``supports_binary``); websocket text frames are
+JSON and binary frames the binary codec, so ``decode_any`` takes either.
+
+Payload fields outside a type's layout, or of another type than it
+expects, travel as a JSON blob after the packed fields, so any payload
+JSON can carry survives the binary codec too. Binary messages carry the
+timestamp as seconds since the epoch rather than an ISO string.
+"""
 from __future__ import annotations
 
 import json
+import operator
+import struct
+import time
 from datetime import datetime, timezone
-from typing import Any, Dict, Iterable, Optional
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple, Union
 
 
-PROTOCOL_VERSION = "0.1"
+PROTOCOL_VERSION = "0.2"
+# First protocol version that understands the binary codec.
+BINARY_SINCE = (0, 2)
+
+CODEC_JSON = "json"
+CODEC_BINARY = "binary"
 
 MESSAGE_SCHEMAS: Dict[str, Iterable[str]] = {
     "DISCOVERY_PING": ("device_id", "name", "capabilities"),
     "DISCOVERY_OFFER": ("device_id", "name", "ip", "capabilities"),
     "PAIRING_REQUEST": ("device_id", "pair_code"),
     "PAIRING_ACCEPT": ("session_id", "device_id", "session_token"),
+    "LOCAL_LINK": ("session_id", "session_token", "host_identity"),
     "SESSION_UPDATE": (
         "session_id",
         "status",
@@ -25,10 +50,197 @@ MESSAGE_SCHEMAS: Dict[str, Iterable[str]] = {
 }
 
 
+# Wire ids of the message types in the binary codec; never reuse one.
+MESSAGE_TYPE_IDS: Dict[str, int] = {
+    "DISCOVERY_PING": 1,
+    "DISCOVERY_OFFER": 2,
+    "PAIRING_REQUEST": 3,
+    "PAIRING_ACCEPT": 4,
+    "SESSION_UPDATE": 5,
+    "TRANSFER_REQUEST": 6,
+    "TRANSFER_STATUS": 7,
+    "TRANSFER_OFFER": 8,
+    "LOCAL_LINK": 9,
+}
+
+# Fields the binary codec packs per type, with their struct codes: "s" for
+# UTF-8 strings, "q" int, "d" float, "?" bool. At most 32 per type.
+BINARY_LAYOUTS: Dict[str, Tuple[Tuple[str, str], ...]] = {
+    "DISCOVERY_PING": (("device_id", "s"), ("name", "s")),
+    "DISCOVERY_OFFER": (("device_id", "s"), ("name", "s"), ("ip", "s")),
+    "PAIRING_REQUEST": (
+        ("device_id", "s"),
+        ("pair_code", "s"),
+        ("device_name", "s"),
+        ("device_ip", "s"),
+        ("data_streams", "q"),
+    ),
+    "PAIRING_ACCEPT": (
+        ("session_id", "s"),
+        ("device_id", "s"),
+        ("session_token", "s"),
+        ("data_port", "q"),
+        ("host_identity", "s"),
+        ("local_control", "s"),
+    ),
+    "SESSION_UPDATE": (
+        ("session_id", "s"),
+        ("status", "s"),
+        ("mode", "s"),
+        ("approval_required", "?"),
+        ("conflict_rule", "s"),
+    ),
+    "TRANSFER_REQUEST": (
+        ("session_id", "s"),
+        ("path", "s"),
+        ("direction", "s"),
+        ("size", "q"),
+        ("requester", "s"),
+    ),
+    "TRANSFER_STATUS": (
+        ("job_id", "s"),
+        ("status", "s"),
+        ("progress", "d"),
+        ("checksum", "s"),
+        ("path", "s"),
+        ("direction", "s"),
+        ("bytes_copied", "q"),
+        ("size", "q"),
+        ("rate_mbps", "d"),
+        ("hash_algorithm", "s"),
+        ("strategy", "s"),
+        ("chunk_size", "q"),
+        ("chunk_root", "s"),
+    ),
+    "TRANSFER_OFFER": (
+        ("session_id", "s"),
+        ("job_id", "s"),
+        ("filename", "s"),
+        ("size", "q"),
+        ("host", "s"),
+        ("port", "q"),
+        ("conflict_rule", "s"),
+        ("hash_algorithm", "s"),
+        ("compression", "s"),
+        ("chunk_size", "q"),
+        ("streams", "q"),
+        ("range_size", "q"),
+        ("stream_id", "q"),
+        ("encryption", "?"),
+        ("local_path", "s"),
+        ("checksum", "s"),
+        ("link", "?"),
+    ),
+    "LOCAL_LINK": (("session_id", "s"), ("session_token", "s"), ("host_identity", "s")),
+}
+
+# Every binary message starts with the format byte, type id, flags, field
+# bitmap and timestamp; the rest of its fixed part depends on the type.
+_BINARY_HEADER = "!BBBId"
+_BINARY_FORMAT = 1
+_FLAG_EXTRAS = 0x01
+_EXACT_TYPES = {"s": str, "q": int, "d": float, "?": bool}
+# Range of a "q" field; other ints travel in the JSON extras.
+_INT64_MIN = -(1 << 63)
+_INT64_MAX = (1 << 63) - 1
+# Field bitmaps remembered per message type.
+_PICK_CACHE_SIZE = 64
+
+RawMessage = Union[str, bytes]
+
+
 class ProtocolError(ValueError):
     pass
 
 
+class _Layout:
+    """One message type's packed fields, compiled once into a struct.
+
+    The struct covers the common header, then the numeric fields, then the
+    byte lengths of the string fields and of the request id; the strings,
+    the request id and any JSON extras follow it in that order. Bit ``i``
+    of the header bitmap says whether field ``i`` is present.
+    """
+
+    def __init__(self, type_id: int, fields: Tuple[Tuple[str, str], ...]) -> None:
+        if len(fields) > 32:
+            raise ValueError("At most 32 packed fields per message type")
+        self.type_id = type_id
+        numeric = [(name, code) for name, code in fields if code != "s"]
+        strings = [name for name, code in fields if code == "s"]
+        self.numeric = tuple(name for name, _code in numeric)
+        self.strings = tuple(strings)
+        self.names = self.numeric + self.strings
+        self.bits = tuple(1 << index for index in range(len(fields)))
+        self.struct = struct.Struct(
+            _BINARY_HEADER
+            + "".join(code for _name, code in numeric)
+            + "I" * (len(strings) + 1)
+        )
+        # name -> (exact type, index into the packed values, bit)
+        self.slots: Dict[str, Tuple[type, int, int]] = {
+            name: (_EXACT_TYPES[code], index, 1 << index)
+            for index, (name, code) in enumerate(numeric + [(name, "s") for name in strings])
+        }
+        self.defaults = tuple(
+            {"q": 0, "d": 0.0, "?": False}[code] for _name, code in numeric
+        ) + (b"",) * len(strings)
+        self._picks: Dict[int, Tuple[Tuple[str, ...], Callable]] = {}
+
+    def pick(self, present: int) -> Tuple[Tuple[str, ...], Callable]:
+        """Names of the fields in bitmap ``present`` and a getter for their
+        values; one sender tends to repeat a few bitmaps, so they are cached."""
+        picked = self._picks.get(present)
+        if picked is None:
+            indexes = [i for i, bit in enumerate(self.bits) if present & bit]
+            names = tuple(self.names[i] for i in indexes)
+            if len(indexes) == 1:
+                index = indexes[0]
+                getter = lambda values: (values[index],)  # noqa: E731
+            else:
+                getter = operator.itemgetter(*indexes) if indexes else lambda values: ()
+            picked = (names, getter)
+            if len(self._picks) < _PICK_CACHE_SIZE:
+                self._picks[present] = picked
+        return picked
+
+
+_LAYOUTS: Dict[str, _Layout] = {
+    name: _Layout(MESSAGE_TYPE_IDS[name], BINARY_LAYOUTS[name]) for name in MESSAGE_SCHEMAS
+}
+_TYPES_BY_ID: Dict[int, str] = {type_id: name for name, type_id in MESSAGE_TYPE_IDS.items()}
+_HEADER_SIZE = struct.calcsize(_BINARY_HEADER)
+_REQUIRED: Dict[str, frozenset] = {
+    name: frozenset(fields) for name, fields in MESSAGE_SCHEMAS.items()
+}
+
+
+def supports_binary(version: Any) -> bool:
+    """True if a peer speaking ``version`` understands the binary codec."""
+    try:
+        return tuple(int(part) for part in str(version).split(".")) >= BINARY_SINCE
+    except ValueError:
+        return False
+
+
+def encode_for(
+    codec: str,
+    message_type: str,
+    payload: Dict[str, Any],
+    request_id: Optional[str] = None,
+) -> RawMessage:
+    if codec == CODEC_BINARY:
+        return encode_binary(message_type, payload, request_id)
+    return encode_message(message_type, payload, request_id)
+
+
+def decode_any(raw_message: RawMessage) -> Dict[str, Any]:
+    """Decode a binary (bytes) or JSON (str) message."""
+    if isinstance(raw_message, (bytes, bytearray, memoryview)):
+        return decode_binary(raw_message)
+    return decode_message(raw_message)
+
+
 def encode_message(
     message_type: str,
     payload: Dict[str, Any],
@@ -67,10 +279,103 @@ def decode_message(raw_message: str) -> Dict[str, Any]:
     return data
 
 
-def _validate_payload(message_type: str, payload: Dict[str, Any]) -> None:
-    required = MESSAGE_SCHEMAS.get(message_type, ())
-    missing = [key for key in required if key not in payload]
-    if missing:
-        raise ProtocolError(
-            f"Payload missing fields for {message_type}: {', '.join(missing)}"
+def encode_binary(
+    message_type: str,
+    payload: Dict[str, Any],
+    request_id: Optional[str] = None,
+) -> bytes:
+    layout = _LAYOUTS.get(message_type)
+    if layout is None:
+        raise ProtocolError(f"Unknown message type: {message_type}")
+    _validate_payload(message_type, payload)
+    values = list(layout.defaults)
+    present = 0
+    extras = None
+    slots = layout.slots
+    try:
+        for key, value in payload.items():
+            slot = slots.get(key)
+            if (
+                slot is None
+                or type(value) is not slot[0]
+                or (slot[0] is int and not _INT64_MIN <= value <= _INT64_MAX)
+            ):
+                if extras is None:
+                    extras = {}
+                extras[key] = value
+                continue
+            kind, index, bit = slot
+            present |= bit
+            values[index] = value.encode("utf-8") if kind is str else value
+        texts = values[len(layout.numeric) :]
+        texts.append(request_id.encode("utf-8") if request_id is not None else b"")
+        if extras is not None:
+            texts.append(json.dumps(extras).encode("utf-8"))
+        fixed = layout.struct.pack(
+            _BINARY_FORMAT,
+            layout.type_id,
+            _FLAG_EXTRAS if extras is not None else 0,
+            present,
+            time.time(),
+            *values[: len(layout.numeric)],
+            *map(len, texts[: len(layout.strings) + 1]),
         )
+    except (struct.error, TypeError, ValueError) as exc:
+        raise ProtocolError(f"Cannot encode {message_type}: {exc}") from exc
+    return fixed + b"".join(texts)
+
+
+def decode_binary(raw_message) -> Dict[str, Any]:
+    data = bytes(raw_message)
+    try:
+        if len(data) < _HEADER_SIZE or data[0] != _BINARY_FORMAT:
+            raise ProtocolError("Unknown binary message format")
+        message_type = _TYPES_BY_ID.get(data[1])
+        if message_type is None:
+            raise ProtocolError(f"Unknown message type id: {data[1]}")
+        layout = _LAYOUTS[message_type]
+        fixed = layout.struct.unpack_from(data)
+        flags, present, timestamp = fixed[2:5]
+        numeric_end = 5 + len(layout.numeric)
+        values = list(fixed[5:numeric_end])
+        position = layout.struct.size
+        for length in fixed[numeric_end:-1]:
+            end = position + length
+            values.append(data[position:end].decode("utf-8"))
+            position = end
+        request_id = None
+        if fixed[-1]:
+            end = position + fixed[-1]
+            request_id = data[position:end].decode("utf-8")
+            position = end
+        names, getter = layout.pick(present)
+        payload: Dict[str, Any] = dict(zip(names, getter(values)))
+        if flags & _FLAG_EXTRAS:
+            extras = json.loads(data[position:])
+            if not isinstance(extras, dict):
+                raise ProtocolError("Payload must be an object")
+            payload.update(extras)
+        elif position != len(data):
+            raise ProtocolError("Trailing bytes after binary message")
+    except ProtocolError:
+        raise
+    except (struct.error, UnicodeDecodeError, ValueError) as exc:
+        raise ProtocolError("Malformed binary message") from exc
+    _validate_payload(message_type, payload)
+    return {
+        "version": PROTOCOL_VERSION,
+        "type": message_type,
+        "request_id": request_id,
+        "timestamp": timestamp,
+        "payload": payload,
+    }
+
+
+def _validate_payload(message_type: str, payload: Dict[str, Any]) -> None:
+    required = _REQUIRED.get(message_type)
+    if required is None or required.issubset(payload.keys()):
+        return
+    missing = [key for key in MESSAGE_SCHEMAS[message_type] if key not in payload]
+    raise ProtocolError(
+        f"Payload missing fields for {message_type}: {', '.join(missing)}"
+    )
@@ -2,13 +2,28 @@ from __future__ import annotations
 
 import argparse
 import asyncio
+import os
 import socket
+import threading
 import time
 import uuid
 from pathlib import Path
 
+from websockets.exceptions import ConnectionClosed
+
+from hyperdesk.core.progress import PROGRESS_INTERVAL
 from hyperdesk.network.control import ControlClient
-from hyperdesk.transfer.channel import receive_file
+from hyperdesk.network.local import host_identity
+from hyperdesk.transfer.channel import SessionReceiver, receive_file, receive_local
+from hyperdesk.transfer.compression import NO_COMPRESSION, supported_codecs
+from hyperdesk.transfer.digests import DEFAULT_ALGORITHM, supported_algorithms
+from hyperdesk.transfer.finalize import DURABILITY_MODES
+from hyperdesk.transfer.secure import SecureChannel
+
+
+MAX_DATA_STREAMS = 8
+# Seconds to wait for the host to confirm a LOCAL_LINK before staying on TCP.
+LOCAL_LINK_TIMEOUT = 5.0
 
 
 async def run_peer(
@@ -17,6 +32,8 @@ async def run_peer(
     pair_code: str,
     request_path: str | None,
     inbox_dir: Path,
+    durability: str = "file",
+    progress_interval: float = PROGRESS_INTERVAL,
 ) -> None:
     client = ControlClient(f"ws://{host}:{port}")
     await client.connect()
@@ -32,13 +49,106 @@ async def run_peer(
             "device_name": device_name,
             "device_ip": device_ip,
             "capabilities": ["hyperbox", "requests"],
+            "hash_algorithms": supported_algorithms(),
+            "compression_codecs": supported_codecs(),
+            # Striped receives write ranges with pwrite.
+            "data_streams": MAX_DATA_STREAMS if hasattr(os, "pwrite") else 1,
         },
     )
 
     session_id = None
     session_token = None
+    # Kept across files so encrypted connections resume the TLS session.
+    secure: SecureChannel | None = None
+    data_link: SessionReceiver | None = None
+    loop = asyncio.get_running_loop()
+    reporters: dict[str, _ProgressReporter] = {}
+    receiving: set[asyncio.Task] = set()
     print(f"[peer] Pairing request sent from {device_name}.")
 
+    # Called from the session receiver's threads.
+    def on_stream_progress(meta: dict, bytes_received: int, total_size: int) -> None:
+        job_id = meta.get("job_id")
+        if not job_id:
+            return
+        reporter = reporters.get(job_id)
+        if reporter is None:
+            reporter = _ProgressReporter(
+                client, loop, job_id, meta.get("name", ""), progress_interval
+            )
+            reporters[job_id] = reporter
+        reporter(bytes_received, total_size)
+
+    def on_stream_complete(meta: dict, result, error) -> None:
+        job_id = meta.get("job_id")
+        filename = meta.get("name", "")
+        reporter = reporters.pop(job_id, None)
+        if reporter is not None:
+            reporter.close()
+        if error:
+            print(f"[peer] Receive failed: {filename}: {error}")
+            status = _failed_status(job_id, filename)
+        else:
+            _print_result(result)
+            status = _final_status(job_id, filename, result)
+        if job_id:
+            asyncio.run_coroutine_threadsafe(
+                client.send("TRANSFER_STATUS", status), loop
+            )
+
+    async def receive_offer(payload: dict) -> None:
+        offer_host = payload.get("host", host)
+        offer_port = int(payload.get("port", port))
+        filename = payload.get("filename", "file.bin")
+        job_id = payload.get("job_id")
+        conflict_rule = payload.get("conflict_rule", "keep_both")
+        tree_chunk_size = int(payload.get("chunk_size") or 0) or None
+        hash_algorithm = payload.get("hash_algorithm") or DEFAULT_ALGORITHM
+        compression = payload.get("compression") or NO_COMPRESSION
+        streams = int(payload.get("streams") or 1)
+        range_size = int(payload.get("range_size") or 0)
+        frame_size = int(payload.get("frame_size") or 0)
+        encrypted = bool(payload.get("encryption"))
+        if encrypted and not secure:
+            print(f"[peer] Cannot receive {filename}: encrypted offer before pairing")
+            return
+        print(f"[peer] Receiving file: {filename} from {offer_host}:{offer_port}")
+        on_progress = (
+            _ProgressReporter(client, loop, job_id, filename, progress_interval)
+            if job_id
+            else None
+        )
+        try:
+            result = await asyncio.to_thread(
+                receive_file,
+                offer_host,
+                offer_port,
+                inbox_dir,
+                on_progress,
+                conflict_rule,
+                tree_chunk_size,
+                hash_algorithm,
+                compression,
+                durability,
+                streams,
+                range_size,
+                secure=secure if encrypted else None,
+                frame_size=frame_size,
+            )
+        except OSError as exc:
+            # The partial file is kept; the host's retry resumes it.
+            print(f"[peer] Receive failed: {filename}: {exc}")
+            if on_progress:
+                on_progress.close()
+            if job_id:
+                await client.send("TRANSFER_STATUS", _failed_status(job_id, filename))
+            return
+        if on_progress:
+            on_progress.close()
+        if job_id:
+            await client.send("TRANSFER_STATUS", _final_status(job_id, filename, result))
+        _print_result(result)
+
     while True:
         message = await client.recv()
         message_type = message.get("type")
@@ -47,7 +157,30 @@ async def run_peer(
         if message_type == "PAIRING_ACCEPT":
             session_id = payload.get("session_id")
             session_token = payload.get("session_token")
+            secure = SecureChannel(session_token) if session_token else None
             print(f"[peer] Session active: {session_id} token={session_token[:8]}...")
+            local_control = payload.get("local_control")
+            if local_control and payload.get("host_identity") == host_identity():
+                client = await _switch_to_local(
+                    client, local_control, session_id, session_token
+                )
+            data_port = payload.get("data_port")
+            if data_port and not (data_link and data_link.connected):
+                data_link = SessionReceiver(
+                    host,
+                    int(data_port),
+                    {"session_id": session_id, "session_token": session_token},
+                    inbox_dir,
+                    durability,
+                    on_stream_progress,
+                    on_stream_complete,
+                )
+                try:
+                    await asyncio.to_thread(data_link.connect)
+                    print(f"[peer] Session data connection open to {host}:{data_port}")
+                except OSError as exc:
+                    print(f"[peer] Session data connection failed: {exc}")
+                    data_link = None
             if request_path:
                 await client.send(
                     "TRANSFER_REQUEST",
@@ -64,79 +197,229 @@ async def run_peer(
             status = payload.get("status")
             print(f"[peer] Session status: {status}")
         elif message_type == "TRANSFER_OFFER":
-            offer_host = payload.get("host", host)
-            offer_port = int(payload.get("port", port))
             filename = payload.get("filename", "file.bin")
-            job_id = payload.get("job_id")
-            conflict_rule = payload.get("conflict_rule", "keep_both")
-            print(f"[peer] Receiving file: {filename} from {offer_host}:{offer_port}")
-
-            loop = asyncio.get_running_loop()
-            last_bytes = 0
-            last_time = time.monotonic()
-
-            def on_progress(bytes_received: int, total_size: int) -> None:
-                nonlocal last_bytes, last_time
-                now = time.monotonic()
-                delta_bytes = bytes_received - last_bytes
-                delta_time = max(now - last_time, 0.0001)
-                rate_mbps = (delta_bytes / delta_time) / (1024 * 1024)
-                last_bytes = bytes_received
-                last_time = now
-                if job_id:
-                    asyncio.run_coroutine_threadsafe(
-                        client.send(
-                            "TRANSFER_STATUS",
-                            {
-                                "job_id": job_id,
-                                "path": filename,
-                                "status": "receiving",
-                                "progress": bytes_received / total_size if total_size else 1.0,
-                                "checksum": "",
-                                "bytes_copied": bytes_received,
-                                "size": total_size,
-                                "direction": "download",
-                                "rate_mbps": rate_mbps,
-                            },
-                        ),
-                        loop,
-                    )
-
-            result = await asyncio.to_thread(
-                receive_file,
-                offer_host,
-                offer_port,
-                inbox_dir,
-                on_progress,
-                conflict_rule,
-            )
-            if result.skipped:
-                status = "skipped"
-                checksum = ""
-            else:
-                status = "complete"
-                checksum = result.checksum
-            if job_id:
-                await client.send(
-                    "TRANSFER_STATUS",
-                    {
-                        "job_id": job_id,
-                        "path": filename,
-                        "status": status,
-                        "progress": 1.0,
-                        "checksum": checksum,
-                        "bytes_copied": result.bytes_received,
-                        "size": result.bytes_received,
-                        "direction": "download",
-                        "rate_mbps": 0.0,
-                    },
-                )
-            print(f"[peer] File saved to: {result.path}")
+            if "stream_id" in payload:
+                # Arrives on the session data connection.
+                print(f"[peer] Receiving file: {filename} on stream {payload['stream_id']}")
+                continue
+            if "local_path" in payload:
+                _spawn(receiving, _take_local(client, payload, inbox_dir, durability))
+                continue
+            # Each offer is received in a task of its own, so one large
+            # transfer does not keep the next sender waiting to be accepted.
+            _spawn(receiving, receive_offer(payload))
         elif message_type == "TRANSFER_STATUS":
             progress = payload.get("progress", 0.0)
             print(f"[peer] Transfer progress: {progress:.0%}")
 
 
+def _spawn(tasks: set, coroutine) -> None:
+    """Run ``coroutine`` as a task held in ``tasks`` until it finishes."""
+    task = asyncio.ensure_future(coroutine)
+    tasks.add(task)
+    task.add_done_callback(tasks.discard)
+
+
+async def _switch_to_local(
+    client: ControlClient, path: str, session_id: str, session_token: str
+) -> ControlClient:
+    """Move control traffic to the host's Unix socket; keep ``client`` if
+    that fails.
+
+    The host routes the session to the socket before it answers with a
+    LOCAL_LINK of its own, so TCP is only dropped once that answer is in.
+    """
+    local = ControlClient("ws://localhost", unix_path=path)
+    try:
+        await local.connect()
+        await local.send(
+            "LOCAL_LINK",
+            {
+                "session_id": session_id,
+                "session_token": session_token,
+                "host_identity": host_identity(),
+            },
+        )
+        await asyncio.wait_for(_local_link_confirmed(local, session_id), LOCAL_LINK_TIMEOUT)
+    except (OSError, ConnectionClosed, asyncio.TimeoutError) as exc:
+        print(f"[peer] Host is local but did not take the control socket: {exc!r}")
+        await local.disconnect()
+        return client
+    await client.disconnect()
+    print(f"[peer] Host is on this machine: control over {path}")
+    return local
+
+
+async def _local_link_confirmed(local: ControlClient, session_id: str) -> None:
+    while True:
+        message = await local.recv()
+        payload = message.get("payload", {})
+        if message.get("type") == "LOCAL_LINK" and payload.get("session_id") == session_id:
+            return
+
+
+async def _take_local(
+    client: ControlClient, payload: dict, inbox_dir: Path, durability: str
+) -> None:
+    """Take a file the host on this machine offered by path."""
+    job_id = payload.get("job_id")
+    filename = payload.get("filename", "file.bin")
+    try:
+        result = await asyncio.to_thread(
+            receive_local,
+            Path(payload["local_path"]),
+            inbox_dir,
+            payload.get("conflict_rule", "keep_both"),
+            payload.get("checksum") or "",
+            payload.get("hash_algorithm") or DEFAULT_ALGORITHM,
+            durability,
+            bool(payload.get("link")),
+        )
+    except OSError as exc:
+        # The host falls back to sending it over the network.
+        print(f"[peer] Local handoff failed: {filename}: {exc}")
+        if job_id:
+            await client.send("TRANSFER_STATUS", _failed_status(job_id, filename))
+        return
+    print(f"[peer] Took {filename} from the host via {result.strategy}")
+    if job_id:
+        await client.send("TRANSFER_STATUS", _final_status(job_id, filename, result))
+    _print_result(result)
+
+
+class _ProgressReporter:
+    """Report receive progress for one job as TRANSFER_STATUS messages.
+
+    Called for every chunk, but sends at most one update per ``interval``
+    and never more than one at a time: while a send is still waiting on the
+    connection, newer numbers replace the unsent ones. The last update of a
+    file always goes out, unless ``close`` came first because a final
+    status is about to replace it.
+    """
+
+    def __init__(
+        self,
+        client: ControlClient,
+        loop,
+        job_id: str,
+        filename: str,
+        interval: float = PROGRESS_INTERVAL,
+    ) -> None:
+        self.client = client
+        self.loop = loop
+        self.job_id = job_id
+        self.filename = filename
+        self.interval = interval
+        self.last_bytes = 0
+        self.last_time = time.monotonic()
+        self._lock = threading.Lock()
+        self._pending: tuple[int, int] | None = None
+        self._in_flight = False
+        self._closed = False
+
+    def __call__(self, bytes_received: int, total_size: int) -> None:
+        with self._lock:
+            if self._closed:
+                return
+            self._pending = (bytes_received, total_size)
+            status = self._take_if_ready()
+        if status is not None:
+            self._send(status)
+
+    def close(self) -> None:
+        """Drop whatever is unsent and send nothing more."""
+        with self._lock:
+            self._closed = True
+            self._pending = None
+
+    def _take_if_ready(self) -> dict | None:
+        # Caller holds the lock.
+        if self._pending is None or self._in_flight:
+            return None
+        bytes_received, total_size = self._pending
+        now = time.monotonic()
+        if bytes_received < total_size and now - self.last_time < self.interval:
+            return None
+        self._pending = None
+        self._in_flight = True
+        delta_time = max(now - self.last_time, 0.0001)
+        rate_mbps = ((bytes_received - self.last_bytes) / delta_time) / (1024 * 1024)
+        self.last_bytes = bytes_received
+        self.last_time = now
+        return {
+            "job_id": self.job_id,
+            "path": self.filename,
+            "status": "receiving",
+            "progress": bytes_received / total_size if total_size else 1.0,
+            "checksum": "",
+            "bytes_copied": bytes_received,
+            "size": total_size,
+            "direction": "download",
+            "rate_mbps": rate_mbps,
+        }
+
+    def _send(self, status: dict) -> None:
+        future = asyncio.run_coroutine_threadsafe(
+            self.client.send("TRANSFER_STATUS", status), self.loop
+        )
+        future.add_done_callback(self._sent)
+
+    def _sent(self, future) -> None:
+        if not future.cancelled() and future.exception() is not None:
+            print(f"[peer] Progress update failed: {future.exception()}")
+        with self._lock:
+            self._in_flight = False
+            status = None if self._closed else self._take_if_ready()
+        if status is not None:
+            self._send(status)
+
+
+def _final_status(job_id: str, filename: str, result) -> dict:
+    if result.skipped:
+        status = "skipped"
+        checksum = ""
+    else:
+        status = "complete"
+        checksum = result.checksum
+    final_status = {
+        "job_id": job_id,
+        "path": filename,
+        "status": status,
+        "progress": 1.0,
+        "checksum": checksum,
+        "bytes_copied": result.bytes_received,
+        "size": result.bytes_received,
+        "direction": "download",
+        "rate_mbps": 0.0,
+        "hash_algorithm": result.hash_algorithm,
+        "strategy": result.strategy,
+    }
+    if result.chunk_tree and not result.skipped:
+        final_status.update(result.chunk_tree.to_payload())
+    return final_status
+
+
+def _failed_status(job_id: str, filename: str) -> dict:
+    return {
+        "job_id": job_id,
+        "path": filename,
+        "status": "failed",
+        "progress": 0.0,
+        "checksum": "",
+        "direction": "download",
+    }
+
+
+def _print_result(result) -> None:
+    if result.compression != NO_COMPRESSION and not result.skipped:
+        ratio = result.wire_bytes / result.bytes_received if result.bytes_received else 1.0
+        print(
+            f"[peer] {result.compression}: ratio {ratio:.2f}, "
+            f"{result.compression_seconds:.2f}s CPU"
+        )
+    print(f"[peer] File saved to: {result.path}")
+
+
 def _get_local_ip() -> str:
     hostname = socket.gethostname()
     try:
@@ -152,6 +435,13 @@ def main() -> None:
     parser.add_argument("--pair-code", required=True)
     parser.add_argument("--request", dest="request_path")
     parser.add_argument("--inbox", dest="inbox_dir", default="peer_inbox")
+    parser.add_argument("--durability", choices=DURABILITY_MODES, default="file")
+    parser.add_argument(
+        "--progress-interval",
+        type=float,
+        default=PROGRESS_INTERVAL,
+        help="Seconds between progress updates sent to the host",
+    )
     args = parser.parse_args()
     asyncio.run(
         run_peer(
@@ -160,6 +450,8 @@ def main() -> None:
             args.pair_code,
             args.request_path,
             Path(args.inbox_dir),
+            args.durability,
+            args.progress_interval,
         )
     )
 
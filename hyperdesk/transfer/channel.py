@@ -1,30 +1,153 @@
 from __future__ import annotations
 
-import hashlib
+import asyncio
+import functools
+import itertools
 import os
+import queue
+import select
 import socket
-import struct
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Optional
+from typing import Callable, Dict, List, Optional
 
 from dataclasses import dataclass
 
-from hyperdesk.transfer.engine import TransferResult
+from hyperdesk.transfer.checkpoint import (
+    Checkpoint,
+    clear_checkpoint,
+    load_checkpoint,
+    save_checkpoint,
+)
+from hyperdesk.transfer.chunktree import ChunkTree, ChunkTreeBuilder
+from hyperdesk.transfer.compression import (
+    NO_COMPRESSION,
+    AdaptiveCompressor,
+    FrameDecompressor,
+)
+from hyperdesk.transfer.digestcache import CachedDigest, default_cache, same_version
+from hyperdesk.transfer.digests import (
+    DEFAULT_ALGORITHM,
+    export_state,
+    new_hasher,
+    restore_hasher,
+)
+from hyperdesk.transfer.diskio import (
+    DROP_INTERVAL,
+    advise_sequential,
+    drop_cache,
+    ensure_free_space,
+    pread_into,
+    preallocate,
+)
+from hyperdesk.transfer.engine import CHECKPOINT_INTERVAL, TransferResult
+from hyperdesk.transfer.finalize import INCOMING_PREFIX, finalize, incoming_path
+from hyperdesk.transfer.secure import SecureChannel, is_secure
+from hyperdesk.transfer.sparse import hash_hole, is_sparse, next_extent
+from hyperdesk.transfer.strategies import StrategyUnsupported, available_strategies
+from hyperdesk.transfer.striping import StripeScheduler
+from hyperdesk.transfer.throttle import BandwidthGovernor, Throttle
+from hyperdesk.transfer.wire import (
+    FRAME_ABORT,
+    FRAME_COMPRESSED,
+    FRAME_DATA,
+    FRAME_END,
+    FRAME_HELLO,
+    FRAME_HOLE,
+    FRAME_OPEN,
+    FRAME_RESUME,
+    FRAME_RETRANSMIT,
+    CONTROL_PAYLOAD_LIMIT,
+    FRAME_HEADER_SIZE,
+    HEADER_RESUME,
+    HEADER_SPARSE,
+    MAX_FRAME_LENGTH,
+    OFFSET_SIZE,
+    FrameReader,
+    check_payload_length,
+    frame_header,
+    pack_header,
+    pack_json,
+    parse_frame_header,
+    payload_crc,
+    payload_limit,
+    read_frame,
+    read_header,
+    read_mux_frame,
+    read_offset,
+    send_file_frame,
+    send_frame,
+    send_mux_file_frame,
+    send_mux_frame,
+    send_offset,
+    unpack_json,
+    unpack_offset,
+)
+
+
+# Seconds a new session data connection gets to authenticate.
+HELLO_TIMEOUT = 10.0
+# Smaller files restart from zero instead of paying a round trip to resume.
+RESUME_MIN_SIZE = 8 * 1024 * 1024
+# Seconds a session stream waits for the receiver's resume offset.
+RESUME_TIMEOUT = 30.0
+# Seconds a sender waits for its receiver to connect.
+ACCEPT_TIMEOUT = 60.0
+# Seconds an async transfer waits on a receiver that stopped reading.
+IDLE_TIMEOUT = 60.0
+# Bytes per kernel copy call when taking a file from a sender on this host.
+LOCAL_COPY_RANGE = 64 * 1024 * 1024
+# Seconds a sender waits for the receiver to accept or reject the stream
+# after the END frame.
+VERDICT_TIMEOUT = 60.0
+# A frame that arrives corrupt this many times in a row, or a stream with
+# more corrupt frames than BAD_FRAME_LIMIT, is not worth finishing.
+RETRANSMIT_LIMIT = 3
+BAD_FRAME_LIMIT = 16
+# Largest piece a frame held back behind a gap is read back from the file in.
+READBACK_SIZE = 1024 * 1024
+
+# Hash states of interrupted sequential receives, keyed by temp path, so a
+# retry in this process does not have to rehash the partial file.
+_resume_states: Dict[str, tuple] = {}
+_resume_lock = threading.Lock()
 
 
 class FileSender:
-    def __init__(self, host: str = "0.0.0.0", port: int = 0, chunk_size: int = 1024 * 1024) -> None:
+    """Serve one file over connections of its own, from the calling thread.
+
+    Accepting gives up with ``TimeoutError`` after ``accept_timeout``
+    seconds, so a receiver that never connects does not hold the thread
+    and port forever. With ``secure``, every connection is TLS and the
+    receiver has to prove it holds the session token.
+    """
+
+    def __init__(
+        self,
+        host: str = "0.0.0.0",
+        port: int = 0,
+        chunk_size: int = 1024 * 1024,
+        max_streams: int = 1,
+        accept_timeout: Optional[float] = ACCEPT_TIMEOUT,
+        secure: Optional[SecureChannel] = None,
+    ) -> None:
         self.host = host
         self.port = port
         self.chunk_size = chunk_size
+        self.max_streams = max(1, max_streams)
+        self.accept_timeout = accept_timeout
+        self.secure = secure
         self._server: Optional[socket.socket] = None
 
     def open(self) -> int:
         server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
         server.bind((self.host, self.port))
-        server.listen(1)
+        server.listen(self.max_streams)
+        # Accepted connections stay blocking; only accept() times out.
+        server.settimeout(self.accept_timeout)
         self.port = server.getsockname()[1]
         self._server = server
         return self.port
@@ -34,34 +157,229 @@ class FileSender:
         source_path: Path,
         on_progress=None,
         max_bandwidth: Optional[int] = None,
+        tree_chunk_size: Optional[int] = None,
+        hash_algorithm: str = DEFAULT_ALGORITHM,
+        governor: Optional[Throttle] = None,
+        compression: str = NO_COMPRESSION,
+        streams: int = 1,
+        range_size: int = 0,
     ) -> TransferResult:
+        """Serve ``source_path`` to one receiver.
+
+        With ``streams`` > 1 the receiver opens that many connections and
+        the file is striped across them in ``range_size`` ranges (see
+        ``StripeScheduler``); the checksum is then the root of a chunk tree
+        with one leaf per range.
+        """
         if not self._server:
             raise RuntimeError("FileSender not opened.")
+        if governor is None and max_bandwidth:
+            governor = BandwidthGovernor(max_bandwidth)
+        if streams > 1 and range_size:
+            return self._send_striped(
+                source_path,
+                on_progress,
+                hash_algorithm,
+                governor,
+                compression,
+                streams,
+                range_size,
+            )
 
-        hasher = hashlib.sha256()
-        total_size = source_path.stat().st_size
-        start_time = time.monotonic()
-        bytes_sent = 0
+        compressor = _new_compressor(compression)
+        source_stat = source_path.stat()
+        hasher, cached = _digest_for(source_stat, tree_chunk_size, hash_algorithm)
+        total_size = source_stat.st_size
+        sparse = is_sparse(source_stat)
+        resumable = total_size >= RESUME_MIN_SIZE
+        buffer = memoryview(bytearray(self.chunk_size))
+        stats = _StreamStats()
 
-        conn, _addr = self._server.accept()
-        with conn, open(source_path, "rb") as handle:
-            name_bytes = source_path.name.encode("utf-8")
-            header = struct.pack("!I", len(name_bytes)) + name_bytes
-            header += struct.pack("!Q", total_size)
-            conn.sendall(header)
+        def on_bytes(count: int) -> None:
+            if on_progress:
+                on_progress(stats.logical, total_size)
 
-            while True:
-                chunk = handle.read(self.chunk_size)
-                if not chunk:
-                    break
-                conn.sendall(chunk)
-                hasher.update(chunk)
-                bytes_sent += len(chunk)
+        conn = _accept(self._server, self.secure)
+        with conn, open(source_path, "rb", buffering=0) as handle:
+            flags = (HEADER_SPARSE if sparse else 0) | (HEADER_RESUME if resumable else 0)
+            conn.sendall(
+                pack_header(source_path.name, total_size, flags, source_stat.st_mtime_ns)
+            )
+            offset = 0
+            if resumable:
+                offset = _check_resume_offset(read_offset(conn), total_size, tree_chunk_size)
+            advise_sequential(handle.fileno())
+            _hash_source(handle, hasher, 0, offset, sparse, buffer)
+            stats.logical = offset
+            send = functools.partial(send_frame, conn)
+            replies = _ConnReplies(conn)
+            resend = functools.partial(
+                _resend_frame, send, handle, buffer, total_size, governor, stats
+            )
+            _send_extent(
+                send, handle, offset, total_size, sparse, hasher, compressor, buffer,
+                governor, stats, on_bytes, _window_sender(conn),
+                functools.partial(_answer_replies, replies, resend),
+            )
+            checksum, tree = _finish_digest(
+                hasher, cached, source_path, source_stat, hash_algorithm
+            )
+            _send_trailer(send, total_size, checksum, replies, resend)
+
+        return _send_result(
+            checksum, tree, compressor, stats, hash_algorithm, compression,
+            resumed_bytes=offset,
+        )
+
+    def _send_striped(
+        self,
+        source_path: Path,
+        on_progress,
+        hash_algorithm: str,
+        governor: Optional[Throttle],
+        compression: str,
+        streams: int,
+        range_size: int,
+    ) -> TransferResult:
+        """Stripe ``source_path`` over ``streams`` connections.
+
+        The first connection always negotiates a resume offset, a whole
+        number of ranges; the ranges below it are only hashed locally. It
+        is also the one that ends with the chunk tree root, once every
+        range is sent; the others end with an empty trailer.
+        """
+        source_stat = source_path.stat()
+        total_size = source_stat.st_size
+        sparse = is_sparse(source_stat)
+        flags = HEADER_SPARSE if sparse else 0
+        header = pack_header(source_path.name, total_size, flags, source_stat.st_mtime_ns)
+        range_count = max(1, (total_size + range_size - 1) // range_size)
+        cached = default_cache().get(source_stat, hash_algorithm, range_size)
+        digests: dict[int, str] = dict(enumerate(cached[1].digests)) if cached else {}
+        progress_lock = threading.Lock()
+        state = {"sent": 0}
+
+        def on_bytes(count: int) -> None:
+            scheduler.record(count)
+            with progress_lock:
+                state["sent"] += count
                 if on_progress:
-                    on_progress(bytes_sent, total_size)
-                _apply_rate_limit(bytes_sent, start_time, max_bandwidth)
+                    on_progress(state["sent"], total_size)
+
+        def hash_prefix(first: int) -> None:
+            if cached:
+                return
+            buffer = memoryview(bytearray(self.chunk_size))
+            with open(source_path, "rb", buffering=0) as handle:
+                for index in range(first):
+                    start = index * range_size
+                    end = min(start + range_size, total_size)
+                    hasher = new_hasher(hash_algorithm)
+                    _hash_source(handle, hasher, start, end, sparse, buffer)
+                    digests[index] = hasher.hexdigest()
 
-        return TransferResult(bytes_copied=bytes_sent, checksum=hasher.hexdigest())
+        def serve(worker: int, conn: socket.socket, greeting: Optional[bytes]):
+            compressor = _new_compressor(compression)
+            buffer = memoryview(bytearray(self.chunk_size))
+            stats = _StreamStats()
+            send = functools.partial(send_frame, conn)
+            replies = _ConnReplies(conn)
+            with open(source_path, "rb", buffering=0) as handle:
+                resend = functools.partial(
+                    _resend_frame, send, handle, buffer, total_size, governor, stats
+                )
+                try:
+                    if greeting:
+                        conn.sendall(greeting)
+                    while True:
+                        index = scheduler.next_range(worker)
+                        if index is None:
+                            break
+                        start = index * range_size
+                        end = min(start + range_size, total_size)
+                        hasher = None if cached else new_hasher(hash_algorithm)
+                        advise_sequential(handle.fileno(), start, end - start)
+                        _send_extent(
+                            send, handle, start, end, sparse, hasher, compressor,
+                            buffer, governor, stats, on_bytes,
+                            _window_sender(conn),
+                            functools.partial(_answer_replies, replies, resend),
+                        )
+                        drop_cache(handle.fileno(), start, end - start)
+                        if hasher:
+                            digests[index] = hasher.hexdigest()
+                    if worker:
+                        _send_trailer(send, total_size, "", replies, resend)
+                except BaseException:
+                    # Parked workers would otherwise wait for ranges forever.
+                    scheduler.cancel()
+                    raise
+            return stats, compressor
+
+        first_conn = _accept(self._server, self.secure)
+        try:
+            first_conn.sendall(
+                pack_header(
+                    source_path.name,
+                    total_size,
+                    flags | HEADER_RESUME,
+                    source_stat.st_mtime_ns,
+                )
+            )
+            offset = _check_resume_offset(read_offset(first_conn), total_size, range_size)
+        except BaseException:
+            first_conn.close()
+            raise
+        first = -(-offset // range_size)
+        state["sent"] = offset
+        scheduler = StripeScheduler(range_count, streams, first=first)
+        conns = [first_conn]
+        try:
+            with ThreadPoolExecutor(max_workers=streams + 1) as pool:
+                prefix = pool.submit(hash_prefix, first)
+                # Serve each connection as soon as it is accepted: the
+                # receiver reads the first header before opening the others.
+                futures = [pool.submit(serve, 0, first_conn, None)]
+                for worker in range(1, streams):
+                    conns.append(_accept(self._server, self.secure))
+                    futures.append(pool.submit(serve, worker, conns[-1], header))
+                results = [future.result() for future in futures]
+                prefix.result()
+
+            if cached:
+                tree = cached[1]
+            else:
+                tree = ChunkTree.from_digests(
+                    range_size, [digests[i] for i in range(range_count)], hash_algorithm
+                )
+                if same_version(source_stat, source_path.stat()):
+                    default_cache().put(
+                        source_stat, hash_algorithm, range_size, tree.root, tree
+                    )
+            stats, _compressor = results[0]
+            with open(source_path, "rb", buffering=0) as handle:
+                send = functools.partial(send_frame, first_conn)
+                resend = functools.partial(
+                    _resend_frame, send, handle, memoryview(bytearray(self.chunk_size)),
+                    total_size, governor, stats,
+                )
+                _send_trailer(send, total_size, tree.root, _ConnReplies(first_conn), resend)
+        finally:
+            for conn in conns:
+                conn.close()
+        return TransferResult(
+            bytes_copied=total_size,
+            checksum=tree.root,
+            strategy="striped",
+            chunk_tree=tree,
+            hash_algorithm=hash_algorithm,
+            compression=compression,
+            wire_bytes=sum(stats.wire for stats, _c in results),
+            compression_seconds=sum(c.cpu_seconds for _s, c in results if c),
+            hole_bytes=sum(stats.holes for stats, _c in results),
+            resumed_bytes=offset,
+            retransmitted_bytes=sum(stats.retransmitted for stats, _c in results),
+        )
 
     def close(self) -> None:
         if self._server:
@@ -75,6 +393,13 @@ class ReceiveResult:
     bytes_received: int
     checksum: str
     skipped: bool
+    chunk_tree: Optional[ChunkTree] = None
+    hash_algorithm: str = DEFAULT_ALGORITHM
+    compression: str = NO_COMPRESSION
+    wire_bytes: int = 0
+    compression_seconds: float = 0.0
+    # How the data arrived: "network", or the local handoff that was used.
+    strategy: str = "network"
 
 
 def receive_file(
@@ -83,59 +408,1795 @@ def receive_file(
     dest_dir: Path,
     on_progress=None,
     conflict_rule: str = "keep_both",
+    tree_chunk_size: Optional[int] = None,
+    hash_algorithm: str = DEFAULT_ALGORITHM,
+    compression: str = NO_COMPRESSION,
+    durability: str = "file",
+    streams: int = 1,
+    range_size: int = 0,
+    splice: bool = False,
+    secure: Optional[SecureChannel] = None,
+    frame_size: int = 0,
+) -> ReceiveResult:
+    """Receive one file into ``dest_dir``.
+
+    Data is written to ``.incoming_<name>`` and renamed into place once the
+    END frame arrives, so the hyperbox never sees a partial file. With
+    ``streams`` > 1, that many connections are opened and frames are
+    written at their offsets as they arrive on any of them.
+
+    Progress is checkpointed next to the partial file; when the sender
+    asks, the verified prefix from an interrupted attempt is reported back
+    and only the rest is transferred.
+
+    With ``splice`` (Linux), uncompressed payloads are spliced from the
+    socket into the file and hashed from the page cache afterwards.
+
+    With ``secure``, every connection is TLS and the sender has to prove
+    it holds the session token; splicing does not apply then.
+
+    ``frame_size`` is the sender's chunk size from its offer; larger
+    payloads fail the transfer before anything is allocated for them.
+
+    Frames whose payload fails its CRC are asked for again while the rest
+    keep arriving; after too many, the sender is told to abort. The file
+    is only accepted if its checksum matches the one in the END frame;
+    otherwise the partial file is dropped and ``ConnectionError`` raised.
+    """
+    dest_dir.mkdir(parents=True, exist_ok=True)
+    striped = streams > 1 and range_size > 0
+    max_payload = payload_limit(frame_size)
+    conns = [_connect(host, port, secure)]
+    try:
+        filename, size, flags, mtime_ns = read_header(conns[0])
+        incoming = _IncomingFile(dest_dir, filename, size, flags, mtime_ns)
+        try:
+            if striped:
+                offset, digests = incoming.resume_ranges(range_size, hash_algorithm)
+            else:
+                digest = _SequentialDigest(
+                    incoming, tree_chunk_size, hash_algorithm, on_progress
+                )
+                offset = digest.offset
+            if flags & HEADER_RESUME:
+                send_offset(conns[0], offset)
+            for _ in range(streams - 1 if striped else 0):
+                conn = _connect(host, port, secure)
+                conns.append(conn)
+                read_header(conn)
+            if striped:
+                tree, received, trailer = _receive_striped(
+                    conns, incoming, range_size, hash_algorithm, compression,
+                    on_progress, offset, digests, splice, max_payload,
+                )
+                checksum = tree.root
+            else:
+                try:
+                    writer = _read_frames(
+                        conns[0], incoming.fd, compression, digest, splice, max_payload
+                    )
+                except BaseException:
+                    digest.checkpoint()
+                    raise
+                received, trailer = writer.finish(), writer.trailer
+                received.logical += offset
+                tree, checksum = digest.result()
+            _confirm(conns[0], incoming, trailer, checksum)
+        finally:
+            incoming.close()
+    finally:
+        for conn in conns:
+            conn.close()
+
+    return incoming.publish(
+        durability, conflict_rule, received, checksum, tree, hash_algorithm, compression
+    )
+
+
+def receive_local(
+    source_path: Path,
+    dest_dir: Path,
+    conflict_rule: str = "keep_both",
+    checksum: str = "",
+    hash_algorithm: str = DEFAULT_ALGORITHM,
+    durability: str = "file",
+    link: bool = False,
 ) -> ReceiveResult:
+    """Take a file from a sender on this host straight from its path.
+
+    Nothing crosses a socket and nothing is hashed; ``checksum`` is the
+    sender's, passed through. With ``link`` (the sender will not modify
+    the source in place) a hardlink is tried first; otherwise the fastest
+    copy that works for the pair: reflink, then ``copy_file_range`` or
+    ``sendfile``, then a buffered copy. ``result.strategy`` names the one
+    taken.
+    """
     dest_dir.mkdir(parents=True, exist_ok=True)
-    with socket.create_connection((host, port)) as conn:
-        header = _recv_exact(conn, 4)
-        (name_len,) = struct.unpack("!I", header)
-        name_bytes = _recv_exact(conn, name_len)
-        (size,) = struct.unpack("!Q", _recv_exact(conn, 8))
-        filename = name_bytes.decode("utf-8")
-        dest_path = _resolve_conflict_dest(dest_dir / filename, conflict_rule)
-        discard = False
+    dest_path = _resolve_conflict_dest(dest_dir / source_path.name, conflict_rule)
+    if dest_path is None:
+        return ReceiveResult(dest_dir / source_path.name, 0, "", True, strategy="skipped")
+    temp_path = Path(incoming_path(str(dest_path)))
+    temp_path.unlink(missing_ok=True)
+    strategy = ""
+    if link:
+        try:
+            os.link(source_path, temp_path)
+            strategy = "hardlink"
+        except OSError:
+            pass
+    if not strategy:
+        try:
+            strategy = _clone_file(source_path, temp_path)
+        except BaseException:
+            temp_path.unlink(missing_ok=True)
+            raise
+    size = temp_path.stat().st_size
+    # A hardlink's data is the sender's and already on disk.
+    finalize(str(temp_path), str(dest_path), "none" if strategy == "hardlink" else durability)
+    return ReceiveResult(
+        dest_path, size, checksum, False, hash_algorithm=hash_algorithm, strategy=strategy
+    )
+
+
+class TransferListener:
+    """The port one async transfer waits on for its receiver."""
+
+    def __init__(self, server: asyncio.AbstractServer, accepted: asyncio.Future) -> None:
+        self.port = server.sockets[0].getsockname()[1]
+        self.accepted = accepted
+        self._server = server
+
+    def close(self) -> None:
+        self._server.close()
+        if not self.accepted.done():
+            self.accepted.cancel()
+
+
+class AsyncFileServer:
+    """Serve network transfers as coroutines on one asyncio event loop.
+
+    Each transfer listens on a port of its own, so receivers speak the same
+    protocol as with ``FileSender``, but no thread waits on it: the accept
+    and every write are awaited, the read, hash and compression of each
+    chunk run on a small shared executor, and uncompressed data goes out
+    with ``loop.sendfile``. Writes wait for the transport to drain, so a
+    slow receiver slows its own transfer without buffering the file in
+    memory. Bandwidth tokens are awaited on the loop, so capped transfers
+    never hold an executor worker while they wait. A receiver that does
+    not connect within ``accept_timeout``, or stops reading for
+    ``idle_timeout`` seconds, fails the transfer with ``TimeoutError`` and
+    frees its port.
+    """
+
+    def __init__(
+        self,
+        host: str = "0.0.0.0",
+        chunk_size: int = 1024 * 1024,
+        accept_timeout: float = ACCEPT_TIMEOUT,
+        idle_timeout: float = IDLE_TIMEOUT,
+        workers: int = 4,
+    ) -> None:
+        self.host = host
+        self.chunk_size = chunk_size
+        self.accept_timeout = accept_timeout
+        self.idle_timeout = idle_timeout
+        self._executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="hyperdesk-data"
+        )
+
+    async def listen(self) -> TransferListener:
+        """Open the port for one transfer; pass it to ``send_file``."""
+        accepted = asyncio.get_running_loop().create_future()
+
+        def on_connect(reader, writer) -> None:
+            if accepted.done():
+                writer.close()
+            else:
+                accepted.set_result((reader, writer))
+
+        server = await asyncio.start_server(on_connect, self.host, 0)
+        return TransferListener(server, accepted)
+
+    async def send_file(
+        self,
+        listener: TransferListener,
+        source_path: Path,
+        on_progress=None,
+        tree_chunk_size: Optional[int] = None,
+        hash_algorithm: str = DEFAULT_ALGORITHM,
+        governor: Optional[Throttle] = None,
+        compression: str = NO_COMPRESSION,
+        chunk_size: Optional[int] = None,
+    ) -> TransferResult:
+        """Serve ``source_path`` to the first receiver on ``listener``."""
+        try:
+            reader, writer = await asyncio.wait_for(
+                asyncio.shield(listener.accepted), self.accept_timeout
+            )
+        except asyncio.TimeoutError:
+            raise TimeoutError(
+                f"No receiver connected within {self.accept_timeout:g}s"
+            ) from None
+        finally:
+            listener.close()
+        try:
+            return await self._serve(
+                reader,
+                writer,
+                source_path,
+                on_progress,
+                tree_chunk_size,
+                hash_algorithm,
+                governor,
+                compression,
+                chunk_size or self.chunk_size,
+            )
+        finally:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except (OSError, ConnectionError):
+                pass
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=False)
+
+    async def _serve(
+        self,
+        reader: asyncio.StreamReader,
+        writer: asyncio.StreamWriter,
+        source_path: Path,
+        on_progress,
+        tree_chunk_size: Optional[int],
+        hash_algorithm: str,
+        governor: Optional[Throttle],
+        compression: str,
+        chunk_size: int,
+    ) -> TransferResult:
+        loop = asyncio.get_running_loop()
+        compressor = _new_compressor(compression)
+        source_stat = source_path.stat()
+        hasher, cached = _digest_for(source_stat, tree_chunk_size, hash_algorithm)
+        total_size = source_stat.st_size
+        sparse = is_sparse(source_stat)
+        resumable = total_size >= RESUME_MIN_SIZE
+        buffer = memoryview(bytearray(chunk_size))
+        stats = _StreamStats()
+
+        def on_bytes(count: int) -> None:
+            if on_progress:
+                on_progress(stats.logical, total_size)
+
+        def run(function, *args):
+            return loop.run_in_executor(self._executor, function, *args)
+
+        async def within_idle_timeout(awaitable):
+            try:
+                return await asyncio.wait_for(awaitable, self.idle_timeout)
+            except asyncio.TimeoutError:
+                raise TimeoutError(
+                    f"Receiver idle for {self.idle_timeout:g}s"
+                ) from None
+
+        async def send(kind: int, position: int, raw_len: int, payload, crc: int) -> None:
+            writer.write(frame_header(kind, position, raw_len, len(payload), crc))
+            if len(payload):
+                # The transport may keep what it cannot send yet, and the
+                # buffer is reused for the next chunk.
+                writer.write(bytes(payload))
+            await within_idle_timeout(writer.drain())
+
+        async def read_replies() -> None:
+            try:
+                while True:
+                    header = await reader.readexactly(FRAME_HEADER_SIZE)
+                    kind, position, raw_len, wire_len, _crc = parse_frame_header(header)
+                    check_payload_length(wire_len, CONTROL_PAYLOAD_LIMIT)
+                    if wire_len:
+                        await reader.readexactly(wire_len)
+                    replies.put_nowait((kind, position, raw_len))
+            except (asyncio.IncompleteReadError, OSError):
+                replies.put_nowait(None)
+
+        async def answer(reply) -> bool:
+            """Act on one reply; True once the receiver accepted the stream."""
+            if reply is None or reply[0] != FRAME_RETRANSMIT:
+                return _accepted(reply)
+            _kind, position, raw_len = reply
+            payload, crc = await run(_reread, handle, buffer, total_size, position, raw_len)
+            await send(FRAME_DATA, position, raw_len, payload, crc)
+            stats.wire += raw_len
+            stats.retransmitted += raw_len
+            if governor:
+                await governor.acquire_async(raw_len)
+            return False
+
+        replies: asyncio.Queue = asyncio.Queue()
+        replies_task = None
+        try:
+            with open(source_path, "rb", buffering=0) as handle:
+                flags = (HEADER_SPARSE if sparse else 0) | (HEADER_RESUME if resumable else 0)
+                writer.write(
+                    pack_header(source_path.name, total_size, flags, source_stat.st_mtime_ns)
+                )
+                await within_idle_timeout(writer.drain())
+                offset = 0
+                if resumable:
+                    try:
+                        data = await within_idle_timeout(reader.readexactly(OFFSET_SIZE))
+                    except asyncio.IncompleteReadError:
+                        raise ConnectionError("Unexpected end of stream") from None
+                    offset = _check_resume_offset(
+                        unpack_offset(data), total_size, tree_chunk_size
+                    )
+                replies_task = asyncio.ensure_future(read_replies())
+                await run(advise_sequential, handle.fileno())
+                await run(_hash_source, handle, hasher, 0, offset, sparse, buffer)
+                stats.logical = offset
+                # Metered here rather than by the generator, which runs on
+                # the executor.
+                frames = _extent_frames(
+                    handle, offset, total_size, sparse, hasher, compressor, buffer,
+                    None, stats, on_bytes, windowed=True,
+                )
+                while True:
+                    frame = await run(next, frames, None)
+                    if frame is None:
+                        break
+                    kind, position, raw_len, payload, crc = frame
+                    if payload is None:
+                        writer.write(frame_header(FRAME_DATA, position, raw_len, raw_len, crc))
+                        sent = await within_idle_timeout(
+                            loop.sendfile(writer.transport, handle, position, raw_len)
+                        )
+                        if sent != raw_len:
+                            raise IOError("Source file shrank during send")
+                    else:
+                        await send(kind, position, raw_len, payload, crc)
+                    if governor and kind != FRAME_HOLE:
+                        await governor.acquire_async(
+                            raw_len if payload is None else len(payload)
+                        )
+                    while not replies.empty():
+                        await answer(replies.get_nowait())
+
+                checksum, tree = await run(
+                    _finish_digest, hasher, cached, source_path, source_stat, hash_algorithm
+                )
+                trailer = checksum.encode("ascii")
+                await send(FRAME_END, total_size, 0, trailer, payload_crc(trailer))
+                while True:
+                    try:
+                        reply = await asyncio.wait_for(replies.get(), VERDICT_TIMEOUT)
+                    except asyncio.TimeoutError:
+                        raise TimeoutError("Receiver did not confirm the transfer") from None
+                    if await answer(reply):
+                        break
+        finally:
+            if replies_task:
+                replies_task.cancel()
+
+        return _send_result(
+            checksum, tree, compressor, stats, hash_algorithm, compression,
+            resumed_bytes=offset,
+        )
+
+
+class SessionDataServer:
+    """Accept the data connection a paired peer keeps open for its session.
+
+    The peer connects once and authenticates with a HELLO frame carrying
+    its session id and token; ``authenticate`` returns the session id to
+    accept it or None to refuse. From then on every file sent to that
+    peer is one more stream on the same connection, so starting a
+    transfer costs no accept, connect or port.
+    """
+
+    def __init__(
+        self,
+        authenticate: Callable[[dict], Optional[str]],
+        host: str = "0.0.0.0",
+        port: int = 0,
+        chunk_size: int = 1024 * 1024,
+    ) -> None:
+        self.authenticate = authenticate
+        self.host = host
+        self.port = port
+        self.chunk_size = chunk_size
+        self._server: Optional[socket.socket] = None
+        self._links: Dict[str, SessionLink] = {}
+        self._lock = threading.Lock()
+
+    def open(self) -> int:
+        server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        server.bind((self.host, self.port))
+        server.listen()
+        self.port = server.getsockname()[1]
+        self._server = server
+        threading.Thread(target=self._accept_loop, args=(server,), daemon=True).start()
+        return self.port
+
+    def link(self, session_id: str) -> Optional[SessionLink]:
+        with self._lock:
+            link = self._links.get(session_id)
+        if link and link.closed:
+            return None
+        return link
+
+    def drop(self, session_id: str) -> None:
+        with self._lock:
+            link = self._links.pop(session_id, None)
+        if link:
+            link.close()
+
+    def close(self) -> None:
+        if self._server:
+            self._server.close()
+            self._server = None
+        with self._lock:
+            links, self._links = list(self._links.values()), {}
+        for link in links:
+            link.close()
+
+    def _accept_loop(self, server: socket.socket) -> None:
+        while True:
+            try:
+                conn, _addr = server.accept()
+            except OSError:
+                return
+            threading.Thread(target=self._greet, args=(conn,), daemon=True).start()
+
+    def _greet(self, conn: socket.socket) -> None:
+        conn.settimeout(HELLO_TIMEOUT)
+        try:
+            stream_id, kind, _offset, _raw_len, payload = read_mux_frame(conn)
+            if stream_id != 0 or kind != FRAME_HELLO:
+                raise ConnectionError("Expected HELLO")
+            session_id = self.authenticate(unpack_json(payload))
+        except (OSError, ConnectionError):
+            session_id = None
+        if not session_id:
+            conn.close()
+            return
+        conn.settimeout(None)
+        conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        link = SessionLink(conn, self.chunk_size)
+        with self._lock:
+            previous = self._links.get(session_id)
+            self._links[session_id] = link
+        if previous:
+            previous.close()
+
+
+class SessionLink:
+    """Host end of a session data connection.
+
+    Any number of ``send_file`` calls may run at once from different
+    threads; each is its own stream and their frames interleave on the
+    connection. Frames are at most ``chunk_size`` bytes so one large file
+    cannot hold the link for long. The receiver answers on the same
+    connection with RESUME offsets, RETRANSMIT for frames that arrived
+    corrupt, ABORT for a stream it cannot take and END for one it accepted.
+    """
+
+    def __init__(self, conn: socket.socket, chunk_size: int = 1024 * 1024) -> None:
+        self.chunk_size = chunk_size
+        self.closed = False
+        self._conn = conn
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._replies: Dict[int, _StreamReply] = {}
+        threading.Thread(target=self._read_replies, daemon=True).start()
+
+    def new_stream(self) -> int:
+        with self._lock:
+            return next(self._ids)
+
+    def send_file(
+        self,
+        stream_id: int,
+        source_path: Path,
+        meta: Optional[dict] = None,
+        on_progress=None,
+        tree_chunk_size: Optional[int] = None,
+        hash_algorithm: str = DEFAULT_ALGORITHM,
+        governor: Optional[Throttle] = None,
+        compression: str = NO_COMPRESSION,
+    ) -> TransferResult:
+        """Send ``source_path`` as stream ``stream_id``.
+
+        ``meta`` is passed through to the receiver in the OPEN frame
+        alongside the file name, size and the hashing and compression
+        parameters, so the stream is self-describing. Files of at least
+        ``RESUME_MIN_SIZE`` wait for the receiver's resume offset first.
+        """
+        source_stat = source_path.stat()
+        total_size = source_stat.st_size
+        sparse = is_sparse(source_stat)
+        resumable = total_size >= RESUME_MIN_SIZE
+        header = dict(
+            meta or {},
+            name=source_path.name,
+            size=total_size,
+            flags=(HEADER_SPARSE if sparse else 0) | (HEADER_RESUME if resumable else 0),
+            mtime_ns=source_stat.st_mtime_ns,
+            chunk_size=tree_chunk_size or 0,
+            frame_size=self.chunk_size,
+            hash_algorithm=hash_algorithm,
+            compression=compression,
+        )
+        hasher, cached = _digest_for(source_stat, tree_chunk_size, hash_algorithm)
+        compressor = _new_compressor(compression)
+        buffer = memoryview(bytearray(max(1, min(self.chunk_size, total_size))))
+        stats = _StreamStats()
+        reply = self._replies[stream_id] = _StreamReply()
+
+        def send(
+            kind: int, offset: int, raw_len: int, payload=b"", crc: Optional[int] = None
+        ) -> None:
+            if reply.refused:
+                raise ConnectionError("Receiver dropped the stream")
+            self._send(stream_id, kind, offset, raw_len, payload, crc)
+
+        def send_window(handle, offset: int, count: int, crc: int) -> None:
+            if reply.refused:
+                raise ConnectionError("Receiver dropped the stream")
+            with self._lock:
+                self._check_open()
+                try:
+                    send_mux_file_frame(self._conn, stream_id, handle, offset, count, crc)
+                except OSError:
+                    self.closed = True
+                    raise
+
+        def on_bytes(count: int) -> None:
+            if on_progress:
+                on_progress(stats.logical, total_size)
+
+        try:
+            send(FRAME_OPEN, 0, 0, pack_json(header))
+            offset = 0
+            if resumable:
+                if not reply.answered.wait(RESUME_TIMEOUT):
+                    raise TimeoutError("Receiver did not answer with a resume offset")
+                if reply.refused:
+                    raise ConnectionError("Receiver refused the stream")
+                offset = _check_resume_offset(reply.offset, total_size, tree_chunk_size)
+            with open(source_path, "rb", buffering=0) as handle:
+                advise_sequential(handle.fileno())
+                _hash_source(handle, hasher, 0, offset, sparse, buffer)
+                stats.logical = offset
+                resend = functools.partial(
+                    _resend_frame, send, handle, buffer, total_size, governor, stats
+                )
+                _send_extent(
+                    send, handle, offset, total_size, sparse, hasher, compressor,
+                    buffer, governor, stats, on_bytes, send_window,
+                    functools.partial(_answer_replies, reply, resend),
+                )
+                checksum, tree = _finish_digest(
+                    hasher, cached, source_path, source_stat, hash_algorithm
+                )
+                _send_trailer(send, total_size, checksum, reply, resend)
+        except BaseException:
+            # Let the receiver checkpoint the stream; the link stays usable.
+            try:
+                self._send(stream_id, FRAME_ABORT, 0, 0)
+            except OSError:
+                pass
+            raise
+        finally:
+            self._replies.pop(stream_id, None)
+        return _send_result(
+            checksum,
+            tree,
+            compressor,
+            stats,
+            hash_algorithm,
+            compression,
+            strategy="session",
+            resumed_bytes=offset,
+        )
+
+    def close(self) -> None:
+        self.closed = True
+        try:
+            self._conn.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self._conn.close()
+
+    def _send(
+        self,
+        stream_id: int,
+        kind: int,
+        offset: int,
+        raw_len: int,
+        payload=b"",
+        crc: Optional[int] = None,
+    ) -> None:
+        with self._lock:
+            self._check_open()
+            try:
+                send_mux_frame(self._conn, stream_id, kind, offset, raw_len, payload, crc)
+            except OSError:
+                self.closed = True
+                raise
+
+    def _check_open(self) -> None:
+        if self.closed:
+            raise ConnectionError("Session data connection closed")
+
+    def _read_replies(self) -> None:
+        try:
+            while True:
+                stream_id, kind, offset, raw_len, _payload = read_mux_frame(self._conn)
+                reply = self._replies.get(stream_id)
+                if reply is None:
+                    continue
+                if kind == FRAME_RESUME:
+                    reply.offset = offset
+                    reply.answered.set()
+                    continue
+                if kind == FRAME_ABORT:
+                    reply.refused = True
+                    reply.answered.set()
+                reply.put((kind, offset, raw_len))
+        except (OSError, ConnectionError):
+            pass
+        self.closed = True
+        for reply in list(self._replies.values()):
+            reply.refused = True
+            reply.answered.set()
+            reply.put(None)
+
+
+class SessionReceiver:
+    """Peer end of a session data connection.
+
+    One thread reads frames and writes each into the file of its stream.
+    Finished files are fsynced and renamed on a small pool so a slow
+    finalize does not stall the streams behind it (and so ``batch``
+    durability has concurrent files to group). Streams that fail keep
+    their partial file and checkpoint for the sender's next attempt.
+
+    Corrupt frames are asked for again and each stream is checked against
+    the checksum in its END frame, as in ``receive_file``; the verdict goes
+    back on the stream before the file is published.
+
+    ``on_progress(meta, bytes_received, size)`` and
+    ``on_complete(meta, result, error)`` get the OPEN frame's metadata;
+    exactly one of ``result`` and ``error`` is set. ``splice`` works as for
+    ``receive_file``.
+    """
+
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        hello: dict,
+        dest_dir: Path,
+        durability: str = "file",
+        on_progress=None,
+        on_complete=None,
+        publishers: int = 4,
+        splice: bool = False,
+    ) -> None:
+        self.host = host
+        self.port = port
+        self.hello = hello
+        self.dest_dir = dest_dir
+        self.durability = durability
+        self.on_progress = on_progress
+        self.on_complete = on_complete
+        self.publishers = publishers
+        self.splice = splice
+        self._conn: Optional[socket.socket] = None
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def connected(self) -> bool:
+        return bool(self._thread and self._thread.is_alive())
+
+    def connect(self) -> None:
+        conn = socket.create_connection((self.host, self.port))
+        conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        send_mux_frame(conn, 0, FRAME_HELLO, 0, 0, pack_json(self.hello))
+        self._conn = conn
+        self.dest_dir.mkdir(parents=True, exist_ok=True)
+        self._thread = threading.Thread(target=self._run, args=(conn,), daemon=True)
+        self._thread.start()
+
+    def close(self) -> None:
+        if self._conn:
+            try:
+                self._conn.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self, conn: socket.socket) -> None:
+        # Replies are only ever sent from this thread, so they need no lock.
+        streams: Dict[int, Optional[_IncomingStream]] = {}
+        pool = ThreadPoolExecutor(max_workers=self.publishers)
+        reader = FrameReader(conn)
+        splice = self.splice and reader.can_splice
+        try:
+            while True:
+                stream_id, kind, offset, raw_len, wire_len, crc = reader.read_mux_header()
+                stream = streams.get(stream_id)
+                if kind == FRAME_OPEN:
+                    check_payload_length(wire_len, CONTROL_PAYLOAD_LIMIT)
+                elif stream:
+                    check_payload_length(wire_len, stream.max_payload)
+                spliced = bool(splice and stream and kind == FRAME_DATA and wire_len)
+                if spliced:
+                    # A failed splice leaves the payload half read, so it
+                    # takes the whole connection down rather than one stream.
+                    payload = stream.writer.splice(reader, offset, raw_len, wire_len)
+                else:
+                    payload = reader.read_payload(wire_len)
+                if kind == FRAME_OPEN:
+                    stream = None
+                    if payload_crc(payload) == crc:
+                        stream = self._open(
+                            unpack_json(payload),
+                            functools.partial(send_mux_frame, conn, stream_id),
+                        )
+                    streams[stream_id] = stream
+                    if stream is None:
+                        send_mux_frame(conn, stream_id, FRAME_ABORT, 0, 0)
+                    elif stream.resumable:
+                        send_mux_frame(conn, stream_id, FRAME_RESUME, stream.digest.offset, 0)
+                    continue
+                if kind == FRAME_ABORT:
+                    streams.pop(stream_id, None)
+                if stream is None:
+                    # Unknown, or failed: its frames are dropped.
+                    continue
+                if kind == FRAME_ABORT:
+                    self._fail(stream, ConnectionError("Sender aborted the transfer"))
+                    continue
+                try:
+                    more = stream.writer.write(kind, offset, raw_len, payload, crc, spliced)
+                except (OSError, ConnectionError) as exc:
+                    streams[stream_id] = None
+                    self._fail(stream, exc)
+                    send_mux_frame(conn, stream_id, FRAME_ABORT, 0, 0)
+                    continue
+                if more:
+                    continue
+                streams.pop(stream_id, None)
+                tree, checksum = stream.digest.result()
+                try:
+                    _check_trailer(stream.writer.trailer, checksum)
+                except ConnectionError as exc:
+                    stream.incoming.discard()
+                    self._report(stream.meta, None, exc)
+                    send_mux_frame(conn, stream_id, FRAME_ABORT, 0, 0)
+                    continue
+                send_mux_frame(conn, stream_id, FRAME_END, 0, 0)
+                pool.submit(self._publish, stream, tree, checksum)
+        except (OSError, ConnectionError):
+            pass
+        finally:
+            reader.close()
+            conn.close()
+            for stream in streams.values():
+                if stream:
+                    self._fail(stream, ConnectionError("Session data connection lost"))
+            pool.shutdown(wait=True)
+
+    def _open(self, meta: dict, reply: Callable[..., None]) -> Optional[_IncomingStream]:
+        """``reply(kind, offset, raw_len)`` answers on the stream's behalf."""
+        try:
+            flags = int(meta.get("flags") or 0)
+            max_payload = payload_limit(int(meta.get("frame_size") or 0))
+            incoming = _IncomingFile(
+                self.dest_dir,
+                Path(str(meta["name"])).name,
+                int(meta["size"]),
+                flags,
+                int(meta.get("mtime_ns") or 0),
+            )
+        except (KeyError, ValueError, OSError) as exc:
+            self._report(meta, None, exc)
+            return None
+        hash_algorithm = meta.get("hash_algorithm") or DEFAULT_ALGORITHM
+        compression = meta.get("compression") or NO_COMPRESSION
+
+        def on_progress(received: int, size: int) -> None:
+            if self.on_progress:
+                self.on_progress(meta, received, size)
+
+        try:
+            digest = _SequentialDigest(
+                incoming,
+                int(meta.get("chunk_size") or 0) or None,
+                hash_algorithm,
+                on_progress,
+            )
+        except OSError as exc:
+            incoming.close()
+            self._report(meta, None, exc)
+            return None
+        writer = _FrameWriter(incoming.fd, compression, digest, reply)
+        writer.stats.logical = digest.offset
+        return _IncomingStream(
+            meta, incoming, digest, writer, bool(flags & HEADER_RESUME), max_payload
+        )
+
+    def _publish(self, stream: _IncomingStream, tree, checksum: str) -> None:
+        try:
+            stream.incoming.close()
+            result = stream.incoming.publish(
+                self.durability,
+                stream.meta.get("conflict_rule") or "keep_both",
+                stream.writer.finish(),
+                checksum,
+                tree,
+                stream.digest.hash_algorithm,
+                stream.writer.compression,
+            )
+        except OSError as exc:
+            self._report(stream.meta, None, exc)
+            return
+        self._report(stream.meta, result, None)
+
+    def _fail(self, stream: _IncomingStream, error: BaseException) -> None:
+        stream.digest.checkpoint()
+        stream.incoming.close()
+        self._report(stream.meta, None, error)
+
+    def _report(self, meta: dict, result, error) -> None:
+        if self.on_complete:
+            self.on_complete(meta, result, error)
+
+
+class _StreamStats:
+    def __init__(self) -> None:
+        self.logical = 0
+        self.wire = 0
+        self.holes = 0
+        self.retransmitted = 0
+        self.cpu_seconds = 0.0
+
+
+class _IncomingFile:
+    """Pre-sized temp file for one incoming transfer.
+
+    The temp file is named after the sender's file, so a later attempt
+    finds the partial data of an interrupted one; with ``HEADER_RESUME``
+    its checkpoint says how much of it is trusted. ``publish`` renames it
+    over the destination the conflict rule picks, or deletes it when the
+    rule says to keep the existing file.
+    """
+
+    def __init__(
+        self, dest_dir: Path, filename: str, size: int, flags: int, mtime_ns: int = 0
+    ) -> None:
+        self.dest_dir = dest_dir
+        self.filename = filename
+        self.temp_path = dest_dir / f"{INCOMING_PREFIX}{filename}"
+        self.size = size
+        self.mtime_ns = mtime_ns
+        self.resumable = bool(flags & HEADER_RESUME)
+        self.checkpoint: Optional[Checkpoint] = None
+        if self.resumable and self.temp_path.exists():
+            checkpoint = load_checkpoint(str(self.temp_path))
+            if (
+                checkpoint
+                and checkpoint.source_size == size
+                and checkpoint.source_mtime_ns == mtime_ns
+            ):
+                self.checkpoint = checkpoint
+        mode = os.O_RDWR | os.O_CREAT | getattr(os, "O_BINARY", 0)
+        if self.checkpoint is None:
+            mode |= os.O_TRUNC
+            clear_checkpoint(str(self.temp_path))
+        self.fd: Optional[int] = os.open(self.temp_path, mode, 0o644)
+        try:
+            if not flags & HEADER_SPARSE:
+                held = getattr(os.fstat(self.fd), "st_blocks", 0) * 512
+                ensure_free_space(str(self.temp_path), size - held)
+                preallocate(self.fd, 0, size)
+            os.ftruncate(self.fd, size)
+        except OSError:
+            self.close()
+            raise
+
+    def resume_point(self, tree_chunk_size: Optional[int], hash_algorithm: str):
+        """Return the verified offset and a digest that already covers it.
+
+        Tree digests come back from the checkpoint's ranges and a crc32
+        from its saved state; a hashlib digest is only kept in memory, so
+        after a restart its prefix is read and hashed once more.
+        """
+        if tree_chunk_size:
+            digests = self._trusted_ranges(tree_chunk_size, hash_algorithm)
+            return (
+                min(len(digests) * tree_chunk_size, self.size),
+                ChunkTreeBuilder(tree_chunk_size, digests, hash_algorithm),
+            )
+        checkpoint = self.checkpoint
+        if (
+            checkpoint is None
+            or checkpoint.range_size
+            or checkpoint.algorithm != hash_algorithm
+            or not 0 < checkpoint.offset <= self.size
+        ):
+            return 0, new_hasher(hash_algorithm)
+        offset = checkpoint.offset
+        with _resume_lock:
+            saved = _resume_states.get(str(self.temp_path))
+        if saved and saved[0] == offset and saved[1] == hash_algorithm:
+            return offset, saved[2].copy()
+        restored = restore_hasher(hash_algorithm, checkpoint.hash_state)
+        if restored is not None:
+            return offset, restored
+        # Rehash the trusted prefix once; a mismatch with the sender still
+        # shows up in the final checksum comparison.
+        hasher = new_hasher(hash_algorithm)
+        buffer = memoryview(bytearray(min(1024 * 1024, offset)))
+        position = 0
+        while position < offset:
+            view = buffer[: min(len(buffer), offset - position)]
+            count = pread_into(self.fd, view, position)
+            if not count:
+                return 0, new_hasher(hash_algorithm)
+            hasher.update(view[:count])
+            position += count
+        return offset, hasher
+
+    def resume_ranges(self, range_size: int, hash_algorithm: str):
+        """Return the verified offset and the digests of the ranges below it."""
+        digests = self._trusted_ranges(range_size, hash_algorithm)
+        offset = min(len(digests) * range_size, self.size)
+        return offset, dict(enumerate(digests))
+
+    def save_progress(self, offset: int, hasher, hash_algorithm: str) -> None:
+        if not self.resumable:
+            return
+        if isinstance(hasher, ChunkTreeBuilder):
+            self.save_ranges(hasher.chunk_size, dict(enumerate(hasher.digests)), hash_algorithm)
+            return
+        with _resume_lock:
+            _resume_states[str(self.temp_path)] = (offset, hash_algorithm, hasher.copy())
+        self._save(
+            Checkpoint(
+                offset,
+                self.size,
+                self.mtime_ns,
+                hash_algorithm,
+                hash_state=export_state(hasher),
+            )
+        )
+
+    def save_ranges(self, range_size: int, digests: dict, hash_algorithm: str) -> None:
+        if not self.resumable:
+            return
+        self._save(
+            Checkpoint(
+                offset=0,
+                source_size=self.size,
+                source_mtime_ns=self.mtime_ns,
+                algorithm=hash_algorithm,
+                range_size=range_size,
+                range_digests=[[index, digests[index]] for index in sorted(digests)],
+            )
+        )
+
+    def close(self) -> None:
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+    def discard(self) -> None:
+        """Drop the partial file and its checkpoint; nothing in it is trusted."""
+        self.close()
+        with _resume_lock:
+            _resume_states.pop(str(self.temp_path), None)
+        clear_checkpoint(str(self.temp_path))
+        self.temp_path.unlink(missing_ok=True)
+
+    def publish(
+        self,
+        durability: str,
+        conflict_rule: str,
+        received: _StreamStats,
+        checksum: str,
+        tree: Optional[ChunkTree],
+        hash_algorithm: str,
+        compression: str,
+    ) -> ReceiveResult:
+        with _resume_lock:
+            _resume_states.pop(str(self.temp_path), None)
+        clear_checkpoint(str(self.temp_path))
+        dest_path = _resolve_conflict_dest(self.dest_dir / self.filename, conflict_rule)
         if dest_path is None:
-            dest_path = dest_dir / f".incoming_{filename}"
-            discard = True
-        remaining = size
-        hasher = hashlib.sha256()
-        bytes_received = 0
-        with open(dest_path, "wb") as out:
-            while remaining > 0:
-                chunk = conn.recv(min(1024 * 1024, remaining))
-                if not chunk:
-                    break
-                out.write(chunk)
-                hasher.update(chunk)
-                bytes_received += len(chunk)
-                remaining -= len(chunk)
-                if on_progress:
-                    on_progress(bytes_received, size)
+            self.temp_path.unlink(missing_ok=True)
+            return ReceiveResult(self.temp_path, received.logical, "", True)
+        finalize(str(self.temp_path), str(dest_path), durability)
+        return ReceiveResult(
+            dest_path,
+            received.logical,
+            checksum,
+            False,
+            tree,
+            hash_algorithm,
+            compression,
+            received.wire,
+            received.cpu_seconds,
+        )
+
+    def _trusted_ranges(self, range_size: int, hash_algorithm: str) -> List[str]:
+        """Digests of the leading ranges the checkpoint vouches for, in order.
+
+        Sequential chunk trees and striped receives both record digests of
+        ``range_size`` ranges, so either kind of checkpoint serves both.
+        """
+        checkpoint = self.checkpoint
+        if (
+            checkpoint is None
+            or checkpoint.range_size != range_size
+            or checkpoint.algorithm != hash_algorithm
+        ):
+            return []
+        recorded = {int(index): digest for index, digest in checkpoint.range_digests}
+        digests = []
+        while len(digests) in recorded:
+            digests.append(recorded[len(digests)])
+        return digests
+
+    def _save(self, checkpoint: Checkpoint) -> None:
+        try:
+            save_checkpoint(str(self.temp_path), checkpoint)
+        except OSError:
+            pass
+
+
+class _IncomingStream:
+    def __init__(
+        self,
+        meta: dict,
+        incoming: _IncomingFile,
+        digest,
+        writer,
+        resumable: bool,
+        max_payload: int,
+    ) -> None:
+        self.meta = meta
+        self.incoming = incoming
+        self.digest = digest
+        self.writer = writer
+        self.resumable = resumable
+        self.max_payload = max_payload
+
+
+class _StreamReply:
+    """What the receiver answered about one outgoing session stream."""
+
+    def __init__(self) -> None:
+        self.answered = threading.Event()
+        self.offset = 0
+        self.refused = False
+        self._replies: queue.Queue = queue.Queue()
+
+    def put(self, reply: Optional[tuple]) -> None:
+        """Queue ``(kind, offset, raw_len)``, or None once the link is gone."""
+        self._replies.put(reply)
+
+    def poll(self) -> list:
+        replies = []
+        while True:
+            try:
+                replies.append(self._replies.get_nowait())
+            except queue.Empty:
+                return replies
+
+    def wait(self, timeout: float) -> Optional[tuple]:
+        try:
+            return self._replies.get(timeout=timeout)
+        except queue.Empty:
+            raise TimeoutError("Receiver did not confirm the transfer") from None
+
+
+class _ConnReplies:
+    """What the receiver sends back on a plain data connection.
+
+    Same interface as ``_StreamReply``: ``poll`` returns the replies that
+    already arrived without blocking, ``wait`` blocks for the next one.
+    """
+
+    def __init__(self, conn: socket.socket) -> None:
+        self.conn = conn
+
+    def poll(self) -> list:
+        replies = []
+        while self._ready():
+            replies.append(self._read())
+        return replies
+
+    def wait(self, timeout: float) -> Optional[tuple]:
+        self.conn.settimeout(timeout)
+        try:
+            return self._read()
+        except socket.timeout:
+            raise TimeoutError("Receiver did not confirm the transfer") from None
+        finally:
+            self.conn.settimeout(None)
+
+    def _read(self) -> tuple:
+        kind, offset, raw_len, _payload = read_frame(self.conn)
+        return kind, offset, raw_len
+
+    def _ready(self) -> bool:
+        # TLS may already hold decrypted bytes the socket no longer shows.
+        if is_secure(self.conn) and self.conn.pending():
+            return True
+        return bool(select.select([self.conn], [], [], 0)[0])
+
+
+def _accept(server: socket.socket, secure: Optional[SecureChannel]) -> socket.socket:
+    conn, _addr = server.accept()
+    return secure.wrap_server(conn) if secure else conn
+
+
+def _connect(host: str, port: int, secure: Optional[SecureChannel]) -> socket.socket:
+    conn = socket.create_connection((host, port))
+    return secure.wrap_client(conn) if secure else conn
+
+
+def _window_sender(conn: socket.socket):
+    """``send_window`` for ``_send_extent``; TLS has to see every byte."""
+    if is_secure(conn):
+        return None
+    return functools.partial(send_file_frame, conn)
+
+
+def _digest_for(
+    source_stat: os.stat_result, tree_chunk_size: Optional[int], hash_algorithm: str
+):
+    """Return a fresh hasher, or None and the digest cached for this file."""
+    cached = default_cache().get(source_stat, hash_algorithm, tree_chunk_size or 0)
+    if cached:
+        return None, cached
+    return _new_digest(tree_chunk_size, hash_algorithm), None
+
+
+def _finish_digest(
+    hasher,
+    cached: Optional[CachedDigest],
+    source_path: Path,
+    source_stat: os.stat_result,
+    hash_algorithm: str,
+):
+    """Return ``(checksum, tree)``, caching it if the file did not change."""
+    if hasher is None:
+        return cached
+    tree = hasher.finish() if isinstance(hasher, ChunkTreeBuilder) else None
+    checksum = tree.root if tree else hasher.hexdigest()
+    if same_version(source_stat, source_path.stat()):
+        default_cache().put(
+            source_stat, hash_algorithm, tree.chunk_size if tree else 0, checksum, tree
+        )
+    return checksum, tree
+
+
+def _send_result(
+    checksum: str,
+    tree: Optional[ChunkTree],
+    compressor: Optional[AdaptiveCompressor],
+    stats: _StreamStats,
+    hash_algorithm: str,
+    compression: str,
+    strategy: str = "buffered",
+    resumed_bytes: int = 0,
+) -> TransferResult:
+    return TransferResult(
+        bytes_copied=stats.logical,
+        checksum=checksum,
+        strategy=strategy,
+        chunk_tree=tree,
+        hash_algorithm=hash_algorithm,
+        compression=compression,
+        wire_bytes=stats.wire,
+        compression_seconds=compressor.cpu_seconds if compressor else 0.0,
+        hole_bytes=stats.holes,
+        resumed_bytes=resumed_bytes,
+        retransmitted_bytes=stats.retransmitted,
+    )
+
+
+def _check_resume_offset(offset: int, size: int, alignment: Optional[int]) -> int:
+    """Reject offsets a well-behaved receiver can never report."""
+    if offset > size or (alignment and offset % alignment and offset != size):
+        raise ConnectionError(f"Receiver reported an invalid resume offset {offset}")
+    return offset
+
+
+def _answer_replies(replies, resend: Callable[[int, int], None]) -> None:
+    """Act on what the receiver sent back so far, without waiting for more."""
+    for reply in replies.poll():
+        _answer(reply, resend)
 
-    if discard:
-        dest_path.unlink(missing_ok=True)
-        return ReceiveResult(dest_path, bytes_received, "", True)
-    return ReceiveResult(dest_path, bytes_received, hasher.hexdigest(), False)
 
+def _send_trailer(
+    send: Callable[..., None],
+    size: int,
+    checksum: str,
+    replies,
+    resend: Callable[[int, int], None],
+) -> None:
+    """End the stream with ``checksum`` and wait until the receiver accepts it.
 
-def _recv_exact(conn: socket.socket, size: int) -> bytes:
-    data = b""
-    while len(data) < size:
-        chunk = conn.recv(size - len(data))
-        if not chunk:
-            raise ConnectionError("Unexpected end of stream")
-        data += chunk
-    return data
+    Frames it still asks for are resent meanwhile; an empty ``checksum``
+    leaves the whole-file check to another stream.
+    """
+    send(FRAME_END, size, 0, checksum.encode("ascii"))
+    while not _answer(replies.wait(VERDICT_TIMEOUT), resend):
+        pass
 
 
-def _apply_rate_limit(bytes_copied: int, start_time: float, max_bandwidth: Optional[int]) -> None:
-    if not max_bandwidth:
+def _answer(reply: Optional[tuple], resend: Callable[[int, int], None]) -> bool:
+    """Act on one reply; True once the receiver accepted the stream."""
+    if reply is not None and reply[0] == FRAME_RETRANSMIT:
+        resend(reply[1], reply[2])
+        return False
+    return _accepted(reply)
+
+
+def _accepted(reply: Optional[tuple]) -> bool:
+    """True if ``reply`` accepts the stream; raise if it ends it any other way."""
+    if reply is None:
+        raise ConnectionError("Data connection lost before the receiver confirmed")
+    kind = reply[0]
+    if kind == FRAME_END:
+        return True
+    if kind == FRAME_ABORT:
+        raise ConnectionError("Receiver aborted the transfer")
+    raise ConnectionError(f"Unexpected reply frame {kind}")
+
+
+def _resend_frame(
+    send: Callable[..., None],
+    handle,
+    buffer: memoryview,
+    size: int,
+    governor: Optional[Throttle],
+    stats: _StreamStats,
+    offset: int,
+    raw_len: int,
+) -> None:
+    """Send the frame at ``offset`` again, as plain DATA."""
+    payload, crc = _reread(handle, buffer, size, offset, raw_len)
+    send(FRAME_DATA, offset, raw_len, payload, crc)
+    stats.wire += raw_len
+    stats.retransmitted += raw_len
+    if governor:
+        governor.acquire(raw_len)
+
+
+def _reread(handle, buffer: memoryview, size: int, offset: int, raw_len: int):
+    """Read back a frame the receiver asked for; returns ``(payload, crc)``."""
+    if not 0 < raw_len <= len(buffer) or offset + raw_len > size:
+        raise ConnectionError(f"Receiver asked for an invalid frame at {offset}")
+    view = buffer[:raw_len]
+    if pread_into(handle.fileno(), view, offset) != raw_len:
+        raise IOError("Source file shrank during send")
+    return view, payload_crc(view)
+
+
+def _check_trailer(trailer: Optional[str], checksum: str) -> None:
+    if trailer is not None and trailer != checksum:
+        raise ConnectionError(
+            f"Checksum mismatch: sender has {trailer}, received {checksum}"
+        )
+
+
+def _confirm(
+    conn: socket.socket, incoming: _IncomingFile, trailer: Optional[str], checksum: str
+) -> None:
+    """Accept the stream, or drop the partial file if the checksums differ."""
+    try:
+        _check_trailer(trailer, checksum)
+    except ConnectionError:
+        incoming.discard()
+        _send_abort(conn)
+        raise
+    send_frame(conn, FRAME_END, 0, 0)
+
+
+def _send_abort(conn: socket.socket) -> None:
+    try:
+        send_frame(conn, FRAME_ABORT, 0, 0)
+    except OSError:
+        pass
+
+
+def _hash_source(
+    handle, hasher, start: int, end: int, sparse: bool, buffer: memoryview
+) -> None:
+    """Hash ``start..end`` of the source without sending it."""
+    if hasher is None:
         return
-    elapsed = time.monotonic() - start_time
-    if elapsed <= 0:
+    position = start
+    while position < end:
+        extent_end = end
+        if sparse:
+            is_data, extent_end = next_extent(handle.fileno(), position, end)
+            if not is_data:
+                hash_hole(hasher, extent_end - position)
+                position = extent_end
+                continue
+        view = buffer[: min(len(buffer), extent_end - position)]
+        count = pread_into(handle.fileno(), view, position)
+        if not count:
+            raise IOError("Source file shrank during send")
+        hasher.update(view[:count])
+        position += count
+
+
+def _send_extent(
+    send: Callable[..., None],
+    handle,
+    start: int,
+    end: int,
+    sparse: bool,
+    hasher,
+    compressor: Optional[AdaptiveCompressor],
+    buffer: memoryview,
+    governor: Optional[Throttle],
+    stats: _StreamStats,
+    on_bytes: Callable[[int], None],
+    send_window: Optional[Callable[[object, int, int, int], None]] = None,
+    after_frame: Optional[Callable[[], None]] = None,
+) -> None:
+    """Send ``start..end`` of ``handle`` as frames, hashing what is sent.
+
+    ``send(kind, offset, raw_len, payload, crc)`` puts one frame on the
+    wire. When nothing transforms the payload and ``send_window(handle,
+    offset, count, crc)`` is given, data frames are sent with sendfile
+    instead, in windows of ``len(buffer)`` so throttling and progress still
+    apply. ``after_frame`` runs after each frame, to answer the receiver.
+    ``hasher`` is None when the digest is already known.
+    """
+    frames = _extent_frames(
+        handle, start, end, sparse, hasher, compressor, buffer, governor, stats,
+        on_bytes, send_window is not None,
+    )
+    for kind, offset, raw_len, payload, crc in frames:
+        if payload is None:
+            send_window(handle, offset, raw_len, crc)
+        else:
+            send(kind, offset, raw_len, payload, crc)
+        if after_frame:
+            after_frame()
+
+
+def _extent_frames(
+    handle,
+    start: int,
+    end: int,
+    sparse: bool,
+    hasher,
+    compressor: Optional[AdaptiveCompressor],
+    buffer: memoryview,
+    governor: Optional[Throttle],
+    stats: _StreamStats,
+    on_bytes: Callable[[int], None],
+    windowed: bool = False,
+):
+    """Yield ``(kind, offset, raw_len, payload, crc)`` for ``start..end``.
+
+    Each frame is hashed and checksummed before it is yielded. The caller
+    sends it before asking for the next one; that is when it is counted
+    and metered, and from then on ``buffer`` is free again. With
+    ``windowed`` and no compressor, DATA frames come with a None payload
+    and the caller sends that window of the file itself. The window is
+    still read into ``buffer`` for its CRC and digest, so this saves the
+    copy back into the socket, not the read: it is not zero-copy.
+    """
+    windowed = windowed and compressor is None
+    position = start
+    last_drop = start
+    while position < end:
+        extent_end = end
+        if sparse:
+            is_data, extent_end = next_extent(handle.fileno(), position, end)
+            if not is_data:
+                hole = min(extent_end - position, MAX_FRAME_LENGTH)
+                if hasher:
+                    hash_hole(hasher, hole)
+                yield FRAME_HOLE, position, hole, b"", 0
+                position += hole
+                stats.logical += hole
+                stats.holes += hole
+                on_bytes(hole)
+                continue
+        view = buffer[: min(len(buffer), extent_end - position)]
+        if windowed:
+            count = len(view)
+            # The frame header carries the CRC, so the window is read once
+            # here; sendfile then sends it from the pages this pulled in.
+            if pread_into(handle.fileno(), view, position) != count:
+                raise IOError("Source file shrank during send")
+            if hasher:
+                hasher.update(view)
+            yield FRAME_DATA, position, count, None, payload_crc(view)
+            wire_len = count
+        else:
+            handle.seek(position)
+            count = handle.readinto(view)
+            if not count:
+                raise IOError("Source file shrank during send")
+            data = view[:count]
+            if hasher:
+                hasher.update(data)
+            if compressor:
+                packed, payload = compressor.encode(data)
+            else:
+                packed, payload = False, data
+            kind = FRAME_COMPRESSED if packed else FRAME_DATA
+            yield kind, position, count, payload, payload_crc(payload)
+            wire_len = len(payload)
+        position += count
+        stats.logical += count
+        stats.wire += wire_len
+        if position - last_drop >= DROP_INTERVAL:
+            drop_cache(handle.fileno(), last_drop, position - last_drop)
+            last_drop = position
+        on_bytes(count)
+        if governor:
+            # The link carries the wire bytes, so that is what is metered.
+            governor.acquire(wire_len)
+
+
+class _SequentialDigest:
+    """Hash frames that arrive in file order, dropping them from the cache.
+
+    Starts from the resume point of ``incoming`` and checkpoints there every
+    ``CHECKPOINT_INTERVAL`` bytes.
+    """
+
+    def __init__(
+        self,
+        incoming: _IncomingFile,
+        tree_chunk_size: Optional[int],
+        hash_algorithm: str,
+        on_progress,
+    ) -> None:
+        self.incoming = incoming
+        self.fd = incoming.fd
+        self.size = incoming.size
+        self.hash_algorithm = hash_algorithm
+        self.on_progress = on_progress
+        self.offset, self._hasher = incoming.resume_point(tree_chunk_size, hash_algorithm)
+        self._received = self._dropped = self._checkpointed = self.offset
+
+    def __call__(self, offset: int, data, length: int) -> None:
+        if data is None:
+            hash_hole(self._hasher, length)
+        else:
+            self._hasher.update(data)
+        self._received = offset + length
+        if self._received - self._dropped >= DROP_INTERVAL:
+            drop_cache(self.fd, self._dropped, self._received - self._dropped)
+            self._dropped = self._received
+        if self._received - self._checkpointed >= CHECKPOINT_INTERVAL:
+            self.checkpoint()
+        if self.on_progress:
+            self.on_progress(self._received, self.size)
+
+    def checkpoint(self) -> None:
+        if self._received > self._checkpointed:
+            self.incoming.save_progress(self._received, self._hasher, self.hash_algorithm)
+            self._checkpointed = self._received
+
+    def result(self):
+        hasher = self._hasher
+        tree = hasher.finish() if isinstance(hasher, ChunkTreeBuilder) else None
+        return tree, tree.root if tree else hasher.hexdigest()
+
+
+def _receive_striped(
+    conns: list,
+    incoming: _IncomingFile,
+    range_size: int,
+    hash_algorithm: str,
+    compression: str,
+    on_progress,
+    offset: int,
+    digests: dict,
+    splice: bool = False,
+    max_payload: Optional[int] = None,
+):
+    """Read every stream in its own thread, hashing each range as it lands.
+
+    A range is always sent in order over a single stream, so each stream
+    only needs the hasher of the range it is currently receiving. The
+    ranges below ``offset`` arrive with their ``digests`` from the resume
+    checkpoint; each newly completed range is checkpointed.
+    """
+    fd = incoming.fd
+    size = incoming.size
+    progress_lock = threading.Lock()
+    state = {"received": offset}
+
+    def drain(conn: socket.socket) -> _FrameWriter:
+        current = {"index": None, "hasher": None}
+
+        def finish_range() -> None:
+            index = current["index"]
+            if index is not None:
+                with progress_lock:
+                    digests[index] = current["hasher"].hexdigest()
+                    incoming.save_ranges(range_size, digests, hash_algorithm)
+                drop_cache(fd, index * range_size, range_size)
+
+        def on_frame(offset: int, data, length: int) -> None:
+            index = offset // range_size
+            if index != current["index"]:
+                finish_range()
+                current["index"] = index
+                current["hasher"] = new_hasher(hash_algorithm)
+            if data is None:
+                hash_hole(current["hasher"], length)
+            else:
+                current["hasher"].update(data)
+            with progress_lock:
+                state["received"] += length
+                if on_progress:
+                    on_progress(state["received"], size)
+
+        writer = _read_frames(conn, fd, compression, on_frame, splice, max_payload)
+        finish_range()
+        if writer.trailer is None:
+            # Only the first stream carries the tree root; the others are
+            # done once their frames are intact.
+            send_frame(conn, FRAME_END, 0, 0)
+        return writer
+
+    with ThreadPoolExecutor(max_workers=len(conns)) as pool:
+        writers = list(pool.map(drain, conns))
+
+    range_count = max(1, (size + range_size - 1) // range_size)
+    missing = [i for i in range(range_count) if i not in digests]
+    if missing:
+        raise ConnectionError(f"Ranges never arrived: {missing[:8]}")
+    tree = ChunkTree.from_digests(
+        range_size, [digests[i] for i in range(range_count)], hash_algorithm
+    )
+    total = _StreamStats()
+    total.logical = offset
+    for writer in writers:
+        stats = writer.finish()
+        total.logical += stats.logical
+        total.wire += stats.wire
+        total.cpu_seconds += stats.cpu_seconds
+    return tree, total, writers[0].trailer
+
+
+class _FrameWriter:
+    """Write one file's frames at their offsets.
+
+    ``on_frame(offset, data, length)`` gets ``data=None`` for holes, which
+    are left unwritten in the pre-sized file, and is called in file order.
+    A frame whose payload fails its CRC is asked for again with
+    ``reply(FRAME_RETRANSMIT, offset, raw_len)``; frames behind it are
+    written as they come but only passed to ``on_frame``, read back from
+    the file in pieces of at most ``READBACK_SIZE``, once the gap is filled.
+    """
+
+    def __init__(
+        self,
+        fd: int,
+        compression: str,
+        on_frame: Callable,
+        reply: Optional[Callable[..., None]] = None,
+    ) -> None:
+        self.fd = fd
+        self.compression = compression
+        self.on_frame = on_frame
+        self.reply = reply
+        self.stats = _StreamStats()
+        # The sender's checksum from the END frame, if it sent one.
+        self.trailer: Optional[str] = None
+        self._decompressor = (
+            FrameDecompressor(compression) if compression != NO_COMPRESSION else None
+        )
+        self._ended = False
+        self._gaps: Dict[int, int] = {}
+        self._attempts: Dict[int, int] = {}
+        self._bad_frames = 0
+        self._deferred: List[tuple] = []
+
+    def write(
+        self,
+        kind: int,
+        offset: int,
+        raw_len: int,
+        payload,
+        crc: int,
+        spliced: bool = False,
+    ) -> bool:
+        """Apply one frame; False once END arrived and every frame is intact.
+
+        ``spliced`` payloads are already in the file and only need checking.
+        """
+        if kind == FRAME_END:
+            if payload_crc(payload) != crc:
+                raise ConnectionError("END frame failed its integrity check")
+            self.trailer = str(payload, "ascii") if len(payload) else None
+            self._ended = True
+        elif kind == FRAME_HOLE:
+            self.stats.logical += raw_len
+            self._deliver(offset, None, raw_len)
+        elif kind not in (FRAME_DATA, FRAME_COMPRESSED):
+            raise ConnectionError(f"Unknown frame type {kind}")
+        elif payload_crc(payload) != crc:
+            self._reject(offset, raw_len)
+        else:
+            self._gaps.pop(offset, None)
+            if kind == FRAME_COMPRESSED:
+                if not self._decompressor:
+                    raise ConnectionError("Compressed frame without a negotiated codec")
+                data = self._decompressor.decode(payload)
+            else:
+                data = payload
+            if len(data) != raw_len:
+                raise ConnectionError("Frame length mismatch")
+            if not spliced:
+                _write_at(self.fd, data, offset)
+            self.stats.logical += raw_len
+            self.stats.wire += len(payload)
+            self._deliver(offset, data, raw_len)
+        return not self._ended or bool(self._gaps)
+
+    def splice(
+        self, reader: FrameReader, offset: int, raw_len: int, wire_len: int
+    ) -> memoryview:
+        """Move a DATA payload that is still in the socket into the file.
+
+        Returns it as read back from the pages splice just wrote, for
+        ``write(..., spliced=True)`` to check and hash.
+        """
+        if raw_len != wire_len:
+            raise ConnectionError("Frame length mismatch")
+        reader.splice_payload(self.fd, offset, raw_len)
+        view = reader.buffer(raw_len)[:raw_len]
+        if pread_into(self.fd, view, offset) != raw_len:
+            raise IOError("Destination shrank during receive")
+        return view
+
+    def finish(self) -> _StreamStats:
+        if self._decompressor:
+            self.stats.cpu_seconds = self._decompressor.cpu_seconds
+        return self.stats
+
+    def _reject(self, offset: int, raw_len: int) -> None:
+        self._bad_frames += 1
+        attempts = self._attempts[offset] = self._attempts.get(offset, 0) + 1
+        if (
+            self.reply is None
+            or attempts > RETRANSMIT_LIMIT
+            or self._bad_frames > BAD_FRAME_LIMIT
+        ):
+            raise ConnectionError(
+                f"Frame at offset {offset} failed its integrity check "
+                f"({self._bad_frames} corrupt frame(s) in this stream)"
+            )
+        self._gaps[offset] = raw_len
+        self.reply(FRAME_RETRANSMIT, offset, raw_len)
+
+    def _deliver(self, offset: int, data, length: int) -> None:
+        if not self._gaps and not self._deferred:
+            self.on_frame(offset, data, length)
+            return
+        self._deferred.append((offset, length, data is not None))
+        if self._gaps:
+            return
+        deferred, self._deferred = sorted(self._deferred), []
+        # Holes are never read back, and a HOLE frame can stand for 4 GiB.
+        largest = max((length for _o, length, has_data in deferred if has_data), default=0)
+        buffer = memoryview(bytearray(min(largest, READBACK_SIZE)))
+        for position, count, has_data in deferred:
+            if not has_data:
+                self.on_frame(position, None, count)
+                continue
+            end = position + count
+            while position < end:
+                view = buffer[: min(len(buffer), end - position)]
+                if pread_into(self.fd, view, position) != len(view):
+                    raise IOError("Destination shrank during receive")
+                self.on_frame(position, view, len(view))
+                position += len(view)
+
+
+def _read_frames(
+    conn: socket.socket,
+    fd: int,
+    compression: str,
+    on_frame: Callable,
+    splice: bool = False,
+    max_payload: Optional[int] = None,
+) -> _FrameWriter:
+    """Write frames from ``conn`` at their offsets until END and no gaps.
+
+    Corrupt frames are asked for again on ``conn``; if the stream fails
+    for any reason the sender is told to abort.
+    """
+    writer = _FrameWriter(fd, compression, on_frame, functools.partial(send_frame, conn))
+    try:
+        with FrameReader(conn, max_payload=max_payload) as reader:
+            splice = splice and reader.can_splice
+            while True:
+                kind, offset, raw_len, wire_len, crc = reader.read_header()
+                spliced = splice and kind == FRAME_DATA and wire_len > 0
+                if spliced:
+                    payload = writer.splice(reader, offset, raw_len, wire_len)
+                else:
+                    payload = reader.read_payload(wire_len)
+                if not writer.write(kind, offset, raw_len, payload, crc, spliced):
+                    break
+    except OSError:
+        _send_abort(conn)
+        raise
+    return writer
+
+
+def _write_at(fd: int, data: bytes, offset: int) -> None:
+    view = memoryview(data)
+    if hasattr(os, "pwrite"):
+        while view:
+            written = os.pwrite(fd, view, offset)
+            view = view[written:]
+            offset += written
         return
-    expected_time = bytes_copied / max_bandwidth
-    if expected_time > elapsed:
-        time.sleep(expected_time - elapsed)
+    # Without pwrite only a single stream is used, so seeking is safe.
+    os.lseek(fd, offset, os.SEEK_SET)
+    while view:
+        view = view[os.write(fd, view):]
+
+
+def _new_digest(tree_chunk_size: Optional[int], hash_algorithm: str):
+    if tree_chunk_size:
+        return ChunkTreeBuilder(tree_chunk_size, algorithm=hash_algorithm)
+    return new_hasher(hash_algorithm)
+
+
+def _new_compressor(compression: str) -> Optional[AdaptiveCompressor]:
+    if compression == NO_COMPRESSION:
+        return None
+    return AdaptiveCompressor(compression)
+
+
+def _clone_file(source_path: Path, dest_path: Path) -> str:
+    """Copy with the fastest strategy that works for this pair; returns its name."""
+    size = source_path.stat().st_size
+    buffer = memoryview(bytearray(1024 * 1024))
+    with open(source_path, "rb", buffering=0) as source, open(
+        dest_path, "wb", buffering=0
+    ) as dest:
+        for strategy in available_strategies(buffer):
+            step = LOCAL_COPY_RANGE if strategy.zero_copy else len(buffer)
+            offset = 0
+            try:
+                while offset < size:
+                    count = strategy.copy_range(
+                        source, dest, offset, min(step, size - offset)
+                    )
+                    if not count:
+                        raise IOError("Source file shrank during copy")
+                    offset += count
+            except StrategyUnsupported:
+                dest.truncate(0)
+                continue
+            return strategy.name
+    raise IOError(f"No copy strategy works for {source_path}")
 
 
 def _resolve_conflict_dest(dest_path: Path, conflict_rule: str) -> Path | None:
@@ -0,0 +1,60 @@
+"""Resume checkpoints stored next to partially copied files."""
+from __future__ import annotations
+
+import json
+import os
+from dataclasses import asdict, dataclass, field
+from typing import List, Optional
+
+
+CHECKPOINT_SUFFIX = ".hdck"
+
+
+@dataclass(frozen=True)
+class Checkpoint:
+    offset: int
+    source_size: int
+    source_mtime_ns: int
+    algorithm: str = "sha256"
+    # Parallel copies finish ranges out of order, so instead of a trusted
+    # prefix they record each completed range with its digest.
+    range_size: int = 0
+    range_digests: List[List] = field(default_factory=list)
+    # Running digest state at ``offset`` (``digests.export_state``), when
+    # the algorithm can export it; otherwise a resume rehashes the prefix.
+    hash_state: str = ""
+
+    def matches(self, source_stat: os.stat_result) -> bool:
+        return (
+            self.source_size == source_stat.st_size
+            and self.source_mtime_ns == source_stat.st_mtime_ns
+        )
+
+
+def checkpoint_path(dest_path: str) -> str:
+    directory, name = os.path.split(dest_path)
+    return os.path.join(directory, f".{name}{CHECKPOINT_SUFFIX}")
+
+
+def load_checkpoint(dest_path: str) -> Optional[Checkpoint]:
+    try:
+        with open(checkpoint_path(dest_path), "r", encoding="utf-8") as handle:
+            data = json.load(handle)
+        return Checkpoint(**data)
+    except (OSError, ValueError, TypeError):
+        return None
+
+
+def save_checkpoint(dest_path: str, checkpoint: Checkpoint) -> None:
+    path = checkpoint_path(dest_path)
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as handle:
+        json.dump(asdict(checkpoint), handle)
+    os.replace(temp_path, path)
+
+
+def clear_checkpoint(dest_path: str) -> None:
+    try:
+        os.unlink(checkpoint_path(dest_path))
+    except FileNotFoundError:
+        pass
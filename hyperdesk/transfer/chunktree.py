@@ -0,0 +1,195 @@
+"""Per-chunk digests with a Merkle root for transfer verification."""
+from __future__ import annotations
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import List, Optional, Sequence, Tuple
+
+from hyperdesk.transfer.digests import DEFAULT_ALGORITHM, new_hasher, update_zeros
+
+
+@dataclass(frozen=True)
+class ChunkTree:
+    chunk_size: int
+    digests: Tuple[str, ...]
+    root: str
+    algorithm: str = DEFAULT_ALGORITHM
+
+    @classmethod
+    def from_digests(
+        cls,
+        chunk_size: int,
+        digests: Sequence[str],
+        algorithm: str = DEFAULT_ALGORITHM,
+    ) -> "ChunkTree":
+        return cls(
+            chunk_size=chunk_size,
+            digests=tuple(digests),
+            root=merkle_root(digests, algorithm),
+            algorithm=algorithm,
+        )
+
+    @classmethod
+    def from_payload(cls, payload: dict) -> Optional["ChunkTree"]:
+        chunk_size = int(payload.get("chunk_size") or 0)
+        digests = payload.get("chunk_digests") or []
+        if not chunk_size or not payload.get("chunk_root"):
+            return None
+        if isinstance(digests, str):
+            digests = [d for d in digests.split(",") if d]
+        return cls(
+            chunk_size=chunk_size,
+            digests=tuple(digests),
+            root=payload["chunk_root"],
+            algorithm=payload.get("hash_algorithm") or DEFAULT_ALGORITHM,
+        )
+
+    def to_payload(self) -> dict:
+        return {
+            "chunk_size": self.chunk_size,
+            "chunk_root": self.root,
+            "chunk_digests": list(self.digests),
+            "hash_algorithm": self.algorithm,
+        }
+
+    def mismatched(self, other: "ChunkTree") -> List[int]:
+        """Return indices of chunks that differ from ``other``."""
+        if self.chunk_size != other.chunk_size or self.algorithm != other.algorithm:
+            return list(range(max(len(self.digests), len(other.digests))))
+        count = max(len(self.digests), len(other.digests))
+        return [
+            index
+            for index in range(count)
+            if index >= len(self.digests)
+            or index >= len(other.digests)
+            or self.digests[index] != other.digests[index]
+        ]
+
+
+class ChunkTreeBuilder:
+    """Build a chunk tree from bytes streamed in file order."""
+
+    def __init__(
+        self,
+        chunk_size: int,
+        digests: Sequence[str] = (),
+        algorithm: str = DEFAULT_ALGORITHM,
+    ) -> None:
+        self.chunk_size = chunk_size
+        self.algorithm = algorithm
+        self.digests: List[str] = list(digests)
+        self._hasher = new_hasher(algorithm)
+        self._filled = 0
+        self._zero_digest: Optional[str] = None
+
+    @property
+    def offset(self) -> int:
+        return len(self.digests) * self.chunk_size + self._filled
+
+    def update(self, data) -> None:
+        view = memoryview(data)
+        while len(view):
+            take = min(self.chunk_size - self._filled, len(view))
+            self._hasher.update(view[:take])
+            self._filled += take
+            view = view[take:]
+            if self._filled == self.chunk_size:
+                self._finish_chunk()
+
+    def update_zeros(self, length: int) -> None:
+        """Feed zeros; whole zero chunks share one cached digest."""
+        if self._filled:
+            take = min(self.chunk_size - self._filled, length)
+            update_zeros(self, take)
+            length -= take
+        whole = length // self.chunk_size
+        if whole:
+            if self._zero_digest is None:
+                hasher = new_hasher(self.algorithm)
+                update_zeros(hasher, self.chunk_size)
+                self._zero_digest = hasher.hexdigest()
+            self.digests.extend([self._zero_digest] * whole)
+            length -= whole * self.chunk_size
+        update_zeros(self, length)
+
+    def finish(self) -> ChunkTree:
+        if self._filled or not self.digests:
+            self._finish_chunk()
+        return ChunkTree.from_digests(self.chunk_size, self.digests, self.algorithm)
+
+    def _finish_chunk(self) -> None:
+        self.digests.append(self._hasher.hexdigest())
+        self._hasher = new_hasher(self.algorithm)
+        self._filled = 0
+
+
+def merkle_root(digests: Sequence[str], algorithm: str = DEFAULT_ALGORITHM) -> str:
+    """Fold leaf digests pairwise into a root; an odd node is carried up."""
+    level = [bytes.fromhex(digest) for digest in digests]
+    if not level:
+        return new_hasher(algorithm).hexdigest()
+
+    def node(left: bytes, right: bytes) -> bytes:
+        hasher = new_hasher(algorithm)
+        hasher.update(left + right)
+        return hasher.digest()
+
+    while len(level) > 1:
+        paired = [node(level[i], level[i + 1]) for i in range(0, len(level) - 1, 2)]
+        if len(level) % 2:
+            paired.append(level[-1])
+        level = paired
+    return level[0].hex()
+
+
+def hash_chunks(
+    path: str,
+    chunk_size: int,
+    indices: Sequence[int],
+    workers: int = 1,
+    length: Optional[int] = None,
+    algorithm: str = DEFAULT_ALGORITHM,
+) -> List[str]:
+    """Hash the given chunks of ``path``, spreading them across threads.
+
+    hashlib releases the GIL for large buffers, so chunks hash in parallel.
+    Only the first ``length`` bytes of the file are considered.
+    """
+    size = os.path.getsize(path) if length is None else length
+
+    def hash_one(index: int) -> str:
+        hasher = new_hasher(algorithm)
+        start = index * chunk_size
+        want = max(0, min(chunk_size, size - start))
+        with open(path, "rb", buffering=0) as handle:
+            handle.seek(start)
+            buffer = memoryview(bytearray(want))
+            count = handle.readinto(buffer) if want else 0
+            hasher.update(buffer[: count or 0])
+        return hasher.hexdigest()
+
+    if workers <= 1 or len(indices) <= 1:
+        return [hash_one(index) for index in indices]
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(hash_one, indices))
+
+
+def build_chunk_tree(
+    path: str,
+    chunk_size: int,
+    workers: int = 1,
+    length: Optional[int] = None,
+    algorithm: str = DEFAULT_ALGORITHM,
+) -> ChunkTree:
+    size = os.path.getsize(path) if length is None else length
+    count = max(1, (size + chunk_size - 1) // chunk_size)
+    digests = hash_chunks(path, chunk_size, range(count), workers, size, algorithm)
+    return ChunkTree.from_digests(chunk_size, digests, algorithm)
+
+
+def verify_chunk_tree(path: str, tree: ChunkTree, workers: int = 1) -> List[int]:
+    """Return indices of chunks in ``path`` that do not match ``tree``."""
+    indices = range(len(tree.digests))
+    actual = hash_chunks(path, tree.chunk_size, indices, workers, algorithm=tree.algorithm)
+    return [index for index, digest in zip(indices, actual) if digest != tree.digests[index]]
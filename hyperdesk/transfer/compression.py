@@ -0,0 +1,118 @@
+"""Per-frame compression for the network data channel.
+
+Each frame is compressed on its own, so the receiver can decode frames as
+they arrive and a frame that does not shrink can be sent raw without
+disturbing the ones around it.
+"""
+from __future__ import annotations
+
+import bz2
+import lzma
+import time
+import zlib
+from typing import Callable, Dict, List, Sequence, Tuple
+
+
+NO_COMPRESSION = "none"
+
+_CODECS: Dict[str, Tuple[Callable[[bytes], bytes], Callable[[bytes], bytes]]] = {
+    "zlib": (lambda data: zlib.compress(data, 6), zlib.decompress),
+    "lzma": (lambda data: lzma.compress(data, preset=1), lzma.decompress),
+    "bz2": (lambda data: bz2.compress(data, 9), bz2.decompress),
+}
+
+# Preference order used when the requested codec is not shared.
+_PREFERENCE = ("zlib", "lzma", "bz2")
+
+# Frames probed before deciding whether compression pays off, the ratio
+# (compressed / raw) above which it is bypassed, and how many bypassed
+# frames pass before probing again.
+PROBE_FRAMES = 2
+BYPASS_RATIO = 0.9
+REPROBE_INTERVAL = 32
+
+
+def supported_codecs() -> List[str]:
+    return list(_CODECS)
+
+
+def negotiate_codec(offered: Sequence[str], preferred: str) -> str:
+    if preferred == NO_COMPRESSION:
+        return NO_COMPRESSION
+    shared = [name for name in offered if name in _CODECS]
+    if preferred in shared:
+        return preferred
+    for name in _PREFERENCE:
+        if name in shared:
+            return name
+    return NO_COMPRESSION
+
+
+class AdaptiveCompressor:
+    """Compress frames while it pays off, sending incompressible data raw.
+
+    The first ``PROBE_FRAMES`` frames are always compressed. If together they
+    do not shrink below ``BYPASS_RATIO`` the compressor stops trying, and
+    re-probes one frame every ``REPROBE_INTERVAL`` frames so a file that
+    changes character part-way through (an archive with a text header, say)
+    is still handled sensibly.
+    """
+
+    def __init__(self, codec: str) -> None:
+        if codec not in _CODECS:
+            raise ValueError(f"Unsupported compression codec: {codec}")
+        self.codec = codec
+        self._compress = _CODECS[codec][0]
+        self.raw_bytes = 0
+        self.wire_bytes = 0
+        self.cpu_seconds = 0.0
+        self._probe_raw = 0
+        self._probe_wire = 0
+        self._probed = 0
+        self._bypassed = 0
+        self._bypass = False
+
+    def encode(self, data) -> Tuple[bool, bytes]:
+        """Return ``(compressed, payload)`` for one frame."""
+        self.raw_bytes += len(data)
+        if self._bypass:
+            self._bypassed += 1
+            if self._bypassed < REPROBE_INTERVAL:
+                self.wire_bytes += len(data)
+                return False, data
+            self._bypassed = 0
+        start = time.thread_time()
+        packed = self._compress(data)
+        self.cpu_seconds += time.thread_time() - start
+        self._observe(len(data), len(packed))
+        if len(packed) >= len(data):
+            self.wire_bytes += len(data)
+            return False, data
+        self.wire_bytes += len(packed)
+        return True, packed
+
+    def _observe(self, raw: int, packed: int) -> None:
+        if self._probed < PROBE_FRAMES:
+            self._probed += 1
+            self._probe_raw += raw
+            self._probe_wire += packed
+            if self._probed == PROBE_FRAMES:
+                self._bypass = self._probe_wire > self._probe_raw * BYPASS_RATIO
+            return
+        # After the probe, any frame that stops paying off bypasses again.
+        self._bypass = packed > raw * BYPASS_RATIO
+
+
+class FrameDecompressor:
+    def __init__(self, codec: str) -> None:
+        if codec not in _CODECS:
+            raise ValueError(f"Unsupported compression codec: {codec}")
+        self.codec = codec
+        self._decompress = _CODECS[codec][1]
+        self.cpu_seconds = 0.0
+
+    def decode(self, payload: bytes) -> bytes:
+        start = time.thread_time()
+        data = self._decompress(payload)
+        self.cpu_seconds += time.thread_time() - start
+        return data
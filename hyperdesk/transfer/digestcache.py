@@ -0,0 +1,78 @@
+"""Remember digests of unchanged files so sending one again skips hashing.
+
+Entries are keyed by file identity and change stamps (device, inode, size,
+mtime and ctime), so any write or replacement of the file misses the cache.
+"""
+from __future__ import annotations
+
+import os
+import threading
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from hyperdesk.transfer.chunktree import ChunkTree
+
+
+CachedDigest = Tuple[str, Optional[ChunkTree]]
+
+
+class DigestCache:
+    """Small LRU of ``(checksum, chunk_tree)`` per file and hash layout.
+
+    ``chunk_size`` is 0 for a plain digest over the whole file, otherwise
+    the chunk (or range) size of the tree whose root is the checksum.
+    """
+
+    def __init__(self, capacity: int = 4096) -> None:
+        self.capacity = capacity
+        self._entries: "OrderedDict[tuple, CachedDigest]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(
+        self, stat: os.stat_result, algorithm: str, chunk_size: int = 0
+    ) -> Optional[CachedDigest]:
+        key = _key(stat, algorithm, chunk_size)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def put(
+        self,
+        stat: os.stat_result,
+        algorithm: str,
+        chunk_size: int,
+        checksum: str,
+        tree: Optional[ChunkTree] = None,
+    ) -> None:
+        key = _key(stat, algorithm, chunk_size)
+        with self._lock:
+            self._entries[key] = (checksum, tree)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+
+
+def same_version(first: os.stat_result, second: os.stat_result) -> bool:
+    """True if both stats describe the same, unmodified file."""
+    return _key(first, "", 0) == _key(second, "", 0)
+
+
+def _key(stat: os.stat_result, algorithm: str, chunk_size: int) -> tuple:
+    return (
+        stat.st_dev,
+        stat.st_ino,
+        stat.st_size,
+        stat.st_mtime_ns,
+        stat.st_ctime_ns,
+        algorithm,
+        chunk_size or 0,
+    )
+
+
+_cache = DigestCache()
+
+
+def default_cache() -> DigestCache:
+    return _cache
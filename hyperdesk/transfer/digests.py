@@ -0,0 +1,136 @@
+"""Digest algorithms available for transfer checksums.
+
+``sha256``, ``blake2b`` and ``blake2s`` are cryptographic. ``crc32`` (and
+``xxh3_64`` when the optional ``xxhash`` package is installed) only detect
+accidental corruption and are meant for integrity-only mode on trusted links.
+"""
+from __future__ import annotations
+
+import hashlib
+import zlib
+from typing import Callable, Dict, List, Sequence
+
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
+
+
+DEFAULT_ALGORITHM = "sha256"
+
+
+class _Crc32:
+    name = "crc32"
+    digest_size = 4
+
+    def __init__(self, value: int = 0) -> None:
+        self._value = value
+
+    def update(self, data) -> None:
+        self._value = zlib.crc32(data, self._value)
+
+    def copy(self) -> "_Crc32":
+        return _Crc32(self._value)
+
+    def digest(self) -> bytes:
+        return self._value.to_bytes(4, "big")
+
+    def hexdigest(self) -> str:
+        return f"{self._value:08x}"
+
+    def state(self) -> str:
+        return self.hexdigest()
+
+    @classmethod
+    def from_state(cls, state: str) -> "_Crc32":
+        value = int(state, 16)
+        if not 0 <= value <= 0xFFFFFFFF:
+            raise ValueError(f"Invalid crc32 state: {state}")
+        return cls(value)
+
+
+_FACTORIES: Dict[str, Callable] = {
+    "sha256": hashlib.sha256,
+    "blake2b": hashlib.blake2b,
+    "blake2s": hashlib.blake2s,
+    "crc32": _Crc32,
+}
+if xxhash is not None:
+    _FACTORIES["xxh3_64"] = xxhash.xxh3_64
+
+INTEGRITY_ONLY = frozenset({"crc32", "xxh3_64"})
+
+_ZEROS = memoryview(bytes(1024 * 1024))
+
+# Preference order used when the requested algorithm is not shared.
+_PREFERENCE = ("sha256", "blake2b", "blake2s")
+
+
+def supported_algorithms() -> List[str]:
+    return list(_FACTORIES)
+
+
+def new_hasher(algorithm: str = DEFAULT_ALGORITHM):
+    try:
+        return _FACTORIES[algorithm]()
+    except KeyError:
+        raise ValueError(f"Unsupported hash algorithm: {algorithm}") from None
+
+
+def export_state(hasher) -> str:
+    """Return the running state of ``hasher`` as text, or "" if it has none
+    to give: hashlib and xxhash keep theirs internal, so only crc32 can."""
+    state = getattr(hasher, "state", None)
+    return state() if state else ""
+
+
+def restore_hasher(algorithm: str, state: str):
+    """Rebuild a hasher from ``export_state``; None if ``state`` is empty
+    or ``algorithm`` cannot be restored."""
+    restore = getattr(_FACTORIES.get(algorithm), "from_state", None)
+    if not state or restore is None:
+        return None
+    try:
+        return restore(state)
+    except ValueError:
+        return None
+
+
+def negotiate(offered: Sequence[str], preferred: str = DEFAULT_ALGORITHM) -> str:
+    """Pick the algorithm to use given what the other side supports.
+
+    The locally preferred algorithm wins when both sides have it; otherwise
+    the first shared cryptographic algorithm is used. Integrity-only
+    algorithms are never chosen implicitly.
+    """
+    shared = [name for name in offered if name in _FACTORIES]
+    if preferred in shared:
+        return preferred
+    for name in _PREFERENCE:
+        if name in shared:
+            return name
+    return DEFAULT_ALGORITHM
+
+
+def update_zeros(hasher, length: int) -> None:
+    """Feed ``length`` zero bytes, as read back from a hole, into ``hasher``."""
+    while length > 0:
+        take = min(length, len(_ZEROS))
+        hasher.update(_ZEROS[:take])
+        length -= take
+
+
+def compute_digest(
+    path: str,
+    algorithm: str = DEFAULT_ALGORITHM,
+    chunk_size: int = 1024 * 1024,
+) -> str:
+    hasher = new_hasher(algorithm)
+    buffer = memoryview(bytearray(chunk_size))
+    with open(path, "rb", buffering=0) as handle:
+        while True:
+            count = handle.readinto(buffer)
+            if not count:
+                break
+            hasher.update(buffer[:count])
+    return hasher.hexdigest()
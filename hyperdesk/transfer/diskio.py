@@ -0,0 +1,82 @@
+"""Destination preallocation, positional reads and page-cache hints.
+
+Everything here is best effort: platforms or filesystems without
+``posix_fallocate``/``posix_fadvise`` simply skip the step. The one hard
+failure is running out of space, which is reported before any data moves.
+"""
+from __future__ import annotations
+
+import errno
+import os
+import shutil
+import threading
+
+
+# Errors meaning "this filesystem cannot preallocate", not "no space".
+_UNSUPPORTED = {errno.EINVAL, errno.EOPNOTSUPP, errno.ENOSYS, errno.ENODEV}
+
+# Finished ranges are dropped from the page cache in steps of this size.
+DROP_INTERVAL = 64 * 1024 * 1024
+
+# Serializes the seek-and-read fallback of pread_into.
+_seek_lock = threading.Lock()
+
+
+def ensure_free_space(path: str, needed: int) -> None:
+    """Raise ENOSPC if the filesystem holding ``path`` lacks ``needed`` bytes."""
+    if needed <= 0:
+        return
+    directory = os.path.dirname(os.path.abspath(path))
+    free = shutil.disk_usage(directory).free
+    if free < needed:
+        raise OSError(
+            errno.ENOSPC,
+            f"Need {needed} bytes but only {free} are free",
+            directory,
+        )
+
+
+def preallocate(fd: int, offset: int, length: int) -> None:
+    """Reserve ``offset..offset+length``; this also extends the file size."""
+    if length <= 0 or not hasattr(os, "posix_fallocate"):
+        return
+    try:
+        os.posix_fallocate(fd, offset, length)
+    except OSError as exc:
+        if exc.errno not in _UNSUPPORTED:
+            raise
+
+
+def pread_into(fd: int, view: memoryview, offset: int) -> int:
+    """Positional read into ``view``; safe to share ``fd`` between threads."""
+    if hasattr(os, "preadv"):
+        return os.preadv(fd, [view], offset)
+    if hasattr(os, "pread"):
+        data = os.pread(fd, len(view), offset)
+    else:
+        # Windows has neither; the lock keeps threads sharing ``fd`` from
+        # moving its position between the seek and the read.
+        with _seek_lock:
+            os.lseek(fd, offset, os.SEEK_SET)
+            data = os.read(fd, len(view))
+    view[: len(data)] = data
+    return len(data)
+
+
+def advise_sequential(fd: int, offset: int = 0, length: int = 0) -> None:
+    _advise(fd, offset, length, "POSIX_FADV_SEQUENTIAL")
+
+
+def drop_cache(fd: int, offset: int, length: int) -> None:
+    """Tell the kernel a finished range will not be read again soon."""
+    if length > 0:
+        _advise(fd, offset, length, "POSIX_FADV_DONTNEED")
+
+
+def _advise(fd: int, offset: int, length: int, advice: str) -> None:
+    if not hasattr(os, "posix_fadvise"):
+        return
+    try:
+        os.posix_fadvise(fd, offset, length, getattr(os, advice))
+    except OSError:
+        pass
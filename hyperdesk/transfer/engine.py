@@ -1,22 +1,91 @@
 from __future__ import annotations
 
-import hashlib
+import errno
 import os
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from dataclasses import dataclass
-from typing import Callable, Optional
+from typing import BinaryIO, Callable, List, Optional
+
+from hyperdesk.transfer.checkpoint import (
+    Checkpoint,
+    clear_checkpoint,
+    load_checkpoint,
+    save_checkpoint,
+)
+from hyperdesk.transfer.chunktree import (
+    ChunkTree,
+    ChunkTreeBuilder,
+    verify_chunk_tree,
+)
+from hyperdesk.transfer.digests import (
+    DEFAULT_ALGORITHM,
+    compute_digest,
+    export_state,
+    new_hasher,
+    restore_hasher,
+)
+from hyperdesk.transfer.diskio import (
+    DROP_INTERVAL,
+    advise_sequential,
+    drop_cache,
+    ensure_free_space,
+    pread_into,
+    preallocate,
+)
+from hyperdesk.transfer.finalize import finalize, incoming_path
+from hyperdesk.transfer.sparse import hash_hole, is_sparse, next_extent
+from hyperdesk.transfer.strategies import (
+    CopyStrategy,
+    StrategyUnsupported,
+    available_strategies,
+)
+from hyperdesk.transfer.throttle import BandwidthGovernor, Throttle
 
 
 ProgressCallback = Callable[[int, int], None]
 
+CHECKPOINT_INTERVAL = 64 * 1024 * 1024
+
 
 @dataclass(frozen=True)
 class TransferResult:
     bytes_copied: int
     checksum: str
+    strategy: str = "buffered"
+    chunk_tree: Optional[ChunkTree] = None
+    hash_algorithm: str = DEFAULT_ALGORITHM
+    # Network sends only: codec used, bytes put on the wire and CPU time
+    # spent compressing.
+    compression: str = "none"
+    wire_bytes: int = 0
+    compression_seconds: float = 0.0
+    # Logical bytes that were holes in the source and never read or sent.
+    hole_bytes: int = 0
+    # Network sends only: leading bytes the receiver already held.
+    resumed_bytes: int = 0
+    # Network sends only: bytes sent again because they arrived corrupt.
+    retransmitted_bytes: int = 0
+
+    @property
+    def compression_ratio(self) -> float:
+        """Wire bytes per logical byte (1.0 when nothing was compressed)."""
+        if not self.bytes_copied or not self.wire_bytes:
+            return 1.0
+        return self.wire_bytes / self.bytes_copied
 
 
 class TransferEngine:
+    def __init__(self) -> None:
+        # Strategies that failed for a (source device, dest device) pair are
+        # not retried for later files on the same pair.
+        self._unsupported: dict[tuple[int, int], set[str]] = {}
+        # Hash states of interrupted copies, keyed by destination path, so a
+        # retry in this process does not have to rehash the partial file.
+        self._hash_states: dict[str, tuple[int, str, object]] = {}
+        self._lock = threading.Lock()
+
     def copy_with_checksum(
         self,
         source_path: str,
@@ -27,24 +96,87 @@ class TransferEngine:
         max_bandwidth: Optional[int] = None,
         retry_policy: str = "exponential",
         max_retries: int = 3,
+        workers: int = 1,
+        range_size: int = 64 * 1024 * 1024,
+        chunk_hashes: bool = False,
+        verify: bool = False,
+        hash_algorithm: str = DEFAULT_ALGORITHM,
+        governor: Optional[Throttle] = None,
+        durability: str = "file",
     ) -> TransferResult:
+        """Copy ``source_path`` to ``dest_path`` and return its checksum.
+
+        Throughput is drawn from ``governor`` (or a weighted share from
+        ``BandwidthGovernor.register``) when given, so the limit is shared
+        with every other transfer using it; otherwise
+        ``max_bandwidth`` caps this copy alone.
+
+        ``hash_algorithm`` names a digest from ``hyperdesk.transfer.digests``.
+        With ``chunk_hashes`` the checksum is the Merkle root of per-chunk
+        digests (``result.chunk_tree``) rather than one digest over the
+        whole file. Parallel copies always produce a chunk tree, with one
+        chunk per range. ``verify`` rehashes the destination chunk by chunk
+        afterwards and re-copies only the chunks that do not match.
+
+        Holes in sparse sources are skipped: they are hashed as zeros but
+        never read or written, so the destination stays sparse. Dense
+        destinations are preallocated after a free-space check; running out
+        of space fails at once instead of being retried.
+
+        Data goes to ``.incoming_<name>`` (which is also what ``resume``
+        picks up) and is renamed over ``dest_path`` once complete and
+        verified, with fsyncs according to ``durability`` (see
+        ``hyperdesk.transfer.finalize``).
+        """
+        if governor is None and max_bandwidth:
+            governor = BandwidthGovernor(max_bandwidth)
+        parallel = (
+            workers > 1
+            and hasattr(os, "pwrite")
+            and os.path.getsize(source_path) > range_size
+        )
+        work_path = incoming_path(dest_path)
         attempt = 0
         while True:
             try:
-                return self._copy_once(
-                    source_path,
-                    dest_path,
-                    chunk_size=chunk_size,
-                    resume=resume,
-                    on_progress=on_progress,
-                    max_bandwidth=max_bandwidth,
-                )
-            except Exception:
+                if parallel:
+                    result = self._copy_parallel(
+                        source_path,
+                        work_path,
+                        chunk_size=chunk_size,
+                        range_size=range_size,
+                        workers=workers,
+                        resume=resume,
+                        on_progress=on_progress,
+                        governor=governor,
+                        hash_algorithm=hash_algorithm,
+                    )
+                else:
+                    result = self._copy_once(
+                        source_path,
+                        work_path,
+                        chunk_size=chunk_size,
+                        resume=resume,
+                        on_progress=on_progress,
+                        governor=governor,
+                        chunk_hashes=chunk_hashes,
+                        hash_algorithm=hash_algorithm,
+                    )
+                if verify and result.chunk_tree:
+                    self._repair_chunks(
+                        source_path, work_path, result.chunk_tree, workers, max_retries
+                    )
+                break
+            except Exception as exc:
+                if isinstance(exc, OSError) and exc.errno == errno.ENOSPC:
+                    raise
                 attempt += 1
                 if retry_policy == "none" or attempt > max_retries:
                     raise
-                delay = _retry_delay(attempt, retry_policy)
+                delay = retry_delay(attempt, retry_policy)
                 time.sleep(delay)
+        finalize(work_path, dest_path, durability)
+        return result
 
     def _copy_once(
         self,
@@ -53,60 +185,495 @@ class TransferEngine:
         chunk_size: int,
         resume: bool,
         on_progress: Optional[ProgressCallback],
-        max_bandwidth: Optional[int],
+        governor: Optional[Throttle],
+        chunk_hashes: bool = False,
+        hash_algorithm: str = DEFAULT_ALGORITHM,
     ) -> TransferResult:
-        total_size = os.path.getsize(source_path)
+        source_stat = os.stat(source_path)
+        total_size = source_stat.st_size
         offset = 0
+        hasher = None
+        tree_builder = None
 
         if resume and os.path.exists(dest_path):
-            offset = os.path.getsize(dest_path)
-            if offset > total_size:
-                offset = 0
+            if chunk_hashes:
+                tree_builder = self._resume_tree(
+                    source_stat, dest_path, chunk_size, hash_algorithm
+                )
+                offset = tree_builder.offset
+            else:
+                offset, hasher = self._resume_point(
+                    source_stat, dest_path, chunk_size, hash_algorithm
+                )
+        if offset == 0:
+            clear_checkpoint(dest_path)
+        if chunk_hashes:
+            hasher = tree_builder = tree_builder or ChunkTreeBuilder(
+                chunk_size, algorithm=hash_algorithm
+            )
+        elif hasher is None:
+            hasher = new_hasher(hash_algorithm)
 
-        mode = "ab" if resume and offset > 0 else "wb"
+        mode = "r+b" if offset > 0 else "wb"
         bytes_copied = offset
-        start_time = time.monotonic()
-
-        with open(source_path, "rb") as source_file, open(dest_path, mode) as dest_file:
-            if offset:
-                source_file.seek(offset)
-            while True:
-                chunk = source_file.read(chunk_size)
-                if not chunk:
-                    break
-                dest_file.write(chunk)
-                bytes_copied += len(chunk)
+        last_checkpoint = offset
+        copied_by: dict[str, int] = {}
+        hole_bytes = 0
+        sparse = is_sparse(source_stat)
+        buffer = memoryview(bytearray(chunk_size))
+
+        with open(source_path, "rb", buffering=0) as source_file, open(
+            dest_path, mode, buffering=0
+        ) as dest_file:
+            if offset and sparse:
+                # Holes are never written, so nothing past the trusted prefix
+                # may survive from the earlier attempt.
+                dest_file.truncate(offset)
+            dest_fd = dest_file.fileno()
+            ensure_free_space(
+                dest_path,
+                _allocated(source_stat) - _allocated(os.fstat(dest_fd)),
+            )
+            # Checkpoint first: a preallocated file is full size on disk and
+            # must not be mistaken for a finished prefix after a crash, so it
+            # is not preallocated when the checkpoint cannot be written.
+            if (
+                not sparse
+                and total_size > offset
+                and self._save_hash_state(
+                    dest_path, source_stat, offset, hasher, hash_algorithm
+                )
+            ):
+                preallocate(dest_fd, offset, total_size - offset)
+            advise_sequential(source_file.fileno())
+            last_drop = offset
+            pair = (source_stat.st_dev, os.fstat(dest_file.fileno()).st_dev)
+            strategies = self._strategies_for(pair, buffer)
+            try:
+                while bytes_copied < total_size:
+                    if sparse:
+                        is_data, extent_end = next_extent(
+                            source_file.fileno(), bytes_copied, total_size
+                        )
+                    else:
+                        is_data, extent_end = True, total_size
+                    if is_data:
+                        length = min(chunk_size, extent_end - bytes_copied)
+                        count, strategy = self._copy_range(
+                            strategies, pair, source_file, dest_file, bytes_copied, length
+                        )
+                        if not count:
+                            break
+                        if strategy.zero_copy:
+                            # A reflink writes nothing, but the bytes never
+                            # entered Python; hash them from the source.
+                            _read_range(source_file, bytes_copied, buffer[:count])
+                        hasher.update(buffer[:count])
+                        copied_by[strategy.name] = copied_by.get(strategy.name, 0) + count
+                    else:
+                        count = extent_end - bytes_copied
+                        hash_hole(hasher, count)
+                        hole_bytes += count
+                    bytes_copied += count
+                    if bytes_copied - last_checkpoint >= CHECKPOINT_INTERVAL:
+                        self._save_hash_state(
+                            dest_path, source_stat, bytes_copied, hasher, hash_algorithm
+                        )
+                        last_checkpoint = bytes_copied
+                    if bytes_copied - last_drop >= DROP_INTERVAL:
+                        drop_cache(source_file.fileno(), last_drop, bytes_copied - last_drop)
+                        drop_cache(dest_fd, last_drop, bytes_copied - last_drop)
+                        last_drop = bytes_copied
+                    if on_progress:
+                        on_progress(bytes_copied, total_size)
+                    if governor and is_data:
+                        governor.acquire(count)
+            except BaseException:
+                if bytes_copied > last_checkpoint:
+                    self._save_hash_state(
+                        dest_path, source_stat, bytes_copied, hasher, hash_algorithm
+                    )
+                raise
+            dest_file.truncate(bytes_copied)
+
+        self._drop_hash_state(dest_path)
+        strategy_name = max(copied_by, key=copied_by.get) if copied_by else "none"
+        if tree_builder is not None:
+            tree = tree_builder.finish()
+            return TransferResult(
+                bytes_copied=bytes_copied,
+                checksum=tree.root,
+                strategy=strategy_name,
+                chunk_tree=tree,
+                hash_algorithm=hash_algorithm,
+                hole_bytes=hole_bytes,
+            )
+        return TransferResult(
+            bytes_copied=bytes_copied,
+            checksum=hasher.hexdigest(),
+            strategy=strategy_name,
+            hash_algorithm=hash_algorithm,
+            hole_bytes=hole_bytes,
+        )
+
+    def _copy_parallel(
+        self,
+        source_path: str,
+        dest_path: str,
+        chunk_size: int,
+        range_size: int,
+        workers: int,
+        resume: bool,
+        on_progress: Optional[ProgressCallback],
+        governor: Optional[Throttle],
+        hash_algorithm: str = DEFAULT_ALGORITHM,
+    ) -> TransferResult:
+        """Copy fixed-size ranges concurrently with positional I/O.
+
+        Each range is hashed by the worker that copies it and becomes one leaf
+        of the chunk tree, so no serial pass over the file is needed.
+        Completed ranges are checkpointed for resume.
+        """
+        source_stat = os.stat(source_path)
+        total_size = source_stat.st_size
+        range_count = (total_size + range_size - 1) // range_size
+        digests: dict[int, str] = {}
+
+        if resume and os.path.exists(dest_path):
+            checkpoint = load_checkpoint(dest_path)
+            if (
+                checkpoint
+                and checkpoint.matches(source_stat)
+                and checkpoint.range_size == range_size
+                and checkpoint.algorithm == hash_algorithm
+            ):
+                digests = {int(index): digest for index, digest in checkpoint.range_digests}
+        if not digests:
+            clear_checkpoint(dest_path)
+
+        flags = os.O_WRONLY | os.O_CREAT | getattr(os, "O_BINARY", 0)
+        if not digests:
+            flags |= os.O_TRUNC
+        dest_fd = os.open(dest_path, flags, 0o644)
+        try:
+            ensure_free_space(
+                dest_path, _allocated(source_stat) - _allocated(os.fstat(dest_fd))
+            )
+            if not is_sparse(source_stat):
+                preallocate(dest_fd, 0, total_size)
+            os.ftruncate(dest_fd, total_size)
+        finally:
+            os.close(dest_fd)
+
+        progress_lock = threading.Lock()
+        resumed = sum(_range_length(i, range_size, total_size) for i in digests)
+        state = {"copied": resumed, "holes": 0}
+
+        def on_chunk(count: int, hole: bool = False) -> None:
+            with progress_lock:
+                state["copied"] += count
+                if hole:
+                    state["holes"] += count
                 if on_progress:
-                    on_progress(bytes_copied, total_size)
-                _apply_rate_limit(bytes_copied, start_time, max_bandwidth)
+                    on_progress(state["copied"], total_size)
+            if governor and not hole:
+                governor.acquire(count)
 
-        checksum = compute_sha256(dest_path, chunk_size=chunk_size)
-        return TransferResult(bytes_copied=bytes_copied, checksum=checksum)
+        pending = [index for index in range(range_count) if index not in digests]
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = {
+                pool.submit(
+                    _copy_range_positional,
+                    source_path,
+                    dest_path,
+                    index * range_size,
+                    _range_length(index, range_size, total_size),
+                    chunk_size,
+                    on_chunk,
+                    hash_algorithm,
+                ): index
+                for index in pending
+            }
+            try:
+                for future in as_completed(futures):
+                    digests[futures[future]] = future.result()
+                    save_checkpoint(
+                        dest_path,
+                        Checkpoint(
+                            offset=0,
+                            source_size=total_size,
+                            source_mtime_ns=source_stat.st_mtime_ns,
+                            algorithm=hash_algorithm,
+                            range_size=range_size,
+                            range_digests=sorted([i, d] for i, d in digests.items()),
+                        ),
+                    )
+            except BaseException:
+                for future in futures:
+                    future.cancel()
+                raise
 
+        clear_checkpoint(dest_path)
+        tree = ChunkTree.from_digests(
+            range_size,
+            [digests[index] for index in range(max(range_count, 1))],
+            hash_algorithm,
+        )
+        return TransferResult(
+            bytes_copied=total_size,
+            checksum=tree.root,
+            strategy="parallel",
+            chunk_tree=tree,
+            hash_algorithm=hash_algorithm,
+            hole_bytes=state["holes"],
+        )
 
-def compute_sha256(path: str, chunk_size: int = 1024 * 1024) -> str:
-    hasher = hashlib.sha256()
-    with open(path, "rb") as handle:
+    def _resume_point(
+        self,
+        source_stat: os.stat_result,
+        dest_path: str,
+        chunk_size: int,
+        algorithm: str,
+    ):
+        """Return the resume offset and a hasher that already covers it.
+
+        The checkpoint file decides how much of the partial destination is
+        trusted; without one nothing is, since its size may be preallocated
+        rather than copied. The hash state comes from an earlier attempt in
+        this process, or from the checkpoint when the algorithm can export
+        it (crc32). hashlib digests cannot be saved across processes, so
+        for those the trusted prefix is hashed once more; chunk-hash copies
+        resume from their stored chunk digests instead (``_resume_tree``).
+        """
+        dest_size = os.path.getsize(dest_path)
+        checkpoint = load_checkpoint(dest_path)
+        if checkpoint is None:
+            offset = 0
+        elif checkpoint.matches(source_stat) and checkpoint.algorithm == algorithm:
+            offset = min(checkpoint.offset, dest_size)
+        else:
+            offset = 0
+        if offset == 0:
+            return 0, None
+
+        with self._lock:
+            saved = self._hash_states.get(dest_path)
+        if saved and saved[0] == offset and saved[1] == algorithm:
+            return offset, saved[2].copy()
+        if checkpoint.offset == offset:
+            restored = restore_hasher(algorithm, checkpoint.hash_state)
+            if restored is not None:
+                return offset, restored
+
+        hasher = new_hasher(algorithm)
+        buffer = memoryview(bytearray(min(chunk_size, offset)))
+        with open(dest_path, "rb", buffering=0) as handle:
+            position = 0
+            while position < offset:
+                view = buffer[: min(len(buffer), offset - position)]
+                count = handle.readinto(view)
+                if not count:
+                    return 0, None
+                hasher.update(view[:count])
+                position += count
+        return offset, hasher
+
+    def _resume_tree(
+        self,
+        source_stat: os.stat_result,
+        dest_path: str,
+        chunk_size: int,
+        algorithm: str,
+    ) -> ChunkTreeBuilder:
+        """Return a tree builder seeded with the trusted chunks of dest_path.
+
+        Chunk digests recorded in the checkpoint are reused without reading
+        the partial file. Without a checkpoint nothing is trusted.
+        """
+        dest_size = os.path.getsize(dest_path)
+        checkpoint = load_checkpoint(dest_path)
+        empty = ChunkTreeBuilder(chunk_size, algorithm=algorithm)
+        if (
+            checkpoint is None
+            or not checkpoint.matches(source_stat)
+            or checkpoint.range_size != chunk_size
+            or checkpoint.algorithm != algorithm
+        ):
+            return empty
+        digests = [digest for _index, digest in sorted(checkpoint.range_digests)]
+        digests = digests[: dest_size // chunk_size]
+        return ChunkTreeBuilder(chunk_size, digests, algorithm)
+
+    def _repair_chunks(
+        self,
+        source_path: str,
+        dest_path: str,
+        tree: ChunkTree,
+        workers: int,
+        max_retries: int,
+    ) -> None:
+        for _attempt in range(max_retries + 1):
+            bad = verify_chunk_tree(dest_path, tree, workers)
+            if not bad:
+                return
+            total_size = os.path.getsize(source_path)
+            for index in bad:
+                _copy_range_positional(
+                    source_path,
+                    dest_path,
+                    index * tree.chunk_size,
+                    _range_length(index, tree.chunk_size, total_size),
+                    tree.chunk_size,
+                    lambda *_args: None,
+                    tree.algorithm,
+                    skip_holes=False,
+                )
+        raise IOError(f"Chunks still corrupt after {max_retries} repairs: {bad}")
+
+    def _save_hash_state(
+        self,
+        dest_path: str,
+        source_stat: os.stat_result,
+        offset: int,
+        hasher,
+        algorithm: str,
+    ) -> bool:
+        """Checkpoint ``offset``; False if the checkpoint could not be written."""
+        if isinstance(hasher, ChunkTreeBuilder):
+            # Only whole chunks are trusted; the partial tail is recopied.
+            checkpoint = Checkpoint(
+                offset=len(hasher.digests) * hasher.chunk_size,
+                source_size=source_stat.st_size,
+                source_mtime_ns=source_stat.st_mtime_ns,
+                algorithm=algorithm,
+                range_size=hasher.chunk_size,
+                range_digests=[[i, d] for i, d in enumerate(hasher.digests)],
+            )
+        else:
+            with self._lock:
+                self._hash_states[dest_path] = (offset, algorithm, hasher.copy())
+            checkpoint = Checkpoint(
+                offset=offset,
+                source_size=source_stat.st_size,
+                source_mtime_ns=source_stat.st_mtime_ns,
+                algorithm=algorithm,
+                hash_state=export_state(hasher),
+            )
+        try:
+            save_checkpoint(dest_path, checkpoint)
+        except OSError:
+            return False
+        return True
+
+    def _drop_hash_state(self, dest_path: str) -> None:
+        with self._lock:
+            self._hash_states.pop(dest_path, None)
+        clear_checkpoint(dest_path)
+
+    def _strategies_for(self, pair: tuple[int, int], buffer: memoryview) -> List[CopyStrategy]:
+        skipped = self._unsupported.get(pair, set())
+        return [
+            s for s in available_strategies(buffer, hashed=True) if s.name not in skipped
+        ]
+
+    def _copy_range(
+        self,
+        strategies: List[CopyStrategy],
+        pair: tuple[int, int],
+        source_file: BinaryIO,
+        dest_file: BinaryIO,
+        offset: int,
+        length: int,
+    ) -> tuple[int, CopyStrategy]:
         while True:
-            chunk = handle.read(chunk_size)
-            if not chunk:
-                break
-            hasher.update(chunk)
+            strategy = strategies[0]
+            try:
+                return strategy.copy_range(source_file, dest_file, offset, length), strategy
+            except StrategyUnsupported:
+                if len(strategies) == 1:
+                    raise
+                strategies.pop(0)
+                if offset == 0:
+                    # Failures at later offsets can be alignment-specific
+                    # (reflink on a resumed file), so only remember clean ones.
+                    self._unsupported.setdefault(pair, set()).add(strategy.name)
+
+
+def compute_sha256(path: str, chunk_size: int = 1024 * 1024) -> str:
+    return compute_digest(path, "sha256", chunk_size)
+
+
+def _copy_range_positional(
+    source_path: str,
+    dest_path: str,
+    offset: int,
+    length: int,
+    chunk_size: int,
+    on_chunk: Callable[..., None],
+    algorithm: str = DEFAULT_ALGORITHM,
+    skip_holes: bool = True,
+) -> str:
+    """Copy one range with pread/pwrite and return its digest.
+
+    Source holes are left unwritten, which relies on the destination range
+    already reading back as zeros; repairs pass ``skip_holes=False``.
+    """
+    hasher = new_hasher(algorithm)
+    buffer = memoryview(bytearray(min(chunk_size, length)))
+    source_fd = os.open(source_path, os.O_RDONLY)
+    dest_fd = os.open(dest_path, os.O_WRONLY)
+    try:
+        advise_sequential(source_fd, offset, length)
+        sparse = skip_holes and is_sparse(os.fstat(source_fd))
+        position = offset
+        end = offset + length
+        while position < end:
+            extent_end = end
+            if sparse:
+                is_data, extent_end = next_extent(source_fd, position, end)
+                if not is_data:
+                    hash_hole(hasher, extent_end - position)
+                    on_chunk(extent_end - position, True)
+                    position = extent_end
+                    continue
+            view = buffer[: min(len(buffer), extent_end - position)]
+            count = pread_into(source_fd, view, position)
+            if not count:
+                raise IOError("Source file shrank during copy")
+            written = 0
+            while written < count:
+                written += os.pwrite(dest_fd, view[written:count], position + written)
+            hasher.update(view[:count])
+            position += count
+            on_chunk(count)
+        drop_cache(source_fd, offset, length)
+        drop_cache(dest_fd, offset, length)
+    finally:
+        os.close(source_fd)
+        os.close(dest_fd)
     return hasher.hexdigest()
 
 
-def _apply_rate_limit(bytes_copied: int, start_time: float, max_bandwidth: Optional[int]) -> None:
-    if not max_bandwidth:
-        return
-    elapsed = time.monotonic() - start_time
-    if elapsed <= 0:
-        return
-    expected_time = bytes_copied / max_bandwidth
-    if expected_time > elapsed:
-        time.sleep(expected_time - elapsed)
+def _allocated(stat: os.stat_result) -> int:
+    blocks = getattr(stat, "st_blocks", None)
+    return stat.st_size if blocks is None else blocks * 512
+
+
+def _range_length(index: int, range_size: int, total_size: int) -> int:
+    return min(range_size, total_size - index * range_size)
+
+
+def _read_range(handle: BinaryIO, offset: int, view: memoryview) -> None:
+    handle.seek(offset)
+    position = 0
+    while position < len(view):
+        count = handle.readinto(view[position:])
+        if not count:
+            raise IOError("Source file shrank during copy")
+        position += count
 
 
-def _retry_delay(attempt: int, policy: str) -> float:
+def retry_delay(attempt: int, policy: str) -> float:
     if policy == "linear":
         return min(1.0 * attempt, 10.0)
     return min(0.5 * (2**attempt), 10.0)
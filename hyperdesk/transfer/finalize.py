@@ -0,0 +1,173 @@
+"""Crash-safe publication of finished transfers.
+
+Data is written to ``.incoming_<name>`` next to the destination and renamed
+over it only when complete, so the final name never holds a partial file.
+
+Durability modes:
+
+``none``
+    Rename only. Fast, but a crash can lose recently finished files.
+``file``
+    fsync the file before the rename and its directory after it.
+``batch``
+    Group commit: concurrent finishers are fsynced and renamed together by
+    whichever caller arrives first. The batch's files are fsynced at the
+    same time, which journaling filesystems serve with shared journal
+    commits and cache flushes, and each directory is fsynced once per
+    batch. Every caller still returns only once its own file is durable.
+"""
+from __future__ import annotations
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+
+from hyperdesk.transfer.checkpoint import CHECKPOINT_SUFFIX
+
+
+INCOMING_PREFIX = ".incoming_"
+DURABILITY_MODES = ("none", "file", "batch")
+
+# Files of one batch fsynced at the same time.
+SYNC_WORKERS = 8
+
+
+def incoming_path(dest_path: str) -> str:
+    directory, name = os.path.split(dest_path)
+    return os.path.join(directory, f"{INCOMING_PREFIX}{name}")
+
+
+def is_transient(name: str) -> bool:
+    """True for in-progress files and checkpoints the watcher should ignore."""
+    return name.startswith(INCOMING_PREFIX) or CHECKPOINT_SUFFIX in name
+
+
+def finalize(
+    temp_path: str,
+    dest_path: str,
+    durability: str = "file",
+    committer: Optional["GroupCommitter"] = None,
+) -> None:
+    if durability == "batch":
+        (committer or _default_committer()).commit(temp_path, dest_path)
+    elif durability == "file":
+        _fsync_path(temp_path)
+        os.replace(temp_path, dest_path)
+        _fsync_dir(os.path.dirname(os.path.abspath(dest_path)))
+    elif durability == "none":
+        os.replace(temp_path, dest_path)
+    else:
+        raise ValueError(f"Unknown durability mode: {durability}")
+
+
+class _Entry:
+    def __init__(self, temp_path: str, dest_path: str) -> None:
+        self.temp_path = temp_path
+        self.dest_path = dest_path
+        self.done = False
+        self.error: Optional[BaseException] = None
+
+
+class GroupCommitter:
+    """Amortize fsync latency over files that finish at about the same time.
+
+    The first caller with nothing in flight becomes the leader: it waits up
+    to ``window`` seconds (or until ``max_batch`` files are queued), then
+    commits everything queued. Callers arriving meanwhile just wait. Each
+    file still gets its own fsync; the batch issues them concurrently so the
+    filesystem can share one journal commit and cache flush between them.
+    """
+
+    def __init__(self, window: float = 0.01, max_batch: int = 64) -> None:
+        self.window = window
+        self.max_batch = max_batch
+        self._cond = threading.Condition(threading.Lock())
+        self._pending: List[_Entry] = []
+        self._flushing = False
+
+    def commit(self, temp_path: str, dest_path: str) -> None:
+        entry = _Entry(temp_path, dest_path)
+        with self._cond:
+            self._pending.append(entry)
+            if len(self._pending) >= self.max_batch:
+                self._cond.notify_all()
+            while not entry.done:
+                if self._flushing:
+                    self._cond.wait()
+                    continue
+                self._flushing = True
+                self._cond.wait_for(
+                    lambda: len(self._pending) >= self.max_batch, self.window
+                )
+                batch, self._pending = self._pending, []
+                self._cond.release()
+                try:
+                    self._flush(batch)
+                finally:
+                    self._cond.acquire()
+                    self._flushing = False
+                    self._cond.notify_all()
+        if entry.error:
+            raise entry.error
+
+    def _flush(self, batch: List[_Entry]) -> None:
+        with ThreadPoolExecutor(max_workers=min(len(batch), SYNC_WORKERS)) as pool:
+            synced = list(pool.map(_sync_entry, batch))
+        directories = set()
+        for entry, ok in zip(batch, synced):
+            if not ok:
+                continue
+            try:
+                os.replace(entry.temp_path, entry.dest_path)
+                directories.add(os.path.dirname(os.path.abspath(entry.dest_path)))
+            except OSError as exc:
+                entry.error = exc
+        for directory in directories:
+            _fsync_dir(directory)
+        for entry in batch:
+            entry.done = True
+
+
+def _sync_entry(entry: _Entry) -> bool:
+    try:
+        _fsync_path(entry.temp_path)
+    except OSError as exc:
+        entry.error = exc
+        return False
+    return True
+
+
+_committer: Optional[GroupCommitter] = None
+_committer_lock = threading.Lock()
+
+
+def _default_committer() -> GroupCommitter:
+    global _committer
+    with _committer_lock:
+        if _committer is None:
+            _committer = GroupCommitter()
+        return _committer
+
+
+def _fsync_path(path: str) -> None:
+    fd = os.open(path, os.O_RDWR | getattr(os, "O_BINARY", 0))
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _fsync_dir(directory: str) -> None:
+    # Directories cannot be opened for fsync on Windows; the rename itself
+    # is still atomic there.
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
@@ -0,0 +1,50 @@
+"""Hole detection for sparse files.
+
+Holes read back as zeros, so they are skipped when copying and hashed as
+zeros, and checksums still cover the logical contents of the file.
+"""
+from __future__ import annotations
+
+import errno
+import os
+from typing import Tuple
+
+from hyperdesk.transfer.chunktree import ChunkTreeBuilder
+from hyperdesk.transfer.digests import update_zeros
+
+
+SEEK_DATA = getattr(os, "SEEK_DATA", None)
+SEEK_HOLE = getattr(os, "SEEK_HOLE", None)
+
+
+def is_sparse(stat: os.stat_result) -> bool:
+    """Cheap pre-check: fewer blocks allocated than the size needs."""
+    blocks = getattr(stat, "st_blocks", None)
+    return SEEK_DATA is not None and blocks is not None and blocks * 512 < stat.st_size
+
+
+def next_extent(fd: int, offset: int, end: int) -> Tuple[bool, int]:
+    """Return ``(is_data, extent_end)`` for the extent starting at ``offset``.
+
+    Filesystems without hole support report the whole range as data.
+    """
+    try:
+        data = os.lseek(fd, offset, SEEK_DATA)
+    except OSError as exc:
+        if exc.errno == errno.ENXIO:
+            return False, end
+        return True, end
+    if data > offset:
+        return False, min(data, end)
+    try:
+        hole = os.lseek(fd, offset, SEEK_HOLE)
+    except OSError:
+        return True, end
+    return True, min(hole, end)
+
+
+def hash_hole(hasher, length: int) -> None:
+    if isinstance(hasher, ChunkTreeBuilder):
+        hasher.update_zeros(length)
+    else:
+        update_zeros(hasher, length)
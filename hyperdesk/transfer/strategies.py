@@ -0,0 +1,164 @@
+"""Copy strategies used by the local transfer engine.
+
+Each strategy copies one byte range from a source file to the same offset in
+a destination file. Kernel-side strategies never pull the bytes into Python;
+the buffered strategy is the portable fallback.
+"""
+from __future__ import annotations
+
+import errno
+import os
+import struct
+import sys
+from typing import BinaryIO, List
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None
+
+
+FICLONERANGE = 0x4020940D
+
+# Errors meaning "this strategy does not work for this file pair", as opposed
+# to a genuine I/O failure that should surface to the retry policy.
+UNSUPPORTED_ERRNOS = {
+    errno.EXDEV,
+    errno.EINVAL,
+    errno.ENOSYS,
+    errno.EOPNOTSUPP,
+    errno.ENOTTY,
+    errno.EBADF,
+    errno.EPERM,
+}
+
+
+class StrategyUnsupported(Exception):
+    pass
+
+
+class CopyStrategy:
+    name = "buffered"
+    zero_copy = False
+    # True if the destination shares the source's extents instead of
+    # getting its own copy of the bytes.
+    shares_extents = False
+
+    def copy_range(self, source: BinaryIO, dest: BinaryIO, offset: int, length: int) -> int:
+        raise NotImplementedError
+
+
+class ReflinkCopy(CopyStrategy):
+    """Share extents on copy-on-write filesystems (btrfs, XFS, bcachefs)."""
+
+    name = "reflink"
+    zero_copy = True
+    shares_extents = True
+
+    def copy_range(self, source: BinaryIO, dest: BinaryIO, offset: int, length: int) -> int:
+        request = struct.pack("=qQQQ", source.fileno(), offset, length, offset)
+        try:
+            fcntl.ioctl(dest.fileno(), FICLONERANGE, request)
+        except OSError as exc:
+            if exc.errno in UNSUPPORTED_ERRNOS:
+                raise StrategyUnsupported(str(exc)) from exc
+            raise
+        return length
+
+
+class CopyFileRangeCopy(CopyStrategy):
+    name = "copy_file_range"
+    zero_copy = True
+
+    def copy_range(self, source: BinaryIO, dest: BinaryIO, offset: int, length: int) -> int:
+        copied = 0
+        while copied < length:
+            try:
+                count = os.copy_file_range(
+                    source.fileno(),
+                    dest.fileno(),
+                    length - copied,
+                    offset + copied,
+                    offset + copied,
+                )
+            except OSError as exc:
+                if exc.errno in UNSUPPORTED_ERRNOS and copied == 0:
+                    raise StrategyUnsupported(str(exc)) from exc
+                raise
+            if count == 0:
+                # Some pseudo filesystems report EOF instead of failing.
+                if copied == 0:
+                    raise StrategyUnsupported("copy_file_range returned 0")
+                break
+            copied += count
+        return copied
+
+
+class SendfileCopy(CopyStrategy):
+    name = "sendfile"
+    zero_copy = True
+
+    def copy_range(self, source: BinaryIO, dest: BinaryIO, offset: int, length: int) -> int:
+        os.lseek(dest.fileno(), offset, os.SEEK_SET)
+        copied = 0
+        while copied < length:
+            try:
+                count = os.sendfile(dest.fileno(), source.fileno(), offset + copied, length - copied)
+            except OSError as exc:
+                if exc.errno in UNSUPPORTED_ERRNOS and copied == 0:
+                    raise StrategyUnsupported(str(exc)) from exc
+                raise
+            if count == 0:
+                if copied == 0:
+                    raise StrategyUnsupported("sendfile returned 0")
+                break
+            copied += count
+        return copied
+
+
+class BufferedCopy(CopyStrategy):
+    """Read into a caller-owned buffer and write it back out.
+
+    The copied bytes stay in ``buffer[:count]`` so the caller can hash them
+    without reading the range again.
+    """
+
+    name = "buffered"
+    zero_copy = False
+
+    def __init__(self, buffer: memoryview) -> None:
+        self.buffer = buffer
+
+    def copy_range(self, source: BinaryIO, dest: BinaryIO, offset: int, length: int) -> int:
+        view = self.buffer[:length]
+        source.seek(offset)
+        count = source.readinto(view)
+        if not count:
+            return 0
+        dest.seek(offset)
+        written = 0
+        while written < count:
+            written += dest.write(view[written:count])
+        return count
+
+
+def available_strategies(buffer: memoryview, hashed: bool = False) -> List[CopyStrategy]:
+    """Return the strategies usable on this platform, fastest first.
+
+    With ``hashed`` the caller reads every copied range back to hash it, so
+    a kernel-side copy saves nothing over the buffered copy that has the
+    bytes in hand already; only reflink, which writes no data at all, is
+    kept ahead of it.
+    """
+    strategies: List[CopyStrategy] = []
+    if sys.platform.startswith("linux"):
+        if fcntl is not None:
+            strategies.append(ReflinkCopy())
+        if hasattr(os, "copy_file_range"):
+            strategies.append(CopyFileRangeCopy())
+        if hasattr(os, "sendfile"):
+            strategies.append(SendfileCopy())
+    if hashed:
+        strategies = [strategy for strategy in strategies if strategy.shares_extents]
+    strategies.append(BufferedCopy(buffer))
+    return strategies
@@ -0,0 +1,102 @@
+"""Range scheduling for striped network transfers."""
+from __future__ import annotations
+
+import threading
+import time
+from collections import deque
+from typing import Deque, Optional
+
+
+# Relative throughput change that counts as a real gain or loss.
+GAIN_THRESHOLD = 0.05
+# Intervals to hold a stream count after reverting a step before probing.
+HOLD_INTERVALS = 4
+
+
+class StripeScheduler:
+    """Hand out ranges to stream workers and adapt how many stay active.
+
+    All ``max_streams`` connections are opened up front; workers with an
+    index at or above ``active`` park between ranges. Every ``interval``
+    seconds the aggregate rate is compared with the previous interval and
+    the active count hill-climbs: a stream that was added stays only if it
+    raised throughput, a stream that was removed comes back if throughput
+    fell, and after settling the scheduler probes upwards again.
+    """
+
+    def __init__(
+        self,
+        range_count: int,
+        max_streams: int,
+        initial: int = 2,
+        interval: float = 1.0,
+        first: int = 0,
+    ) -> None:
+        self.max_streams = max(1, max_streams)
+        self.active = max(1, min(initial, self.max_streams))
+        self.peak = self.active
+        self.interval = interval
+        self._cond = threading.Condition()
+        # Ranges below ``first`` are already held by the receiver.
+        self._pending: Deque[int] = deque(range(first, range_count))
+        self._window_bytes = 0
+        self._window_start = time.monotonic()
+        self._last_rate: Optional[float] = None
+        self._last_step = 0
+        self._hold = 0
+
+    def next_range(self, worker: int) -> Optional[int]:
+        """Block while ``worker`` is parked; None once every range is taken."""
+        with self._cond:
+            while self._pending and worker >= self.active:
+                self._cond.wait()
+            if not self._pending:
+                self._cond.notify_all()
+                return None
+            return self._pending.popleft()
+
+    def cancel(self) -> None:
+        """Hand out no more ranges, releasing parked workers."""
+        with self._cond:
+            self._pending.clear()
+            self._cond.notify_all()
+
+    def record(self, count: int) -> None:
+        with self._cond:
+            self._window_bytes += count
+            now = time.monotonic()
+            elapsed = now - self._window_start
+            if elapsed < self.interval:
+                return
+            rate = self._window_bytes / elapsed
+            self._window_bytes = 0
+            self._window_start = now
+            self._adjust(rate)
+            self._cond.notify_all()
+
+    def _adjust(self, rate: float) -> None:
+        previous, self._last_rate = self._last_rate, rate
+        if previous is None:
+            step = 1
+        elif self._last_step > 0:
+            step = 1 if rate > previous * (1 + GAIN_THRESHOLD) else -1
+            if step < 0:
+                self._hold = HOLD_INTERVALS
+        elif self._last_step < 0:
+            step = 1 if rate < previous * (1 - GAIN_THRESHOLD) else -1
+            if step > 0:
+                self._hold = HOLD_INTERVALS
+        elif self._hold:
+            self._hold -= 1
+            step = 0
+        else:
+            step = 1
+        if self._last_step and step == -self._last_step:
+            # Undo the last step and settle there before probing again.
+            self.active += step
+            self._last_step = 0
+        else:
+            target = min(self.max_streams, max(1, self.active + step))
+            self._last_step = target - self.active
+            self.active = target
+        self.peak = max(self.peak, self.active)
@@ -0,0 +1,233 @@
+"""Process-wide bandwidth governor shared by all transfers."""
+from __future__ import annotations
+
+import asyncio
+import heapq
+import itertools
+import threading
+import time
+from collections import deque
+from typing import Deque, List, Optional, Tuple, Union
+
+
+# Relative bandwidth shares per priority class when the link is contended.
+PRIORITY_WEIGHTS = {
+    "interactive": 8.0,
+    "normal": 4.0,
+    "bulk": 1.0,
+}
+
+
+class BandwidthShare:
+    """One job's handle on the governor, with its own weight."""
+
+    def __init__(self, governor: "BandwidthGovernor", name: str, weight: float) -> None:
+        self.governor = governor
+        self.name = name
+        self.weight = weight
+        self.finish_tag = 0.0
+
+    def acquire(self, count: int) -> None:
+        self.governor._acquire(count, self)
+
+    async def acquire_async(self, count: int) -> None:
+        await self.governor._acquire_async(count, self)
+
+    def close(self) -> None:
+        self.governor.unregister(self)
+
+    def __enter__(self) -> "BandwidthShare":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+class BandwidthGovernor:
+    """Token bucket that every transfer draws from.
+
+    Tokens refill at ``rate`` bytes per second up to ``burst``. A caller may
+    overdraw the bucket by one chunk; later callers then wait until the debt
+    is repaid, so the long-run rate holds without splitting chunks. Because
+    the bucket never holds more than ``burst``, an idle period cannot be
+    "caught up" with a large burst afterwards.
+
+    When jobs contend for tokens they are served by self-clocked weighted
+    fair queuing rather than first come, first served: each request gets a
+    finish tag of ``max(virtual_time, previous tag) + bytes / weight`` and
+    the lowest tag goes next. Jobs obtain a weighted handle from
+    ``register``; plain ``acquire`` uses the "normal" weight.
+
+    With no rate the governor does not block but still measures throughput.
+    Coroutines use ``acquire_async``, which waits its turn on the event
+    loop instead of blocking a thread.
+    """
+
+    def __init__(
+        self,
+        rate: Optional[int] = None,
+        burst: Optional[int] = None,
+        window: float = 2.0,
+    ) -> None:
+        self._cond = threading.Condition()
+        self._window = window
+        self._samples: Deque[Tuple[float, int]] = deque()
+        self._window_bytes = 0
+        self.rate: Optional[int] = None
+        self.burst = 0
+        self._tokens = 0.0
+        self._updated = time.monotonic()
+        self._virtual_time = 0.0
+        self._queue: List[Tuple[float, int]] = []
+        self._sequence = itertools.count()
+        self._shares: dict[str, BandwidthShare] = {}
+        # Coroutines waiting in acquire_async, woken like the condition.
+        self._async_waiters: dict[asyncio.Event, asyncio.AbstractEventLoop] = {}
+        self._default = BandwidthShare(self, "default", PRIORITY_WEIGHTS["normal"])
+        self.set_limit(rate, burst)
+
+    def register(
+        self,
+        name: str,
+        priority: str = "normal",
+        weight: Optional[float] = None,
+    ) -> BandwidthShare:
+        if weight is None:
+            weight = PRIORITY_WEIGHTS.get(priority, PRIORITY_WEIGHTS["normal"])
+        share = BandwidthShare(self, name, weight)
+        with self._cond:
+            self._shares[name] = share
+        return share
+
+    def unregister(self, share: BandwidthShare) -> None:
+        with self._cond:
+            if self._shares.get(share.name) is share:
+                del self._shares[share.name]
+
+    def active_shares(self) -> dict[str, float]:
+        with self._cond:
+            return {name: share.weight for name, share in self._shares.items()}
+
+    def set_limit(self, rate: Optional[int], burst: Optional[int] = None) -> None:
+        """Change the limit; waiting transfers pick it up immediately."""
+        with self._cond:
+            self._refill()
+            self.rate = rate or None
+            self.burst = burst or (rate or 0)
+            self._tokens = min(self._tokens, float(self.burst))
+            self._notify()
+
+    def acquire(self, count: int) -> None:
+        self._acquire(count, self._default)
+
+    async def acquire_async(self, count: int) -> None:
+        await self._acquire_async(count, self._default)
+
+    def _acquire(self, count: int, share: BandwidthShare) -> None:
+        with self._cond:
+            self._record(count)
+            if not self.rate:
+                return
+            ticket = self._enqueue(count, share)
+            try:
+                while self.rate:
+                    self._refill()
+                    if self._queue[0] == ticket:
+                        if self._tokens > 0:
+                            self._tokens -= count
+                            break
+                        self._cond.wait(-self._tokens / self.rate)
+                    else:
+                        self._cond.wait()
+            finally:
+                self._dequeue(ticket)
+
+    async def _acquire_async(self, count: int, share: BandwidthShare) -> None:
+        # A coroutine cannot wait on the condition, so it waits on an event
+        # that everything notifying the condition sets as well.
+        wakeup = asyncio.Event()
+        with self._cond:
+            self._record(count)
+            if not self.rate:
+                return
+            ticket = self._enqueue(count, share)
+            self._async_waiters[wakeup] = asyncio.get_running_loop()
+        try:
+            while True:
+                with self._cond:
+                    if not self.rate:
+                        return
+                    self._refill()
+                    delay = None
+                    if self._queue[0] == ticket:
+                        if self._tokens > 0:
+                            self._tokens -= count
+                            return
+                        delay = -self._tokens / self.rate
+                    wakeup.clear()
+                try:
+                    await asyncio.wait_for(wakeup.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            with self._cond:
+                del self._async_waiters[wakeup]
+                self._dequeue(ticket)
+
+    def _enqueue(self, count: int, share: BandwidthShare) -> Tuple[float, int]:
+        # Caller holds the condition.
+        tag = max(self._virtual_time, share.finish_tag) + count / share.weight
+        share.finish_tag = tag
+        ticket = (tag, next(self._sequence))
+        heapq.heappush(self._queue, ticket)
+        return ticket
+
+    def _dequeue(self, ticket: Tuple[float, int]) -> None:
+        # Caller holds the condition.
+        if self._queue[0] == ticket:
+            heapq.heappop(self._queue)
+        else:
+            self._queue.remove(ticket)
+            heapq.heapify(self._queue)
+        self._virtual_time = max(self._virtual_time, ticket[0])
+        self._notify()
+
+    def _notify(self) -> None:
+        # Caller holds the condition.
+        self._cond.notify_all()
+        for wakeup, loop in self._async_waiters.items():
+            loop.call_soon_threadsafe(wakeup.set)
+
+    def measured_rate(self) -> float:
+        """Bytes per second moved through the governor over the window."""
+        with self._cond:
+            self._expire(time.monotonic())
+            return self._window_bytes / self._window
+
+    def utilization(self) -> Optional[float]:
+        """Measured rate as a fraction of the limit, or None when unlimited."""
+        rate = self.rate
+        if not rate:
+            return None
+        return self.measured_rate() / rate
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        if self.rate:
+            self._tokens = min(
+                float(self.burst), self._tokens + (now - self._updated) * self.rate
+            )
+        self._updated = now
+
+    def _record(self, count: int) -> None:
+        now = time.monotonic()
+        self._samples.append((now, count))
+        self._window_bytes += count
+        self._expire(now)
+
+    def _expire(self, now: float) -> None:
+        while self._samples and now - self._samples[0][0] > self._window:
+            self._window_bytes -= self._samples.popleft()[1]
+
+
+Throttle = Union[BandwidthGovernor, BandwidthShare]
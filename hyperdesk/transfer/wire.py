@@ -0,0 +1,395 @@
+"""Framing for the network data channel.
+
+A stream starts with the file header (name, logical size, flags) and is
+followed by frames, each with a fixed header of type, file offset, raw
+length, wire length and the CRC-32 of the payload, and ends with an END
+frame whose payload is the sender's checksum of the whole file. A HOLE
+frame has no payload and stands for ``raw_len`` zero bytes. Because every
+frame says where it belongs, ranges of one file can travel over several
+connections.
+
+Receivers answer on the same connection: RETRANSMIT asks for the frame at
+``offset`` (``raw_len`` bytes) again because its payload failed the CRC,
+ABORT gives up on the transfer, and END accepts it once every frame is
+intact and the END checksum matched.
+
+When the header (or OPEN frame) carries the RESUME flag, the receiver
+answers with the number of leading bytes it already holds and has verified
+against a checkpoint of an earlier attempt, and frames start from there.
+
+A session data connection multiplexes many files instead: its frames carry
+a stream id in front of the same fields, each stream opens with an OPEN
+frame whose JSON payload replaces the file header, and ends with END (or
+ABORT if the sender gave up). Stream 0 is reserved for the HELLO frame that
+authenticates the connection.
+
+Receivers read frames with a ``FrameReader``, which fills buffers borrowed
+from a shared pool with ``recv_into`` so steady-state reads allocate
+nothing, and on Linux can splice DATA payloads straight into the file.
+Senders never put more than their chunk size in one frame, which they
+announce as ``frame_size``; readers refuse larger payloads before
+allocating anything for them.
+"""
+from __future__ import annotations
+
+import json
+import os
+import socket
+import ssl
+import struct
+import threading
+import zlib
+from typing import List, Optional, Tuple
+
+
+FRAME_DATA = 0
+FRAME_COMPRESSED = 1
+FRAME_HOLE = 2
+FRAME_OPEN = 3
+FRAME_ABORT = 4
+FRAME_HELLO = 5
+FRAME_RESUME = 6
+FRAME_RETRANSMIT = 7
+FRAME_END = 0xFF
+
+# Header flag: the source is sparse, so HOLE frames will follow and the
+# receiver should not preallocate the destination.
+HEADER_SPARSE = 0x01
+# Header flag: the receiver must reply with its resume offset before any
+# frames are sent.
+HEADER_RESUME = 0x02
+
+_FRAME = struct.Struct("!BQIII")
+_MUX_FRAME = struct.Struct("!IBQIII")
+FRAME_HEADER_SIZE = _FRAME.size
+MAX_FRAME_LENGTH = 0xFFFFFFFF
+
+# Largest payload of a frame without file data (HELLO, OPEN, END, replies),
+# and the slack readers allow on top of the sender's chunk size.
+CONTROL_PAYLOAD_LIMIT = 64 * 1024
+# Largest chunk size the transfer settings offer; the frame size assumed
+# when the sender did not announce one.
+MAX_CHUNK_SIZE = 512 * 1024 * 1024
+
+
+_OFFSET = struct.Struct("!Q")
+OFFSET_SIZE = _OFFSET.size
+
+# Capacity of the pipe a spliced payload passes through.
+SPLICE_PIPE_SIZE = 1024 * 1024
+
+
+def pack_header(name: str, size: int, flags: int = 0, mtime_ns: int = 0) -> bytes:
+    """``mtime_ns`` lets the receiver tell whether a partial file is current."""
+    name_bytes = name.encode("utf-8")
+    return (
+        struct.pack("!I", len(name_bytes))
+        + name_bytes
+        + struct.pack("!QBQ", size, flags, mtime_ns)
+    )
+
+
+def read_header(conn: socket.socket) -> Tuple[str, int, int, int]:
+    (name_len,) = struct.unpack("!I", recv_exact(conn, 4))
+    name = recv_exact(conn, name_len).decode("utf-8")
+    size, flags, mtime_ns = struct.unpack("!QBQ", recv_exact(conn, 17))
+    return name, size, flags, mtime_ns
+
+
+def send_offset(conn: socket.socket, offset: int) -> None:
+    conn.sendall(_OFFSET.pack(offset))
+
+
+def read_offset(conn: socket.socket) -> int:
+    return unpack_offset(recv_exact(conn, OFFSET_SIZE))
+
+
+def unpack_offset(data) -> int:
+    (offset,) = _OFFSET.unpack(data)
+    return offset
+
+
+def payload_limit(frame_size: int = 0) -> int:
+    """Largest payload to accept from a sender announcing ``frame_size``."""
+    if not 0 < frame_size <= MAX_CHUNK_SIZE:
+        frame_size = MAX_CHUNK_SIZE
+    return frame_size + CONTROL_PAYLOAD_LIMIT
+
+
+def payload_crc(payload) -> int:
+    return zlib.crc32(payload)
+
+
+def frame_header(
+    kind: int, offset: int, raw_len: int, wire_len: int, crc: int = 0
+) -> bytes:
+    """The fixed header in front of a ``wire_len`` byte payload."""
+    return _FRAME.pack(kind, offset, raw_len, wire_len, crc)
+
+
+def parse_frame_header(data) -> Tuple[int, int, int, int, int]:
+    """``(kind, offset, raw_len, wire_len, crc)`` of a ``FRAME_HEADER_SIZE`` header."""
+    return _FRAME.unpack(data)
+
+
+def send_frame(
+    conn: socket.socket,
+    kind: int,
+    offset: int,
+    raw_len: int,
+    payload=b"",
+    crc: Optional[int] = None,
+) -> None:
+    """``crc`` is computed from ``payload`` unless the caller already has it."""
+    if crc is None:
+        crc = payload_crc(payload)
+    conn.sendall(frame_header(kind, offset, raw_len, len(payload), crc))
+    if len(payload):
+        conn.sendall(payload)
+
+
+def send_file_frame(
+    conn: socket.socket, handle, offset: int, count: int, crc: int
+) -> None:
+    """Send ``count`` bytes of ``handle`` at ``offset`` as a DATA frame.
+
+    The payload goes from the page cache to the socket with sendfile where
+    the platform has it, without passing through Python; ``crc`` is its
+    checksum, which the caller computed when it hashed the window.
+    """
+    conn.sendall(frame_header(FRAME_DATA, offset, count, count, crc))
+    _sendfile_exact(conn, handle, offset, count)
+
+
+def read_frame(
+    conn: socket.socket, max_payload: int = CONTROL_PAYLOAD_LIMIT
+) -> Tuple[int, int, int, bytes]:
+    """Read one frame, failing the connection if its payload is corrupt."""
+    kind, offset, raw_len, wire_len, crc = _FRAME.unpack(recv_exact(conn, _FRAME.size))
+    check_payload_length(wire_len, max_payload)
+    payload = recv_exact(conn, wire_len) if wire_len else b""
+    _check_crc(payload, crc)
+    return kind, offset, raw_len, payload
+
+
+def send_mux_frame(
+    conn: socket.socket,
+    stream_id: int,
+    kind: int,
+    offset: int,
+    raw_len: int,
+    payload=b"",
+    crc: Optional[int] = None,
+) -> None:
+    if crc is None:
+        crc = payload_crc(payload)
+    conn.sendall(_MUX_FRAME.pack(stream_id, kind, offset, raw_len, len(payload), crc))
+    if len(payload):
+        conn.sendall(payload)
+
+
+def send_mux_file_frame(
+    conn: socket.socket, stream_id: int, handle, offset: int, count: int, crc: int
+) -> None:
+    conn.sendall(_MUX_FRAME.pack(stream_id, FRAME_DATA, offset, count, count, crc))
+    _sendfile_exact(conn, handle, offset, count)
+
+
+def read_mux_frame(
+    conn: socket.socket, max_payload: int = CONTROL_PAYLOAD_LIMIT
+) -> Tuple[int, int, int, int, bytes]:
+    stream_id, kind, offset, raw_len, wire_len, crc = _MUX_FRAME.unpack(
+        recv_exact(conn, _MUX_FRAME.size)
+    )
+    check_payload_length(wire_len, max_payload)
+    payload = recv_exact(conn, wire_len) if wire_len else b""
+    _check_crc(payload, crc)
+    return stream_id, kind, offset, raw_len, payload
+
+
+class BufferPool:
+    """Receive buffers handed back and forth between frame readers.
+
+    Buffers are at least ``size`` bytes; at most ``limit`` idle ones are
+    kept, the rest are left to the garbage collector.
+    """
+
+    def __init__(self, size: int = 1024 * 1024, limit: int = 16) -> None:
+        self.size = size
+        self.limit = limit
+        self._idle: List[bytearray] = []
+        self._lock = threading.Lock()
+
+    def acquire(self, size: int = 0) -> bytearray:
+        with self._lock:
+            for index, buffer in enumerate(self._idle):
+                if len(buffer) >= size:
+                    return self._idle.pop(index)
+        return bytearray(max(size, self.size))
+
+    def release(self, buffer: bytearray) -> None:
+        with self._lock:
+            if len(self._idle) < self.limit:
+                self._idle.append(buffer)
+
+
+_pool = BufferPool()
+
+
+def default_pool() -> BufferPool:
+    return _pool
+
+
+class FrameReader:
+    """Read frames from one connection into a reused buffer.
+
+    Payloads are returned as views of that buffer and are only valid until
+    the next read. Close the reader to return the buffer to the pool.
+    Payloads over ``max_payload`` bytes fail the connection unread.
+    """
+
+    def __init__(
+        self,
+        conn: socket.socket,
+        pool: Optional[BufferPool] = None,
+        max_payload: Optional[int] = None,
+    ) -> None:
+        self.conn = conn
+        self.pool = pool or _pool
+        self.max_payload = max_payload or payload_limit()
+        self._header = memoryview(bytearray(_MUX_FRAME.size))
+        self._buffer: Optional[bytearray] = None
+        self._pipe: Optional[Tuple[int, int]] = None
+
+    def __enter__(self) -> "FrameReader":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    @property
+    def can_splice(self) -> bool:
+        """True where payloads can move socket to file without a copy here."""
+        # splice on a socket with a timeout would fail with EAGAIN, and
+        # on a TLS socket would move ciphertext.
+        return (
+            hasattr(os, "splice")
+            and self.conn.gettimeout() is None
+            and not isinstance(self.conn, ssl.SSLSocket)
+        )
+
+    def read(self) -> Tuple[int, int, int, memoryview]:
+        """Read one frame, failing the connection if its payload is corrupt."""
+        kind, offset, raw_len, wire_len, crc = self.read_header()
+        payload = self.read_payload(wire_len)
+        _check_crc(payload, crc)
+        return kind, offset, raw_len, payload
+
+    def read_mux(self) -> Tuple[int, int, int, int, memoryview]:
+        stream_id, kind, offset, raw_len, wire_len, crc = self.read_mux_header()
+        payload = self.read_payload(wire_len)
+        _check_crc(payload, crc)
+        return stream_id, kind, offset, raw_len, payload
+
+    def read_header(self) -> Tuple[int, int, int, int, int]:
+        """Read a frame header; the caller reads the payload and checks its CRC."""
+        view = self._header[: _FRAME.size]
+        recv_into_exact(self.conn, view)
+        return _FRAME.unpack(view)
+
+    def read_mux_header(self) -> Tuple[int, int, int, int, int, int]:
+        recv_into_exact(self.conn, self._header)
+        return _MUX_FRAME.unpack(self._header)
+
+    def read_payload(self, wire_len: int) -> memoryview:
+        check_payload_length(wire_len, self.max_payload)
+        view = self.buffer(wire_len)[:wire_len]
+        recv_into_exact(self.conn, view)
+        return view
+
+    def buffer(self, size: int = 0) -> memoryview:
+        """The reader's buffer, grown to at least ``size`` bytes."""
+        if self._buffer is None or len(self._buffer) < size:
+            if self._buffer is not None:
+                self.pool.release(self._buffer)
+            self._buffer = self.pool.acquire(size)
+        return memoryview(self._buffer)
+
+    def splice_payload(self, fd: int, offset: int, count: int) -> None:
+        """Move a ``count`` byte payload into ``fd`` at ``offset`` via a pipe."""
+        check_payload_length(count, self.max_payload)
+        if self._pipe is None:
+            self._pipe = os.pipe()
+            try:
+                import fcntl
+
+                fcntl.fcntl(self._pipe[1], fcntl.F_SETPIPE_SZ, SPLICE_PIPE_SIZE)
+            except (ImportError, AttributeError, OSError):
+                pass
+        pipe_read, pipe_write = self._pipe
+        source = self.conn.fileno()
+        while count:
+            moved = os.splice(source, pipe_write, min(count, SPLICE_PIPE_SIZE))
+            if not moved:
+                raise ConnectionError("Unexpected end of stream")
+            count -= moved
+            while moved:
+                written = os.splice(pipe_read, fd, moved, offset_dst=offset)
+                moved -= written
+                offset += written
+
+    def close(self) -> None:
+        if self._buffer is not None:
+            self.pool.release(self._buffer)
+            self._buffer = None
+        if self._pipe is not None:
+            for pipe_fd in self._pipe:
+                os.close(pipe_fd)
+            self._pipe = None
+
+
+def pack_json(document: dict) -> bytes:
+    return json.dumps(document).encode("utf-8")
+
+
+def unpack_json(payload: bytes) -> dict:
+    try:
+        document = json.loads(str(payload, "utf-8"))
+    except (UnicodeDecodeError, ValueError) as exc:
+        raise ConnectionError("Malformed control frame") from exc
+    if not isinstance(document, dict):
+        raise ConnectionError("Malformed control frame")
+    return document
+
+
+def check_payload_length(wire_len: int, max_payload: int) -> None:
+    if wire_len > max_payload:
+        raise ConnectionError(
+            f"Frame payload of {wire_len} bytes exceeds the {max_payload} byte limit"
+        )
+
+
+def _check_crc(payload, crc: int) -> None:
+    if payload_crc(payload) != crc:
+        raise ConnectionError("Frame failed its integrity check")
+
+
+def _sendfile_exact(conn: socket.socket, handle, offset: int, count: int) -> None:
+    sent = conn.sendfile(handle, offset, count)
+    if sent != count:
+        # The frame header already promised ``count`` bytes.
+        raise IOError("Source file shrank during send")
+
+
+def recv_exact(conn: socket.socket, size: int) -> bytearray:
+    data = bytearray(size)
+    recv_into_exact(conn, memoryview(data))
+    return data
+
+
+def recv_into_exact(conn: socket.socket, view: memoryview) -> None:
+    while view:
+        count = conn.recv_into(view)
+        if not count:
+            raise ConnectionError("Unexpected end of stream")
+        view = view[count:]
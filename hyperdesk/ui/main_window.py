@@ -230,13 +230,11 @@ class MainWindow(QMainWindow):
         avg_rate = sum(rates) / len(rates) if rates else 0.0
         limit_mbps = self.controller.get_transfer_limit_mbps()
         limit_text = f"{limit_mbps:.2f} MB/s" if limit_mbps else "unlimited"
-        util_text = (
-            f"{(avg_rate / limit_mbps) * 100:.0f}%"
-            if limit_mbps and avg_rate
-            else "--"
-        )
+        total_mbps, utilization = self.controller.get_bandwidth_utilization()
+        util_text = f"{utilization * 100:.0f}%" if utilization else "--"
         self.transfer_footer.setText(
-            f"Active: {len(active)} | Avg rate: {avg_rate:.2f} MB/s | Limit: {limit_text} | Util: {util_text}"
+            f"Active: {len(active)} | Avg rate: {avg_rate:.2f} MB/s | "
+            f"Total: {total_mbps:.2f} MB/s | Limit: {limit_text} | Util: {util_text}"
         )
 
     def _update_requests(self, requests: list[FileRequest]) -> None:
@@ -11,6 +11,10 @@ from PySide6.QtWidgets import (
     QVBoxLayout,
 )
 
+from hyperdesk.transfer.compression import NO_COMPRESSION, supported_codecs
+from hyperdesk.transfer.digests import INTEGRITY_ONLY, supported_algorithms
+from hyperdesk.transfer.finalize import DURABILITY_MODES
+
 
 class TransferSettingsDialog(QDialog):
     def __init__(self, controller, parent=None) -> None:
@@ -27,6 +31,11 @@ class TransferSettingsDialog(QDialog):
             ["unlimited", "10 MB/s", "25 MB/s", "50 MB/s", "100 MB/s"]
         )
 
+        self.burst = QSpinBox()
+        self.burst.setRange(0, 1024)
+        self.burst.setSuffix(" MB")
+        self.burst.setSpecialValueText("auto")
+
         self.retry_policy = QComboBox()
         self.retry_policy.addItems(["exponential", "linear", "none"])
 
@@ -34,15 +43,45 @@ class TransferSettingsDialog(QDialog):
         self.max_retries.setRange(0, 20)
 
         self.encryption = QCheckBox("Encrypt transfers (AES-256)")
+        self.chunk_hashes = QCheckBox("Per-chunk checksums (verify and repair)")
+
+        self.hash_algorithm = QComboBox()
+        for name in supported_algorithms():
+            label = f"{name} (integrity only)" if name in INTEGRITY_ONLY else name
+            self.hash_algorithm.addItem(label, name)
+
+        self.compression = QComboBox()
+        self.compression.addItems([NO_COMPRESSION, *supported_codecs()])
+
+        self.durability = QComboBox()
+        self.durability.addItems(list(DURABILITY_MODES))
+
+        self.parallel_workers = QSpinBox()
+        self.parallel_workers.setRange(1, 32)
+
+        self.network_streams = QSpinBox()
+        self.network_streams.setRange(1, 16)
+
+        self.range_size = QSpinBox()
+        self.range_size.setRange(1, 4096)
+        self.range_size.setSuffix(" MB")
 
         self._load_settings()
 
         form = QFormLayout()
         form.addRow("Chunk size:", self.chunk_size)
         form.addRow("Max bandwidth:", self.max_bandwidth)
+        form.addRow("Burst size:", self.burst)
         form.addRow("Retry policy:", self.retry_policy)
         form.addRow("Max retries:", self.max_retries)
+        form.addRow("Checksum:", self.hash_algorithm)
+        form.addRow("Compression:", self.compression)
+        form.addRow("Durability:", self.durability)
+        form.addRow("Parallel workers:", self.parallel_workers)
+        form.addRow("Network streams (max):", self.network_streams)
+        form.addRow("Range size:", self.range_size)
         form.addRow("", self.encryption)
+        form.addRow("", self.chunk_hashes)
 
         save_button = QPushButton("Save")
         reset_button = QPushButton("Reset")
@@ -63,17 +102,35 @@ class TransferSettingsDialog(QDialog):
         settings = self.controller.get_transfer_settings()
         self.chunk_size.setValue(settings["chunk_size_mb"])
         self.max_bandwidth.setCurrentText(settings["max_bandwidth"])
+        self.burst.setValue(settings["burst_mb"])
         self.retry_policy.setCurrentText(settings["retry_policy"])
         self.max_retries.setValue(settings["max_retries"])
         self.encryption.setChecked(settings["encryption"])
+        self.parallel_workers.setValue(settings["parallel_workers"])
+        self.range_size.setValue(settings["range_size_mb"])
+        self.network_streams.setValue(settings["network_streams"])
+        self.chunk_hashes.setChecked(settings["chunk_hashes"])
+        self.hash_algorithm.setCurrentIndex(
+            max(self.hash_algorithm.findData(settings["hash_algorithm"]), 0)
+        )
+        self.compression.setCurrentText(settings["compression"])
+        self.durability.setCurrentText(settings["durability"])
 
     def _save(self) -> None:
         settings = {
             "chunk_size_mb": self.chunk_size.value(),
             "max_bandwidth": self.max_bandwidth.currentText(),
+            "burst_mb": self.burst.value(),
             "retry_policy": self.retry_policy.currentText(),
             "max_retries": self.max_retries.value(),
             "encryption": self.encryption.isChecked(),
+            "parallel_workers": self.parallel_workers.value(),
+            "range_size_mb": self.range_size.value(),
+            "network_streams": self.network_streams.value(),
+            "chunk_hashes": self.chunk_hashes.isChecked(),
+            "hash_algorithm": self.hash_algorithm.currentData(),
+            "compression": self.compression.currentText(),
+            "durability": self.durability.currentText(),
         }
         self.controller.save_transfer_settings(settings)
         self.accept()
@@ -83,9 +140,17 @@ class TransferSettingsDialog(QDialog):
             {
                 "chunk_size_mb": 8,
                 "max_bandwidth": "unlimited",
+                "burst_mb": 0,
                 "retry_policy": "exponential",
                 "max_retries": 3,
                 "encryption": False,
+                "parallel_workers": 1,
+                "range_size_mb": 64,
+                "network_streams": 4,
+                "chunk_hashes": False,
+                "hash_algorithm": "sha256",
+                "compression": "none",
+                "durability": "file",
             }
         )
         self._load_settings()
@@ -0,0 +1,58 @@
+import asyncio
+import json
+
+from hyperdesk.network.protocol import decode_any, encode_message
+
+
+class FakeConnection:
+    """Stands in for a websocket connection accepted by ``ControlServer``.
+
+    Messages put in with ``deliver`` come out of ``async for``; whatever the
+    server sends is decoded into ``sent``. While ``stalled`` is set, sends
+    block until ``release`` is called, like a peer that stopped reading.
+    """
+
+    def __init__(self, remote_address=("127.0.0.1", 40000)) -> None:
+        self.remote_address = remote_address
+        self.sent = []
+        self.raw = []
+        self.close_code = None
+        self.stalled = False
+        self._incoming: asyncio.Queue = asyncio.Queue()
+        self._released = asyncio.Event()
+
+    def deliver(self, message_type: str, payload: dict, version: str = None) -> None:
+        message = encode_message(message_type, payload)
+        if version is not None:
+            data = json.loads(message)
+            data["version"] = version
+            message = json.dumps(data)
+        self._incoming.put_nowait(message)
+
+    def release(self) -> None:
+        self._released.set()
+
+    async def send(self, message) -> None:
+        if self.stalled:
+            await self._released.wait()
+        self.raw.append(message)
+        self.sent.append(decode_any(message))
+
+    async def close(self, code: int = 1000, reason: str = "") -> None:
+        self.close_code = code
+        self._incoming.put_nowait(None)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        message = await self._incoming.get()
+        if message is None:
+            raise StopAsyncIteration
+        return message
+
+
+async def settle(rounds: int = 20) -> None:
+    """Let the server's handler and writer tasks run."""
+    for _ in range(rounds):
+        await asyncio.sleep(0)
@@ -0,0 +1,42 @@
+import threading
+
+from hyperdesk.transfer.channel import FileSender, receive_file
+
+CHUNK = 1024 * 1024
+
+
+def transfer(source, dest_dir, streams=1, range_size=0, splice=False, **options):
+    """Send ``source`` to ``dest_dir`` over loopback; return both results.
+
+    ``options`` (hash_algorithm, compression, ...) go to both ends.
+    """
+    sender = FileSender(chunk_size=CHUNK, max_streams=streams)
+    port = sender.open()
+    outcome = {}
+
+    def send():
+        try:
+            outcome["result"] = sender.send_file(
+                source, streams=streams, range_size=range_size, **options
+            )
+        except Exception as exc:
+            outcome["error"] = exc
+
+    thread = threading.Thread(target=send)
+    thread.start()
+    try:
+        received = receive_file(
+            "127.0.0.1",
+            port,
+            dest_dir,
+            streams=streams,
+            range_size=range_size,
+            splice=splice,
+            **options,
+        )
+    finally:
+        thread.join()
+        sender.close()
+    if "error" in outcome:
+        raise outcome["error"]
+    return outcome["result"], received
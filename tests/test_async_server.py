@@ -0,0 +1,76 @@
+import asyncio
+import hashlib
+import os
+
+import pytest
+
+from hyperdesk.transfer.channel import AsyncFileServer, receive_file
+
+from tests.loopback import CHUNK
+
+
+def _serve(server, sources, dest_dirs, **options):
+    """Send every source concurrently on one loop; return both sides' results."""
+
+    async def scenario():
+        listeners = [await server.listen() for _ in sources]
+        sends = [
+            server.send_file(listener, source, **options)
+            for listener, source in zip(listeners, sources)
+        ]
+        receives = [
+            asyncio.to_thread(receive_file, "127.0.0.1", listener.port, dest_dir, **options)
+            for listener, dest_dir in zip(listeners, dest_dirs)
+        ]
+        results = await asyncio.gather(*sends, *receives)
+        return results[: len(sources)], results[len(sources) :]
+
+    try:
+        return asyncio.run(scenario())
+    finally:
+        server.close()
+
+
+def _sha256(path):
+    return hashlib.sha256(path.read_bytes()).hexdigest()
+
+
+@pytest.mark.parametrize("compression", ["none", "zlib"])
+def test_concurrent_transfers_share_one_loop(tmp_path, compression):
+    sources, dest_dirs = [], []
+    for index in range(3):
+        source = tmp_path / f"source-{index}.bin"
+        source.write_bytes(os.urandom(2 * CHUNK + index * 1000))
+        dest_dir = tmp_path / f"dest-{index}"
+        dest_dir.mkdir()
+        sources.append(source)
+        dest_dirs.append(dest_dir)
+
+    sent, received = _serve(
+        AsyncFileServer(host="127.0.0.1", chunk_size=CHUNK),
+        sources,
+        dest_dirs,
+        compression=compression,
+    )
+
+    for source, result, delivered in zip(sources, sent, received):
+        assert result.checksum == delivered.checksum == _sha256(source)
+        assert delivered.path.read_bytes() == source.read_bytes()
+
+
+def test_missing_receiver_times_out_and_frees_the_port(tmp_path):
+    source = tmp_path / "source.bin"
+    source.write_bytes(b"data")
+    server = AsyncFileServer(host="127.0.0.1", accept_timeout=0.1)
+
+    async def scenario():
+        listener = await server.listen()
+        with pytest.raises(TimeoutError):
+            await server.send_file(listener, source)
+        with pytest.raises(OSError):
+            await asyncio.open_connection("127.0.0.1", listener.port)
+
+    try:
+        asyncio.run(scenario())
+    finally:
+        server.close()
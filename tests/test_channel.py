@@ -0,0 +1,237 @@
+import hashlib
+import os
+import tracemalloc
+import zlib
+
+import pytest
+
+from hyperdesk.transfer import channel
+from hyperdesk.transfer.channel import RESUME_MIN_SIZE, _check_resume_offset
+from hyperdesk.transfer.checkpoint import Checkpoint, save_checkpoint
+from hyperdesk.transfer.chunktree import build_chunk_tree
+from hyperdesk.transfer.finalize import INCOMING_PREFIX
+
+from tests.loopback import CHUNK, transfer
+
+
+def _source(tmp_path, size=RESUME_MIN_SIZE + 123):
+    path = tmp_path / "source.bin"
+    path.write_bytes(os.urandom(size))
+    return path
+
+
+def _sha256(path):
+    return hashlib.sha256(path.read_bytes()).hexdigest()
+
+
+def _interrupted(source, dest_dir, prefix, mtime_ns=None):
+    """Leave the partial file and checkpoint an interrupted attempt would."""
+    stat = source.stat()
+    work = dest_dir / f"{INCOMING_PREFIX}{source.name}"
+    with open(work, "wb") as handle:
+        handle.write(source.read_bytes()[:prefix])
+    save_checkpoint(
+        str(work),
+        Checkpoint(prefix, stat.st_size, stat.st_mtime_ns if mtime_ns is None else mtime_ns),
+    )
+
+
+def test_resume_continues_from_checkpoint(tmp_path):
+    source = _source(tmp_path)
+    dest_dir = tmp_path / "dest"
+    dest_dir.mkdir()
+    _interrupted(source, dest_dir, 3 * CHUNK)
+
+    sent, received = transfer(source, dest_dir)
+
+    assert sent.resumed_bytes == 3 * CHUNK
+    assert sent.checksum == received.checksum == _sha256(source)
+    assert _sha256(received.path) == _sha256(source)
+    assert not (dest_dir / f"{INCOMING_PREFIX}{source.name}").exists()
+
+
+def test_checkpoint_for_other_source_is_ignored(tmp_path):
+    source = _source(tmp_path)
+    dest_dir = tmp_path / "dest"
+    dest_dir.mkdir()
+    _interrupted(source, dest_dir, 3 * CHUNK, mtime_ns=1)
+
+    sent, received = transfer(source, dest_dir)
+
+    assert sent.resumed_bytes == 0
+    assert _sha256(received.path) == _sha256(source)
+
+
+def test_small_files_do_not_resume(tmp_path):
+    source = _source(tmp_path, size=2 * CHUNK)
+    dest_dir = tmp_path / "dest"
+    dest_dir.mkdir()
+    _interrupted(source, dest_dir, CHUNK)
+
+    sent, received = transfer(source, dest_dir)
+
+    assert sent.resumed_bytes == 0
+    assert _sha256(received.path) == _sha256(source)
+
+
+@pytest.mark.parametrize(
+    "offset, size, alignment",
+    [(11, 10, None), (5, 16, 4), (17, 16, 4)],
+)
+def test_invalid_resume_offsets_are_rejected(offset, size, alignment):
+    with pytest.raises(ConnectionError):
+        _check_resume_offset(offset, size, alignment)
+
+
+@pytest.mark.parametrize(
+    "offset, size, alignment",
+    [(0, 10, None), (10, 10, None), (8, 16, 4), (15, 15, 4)],
+)
+def test_valid_resume_offsets_are_accepted(offset, size, alignment):
+    assert _check_resume_offset(offset, size, alignment) == offset
+
+
+def test_striped_send_covers_every_range(tmp_path):
+    source = _source(tmp_path, size=10 * CHUNK + 7)
+    dest_dir = tmp_path / "dest"
+    dest_dir.mkdir()
+
+    sent, received = transfer(source, dest_dir, streams=3, range_size=2 * CHUNK)
+
+    assert sent.checksum == received.checksum
+    assert sent.checksum == build_chunk_tree(str(source), 2 * CHUNK).root
+    assert received.path.read_bytes() == source.read_bytes()
+
+
+def test_striped_send_resumes_after_the_recorded_ranges(tmp_path):
+    source = _source(tmp_path, size=10 * CHUNK + 7)
+    data = source.read_bytes()
+    dest_dir = tmp_path / "dest"
+    dest_dir.mkdir()
+    range_size = 2 * CHUNK
+    work = dest_dir / f"{INCOMING_PREFIX}{source.name}"
+    work.write_bytes(data[: 2 * range_size])
+    ranges = [data[:range_size], data[range_size : 2 * range_size]]
+    stat = source.stat()
+    save_checkpoint(
+        str(work),
+        Checkpoint(
+            0,
+            stat.st_size,
+            stat.st_mtime_ns,
+            range_size=range_size,
+            range_digests=[
+                [index, hashlib.sha256(chunk).hexdigest()] for index, chunk in enumerate(ranges)
+            ],
+        ),
+    )
+
+    sent, received = transfer(source, dest_dir, streams=3, range_size=range_size)
+
+    assert sent.resumed_bytes == 2 * range_size
+    assert sent.checksum == received.checksum
+    assert received.path.read_bytes() == data
+
+
+@pytest.mark.parametrize("streams, range_size", [(1, 0), (3, 4 * CHUNK)])
+def test_frame_with_bad_crc_is_retransmitted(tmp_path, monkeypatch, streams, range_size):
+    source = _source(tmp_path, size=12 * CHUNK + 5)
+    dest_dir = tmp_path / "dest"
+    dest_dir.mkdir()
+    extent_frames = channel._extent_frames
+    corrupted = []
+
+    def corrupt_once(*args, **kwargs):
+        for kind, offset, raw_len, payload, crc in extent_frames(*args, **kwargs):
+            if kind == channel.FRAME_DATA and offset >= CHUNK and not corrupted:
+                corrupted.append(offset)
+                crc ^= 1
+            yield kind, offset, raw_len, payload, crc
+
+    monkeypatch.setattr(channel, "_extent_frames", corrupt_once)
+
+    sent, received = transfer(source, dest_dir, streams=streams, range_size=range_size)
+
+    assert corrupted
+    assert sent.retransmitted_bytes == CHUNK
+    assert sent.checksum == received.checksum
+    assert _sha256(received.path) == _sha256(source)
+
+
+def test_receiver_restores_a_saved_crc32_state(tmp_path):
+    source = _source(tmp_path)
+    data = source.read_bytes()
+    dest_dir = tmp_path / "dest"
+    dest_dir.mkdir()
+    stat = source.stat()
+    work = dest_dir / f"{INCOMING_PREFIX}{source.name}"
+    # Zeros on disk: the digest has to come from the checkpoint.
+    work.write_bytes(bytes(2 * CHUNK))
+    state = f"{zlib.crc32(data[: 2 * CHUNK]):08x}"
+    save_checkpoint(
+        str(work),
+        Checkpoint(2 * CHUNK, stat.st_size, stat.st_mtime_ns, "crc32", hash_state=state),
+    )
+    incoming = channel._IncomingFile(
+        dest_dir, source.name, stat.st_size, channel.HEADER_RESUME, stat.st_mtime_ns
+    )
+    try:
+        offset, hasher = incoming.resume_point(None, "crc32")
+    finally:
+        incoming.close()
+
+    assert offset == 2 * CHUNK
+    hasher.update(data[offset:])
+    assert hasher.hexdigest() == f"{zlib.crc32(data):08x}"
+
+
+def _held_back_writer(tmp_path):
+    """A writer whose first frame at offset 0 failed its CRC.
+
+    Delivered data is hashed rather than kept, so it does not count
+    towards the memory the writer uses.
+    """
+    fd = os.open(tmp_path / "dest.bin", os.O_RDWR | os.O_CREAT)
+    delivered = []
+    digest = hashlib.sha256()
+    retransmits = []
+
+    def on_frame(offset, data, length):
+        if data is not None:
+            digest.update(data)
+        delivered.append((offset, data is not None, length))
+
+    writer = channel._FrameWriter(fd, "none", on_frame, lambda *reply: retransmits.append(reply))
+    first = os.urandom(4096)
+    writer.write(channel.FRAME_DATA, 0, len(first), first, zlib.crc32(first) ^ 1)
+    assert retransmits == [(channel.FRAME_RETRANSMIT, 0, len(first))]
+    return fd, writer, first, delivered, digest
+
+
+def test_frames_behind_a_gap_are_read_back_in_bounded_pieces(tmp_path):
+    fd, writer, first, delivered, digest = _held_back_writer(tmp_path)
+    big = os.urandom(3 * channel.READBACK_SIZE + 5)
+    hole = channel.MAX_FRAME_LENGTH
+    try:
+        writer.write(channel.FRAME_DATA, 4096, len(big), big, zlib.crc32(big))
+        writer.write(channel.FRAME_HOLE, 4096 + len(big), hole, b"", 0)
+        assert delivered == []
+        tracemalloc.start()
+        try:
+            writer.write(channel.FRAME_DATA, 0, len(first), first, zlib.crc32(first))
+            _current, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+    finally:
+        os.close(fd)
+
+    # One read-back buffer, never one the size of the 4 GiB hole.
+    assert peak < 2 * channel.READBACK_SIZE
+    assert delivered[0] == (0, True, len(first))
+    assert delivered[-1] == (4096 + len(big), False, hole)
+    pieces = delivered[1:-1]
+    assert pieces == [
+        (4096 + start, True, min(channel.READBACK_SIZE, len(big) - start))
+        for start in range(0, len(big), channel.READBACK_SIZE)
+    ]
+    assert digest.digest() == hashlib.sha256(first + big).digest()
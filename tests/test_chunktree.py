@@ -0,0 +1,117 @@
+import hashlib
+import os
+
+from hyperdesk.transfer import engine as engine_module
+from hyperdesk.transfer.chunktree import (
+    ChunkTree,
+    ChunkTreeBuilder,
+    build_chunk_tree,
+    merkle_root,
+    verify_chunk_tree,
+)
+from hyperdesk.transfer.engine import TransferEngine
+
+CHUNK = 64 * 1024
+
+
+def _digest(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def test_merkle_root_folds_pairs_and_carries_the_odd_node():
+    leaves = [_digest(bytes([i])) for i in range(3)]
+    left = hashlib.sha256(bytes.fromhex(leaves[0]) + bytes.fromhex(leaves[1])).digest()
+    expected = hashlib.sha256(left + bytes.fromhex(leaves[2])).hexdigest()
+
+    assert merkle_root(leaves) == expected
+    assert merkle_root(leaves[:1]) == leaves[0]
+    assert merkle_root([]) == _digest(b"")
+
+
+def test_streamed_builder_matches_the_file_tree(tmp_path):
+    data = os.urandom(5 * CHUNK + 123)
+    path = tmp_path / "data.bin"
+    path.write_bytes(data)
+    builder = ChunkTreeBuilder(CHUNK)
+    for start in range(0, len(data), 10_000):
+        builder.update(data[start : start + 10_000])
+
+    tree = builder.finish()
+
+    assert tree == build_chunk_tree(str(path), CHUNK)
+    assert list(tree.digests) == [
+        _digest(data[start : start + CHUNK]) for start in range(0, len(data), CHUNK)
+    ]
+
+
+def test_zeros_hash_like_written_zeros():
+    streamed, zeroed = ChunkTreeBuilder(CHUNK), ChunkTreeBuilder(CHUNK)
+    streamed.update(b"x" * 100)
+    zeroed.update(b"x" * 100)
+    streamed.update(bytes(3 * CHUNK))
+    zeroed.update_zeros(3 * CHUNK)
+
+    assert streamed.finish() == zeroed.finish()
+
+
+def test_empty_file_has_one_empty_chunk(tmp_path):
+    path = tmp_path / "empty.bin"
+    path.write_bytes(b"")
+
+    tree = build_chunk_tree(str(path), CHUNK)
+
+    assert tree.digests == (_digest(b""),)
+    assert ChunkTreeBuilder(CHUNK).finish() == tree
+
+
+def test_mismatched_and_payload_round_trip():
+    tree = ChunkTree.from_digests(CHUNK, [_digest(b"a"), _digest(b"b"), _digest(b"c")])
+    other = ChunkTree.from_digests(CHUNK, [_digest(b"a"), _digest(b"B")])
+
+    assert tree.mismatched(other) == [1, 2]
+    assert ChunkTree.from_payload(tree.to_payload()) == tree
+    assert ChunkTree.from_payload({}) is None
+
+
+def test_verify_finds_corrupt_chunks(tmp_path):
+    data = bytearray(os.urandom(4 * CHUNK))
+    path = tmp_path / "data.bin"
+    path.write_bytes(data)
+    tree = build_chunk_tree(str(path), CHUNK)
+    data[2 * CHUNK + 5] ^= 0xFF
+    path.write_bytes(data)
+
+    assert verify_chunk_tree(str(path), tree, workers=2) == [2]
+
+
+def test_verify_recopies_only_corrupt_chunks(tmp_path, monkeypatch):
+    source = tmp_path / "source.bin"
+    source.write_bytes(os.urandom(4 * CHUNK))
+    dest = tmp_path / "dest.bin"
+    repaired = []
+    copy_range = engine_module._copy_range_positional
+
+    def recording_copy(source_path, dest_path, offset, *args, **kwargs):
+        repaired.append(offset)
+        return copy_range(source_path, dest_path, offset, *args, **kwargs)
+
+    engine = TransferEngine()
+    copy_once = engine._copy_once
+
+    def copy_then_corrupt(source_path, work_path, **kwargs):
+        result = copy_once(source_path, work_path, **kwargs)
+        with open(work_path, "r+b") as handle:
+            handle.seek(CHUNK + 1)
+            handle.write(b"\0\0\0")
+        return result
+
+    monkeypatch.setattr(engine, "_copy_once", copy_then_corrupt)
+    monkeypatch.setattr(engine_module, "_copy_range_positional", recording_copy)
+
+    result = engine.copy_with_checksum(
+        str(source), str(dest), chunk_size=CHUNK, chunk_hashes=True, verify=True
+    )
+
+    assert repaired == [CHUNK]
+    assert result.checksum == build_chunk_tree(str(source), CHUNK).root
+    assert dest.read_bytes() == source.read_bytes()
@@ -0,0 +1,95 @@
+import os
+
+import pytest
+
+from hyperdesk.transfer.compression import (
+    NO_COMPRESSION,
+    PROBE_FRAMES,
+    REPROBE_INTERVAL,
+    AdaptiveCompressor,
+    FrameDecompressor,
+    negotiate_codec,
+    supported_codecs,
+)
+
+from tests.loopback import CHUNK, transfer
+
+TEXT = b"the quick brown fox jumps over the lazy dog\n" * 1500
+
+
+def test_negotiation_prefers_the_local_choice():
+    assert negotiate_codec(["zlib", "lzma"], "lzma") == "lzma"
+    assert negotiate_codec(["bz2", "lzma"], "zlib") == "lzma"
+    assert negotiate_codec([], "zlib") == NO_COMPRESSION
+    assert negotiate_codec(["zlib"], NO_COMPRESSION) == NO_COMPRESSION
+
+
+@pytest.mark.parametrize("codec", supported_codecs())
+def test_frames_round_trip(codec):
+    compressor = AdaptiveCompressor(codec)
+
+    packed, payload = compressor.encode(TEXT)
+
+    assert packed and len(payload) < len(TEXT)
+    assert FrameDecompressor(codec).decode(payload) == TEXT
+    assert compressor.wire_bytes == len(payload)
+
+
+def test_unknown_codec_is_rejected():
+    with pytest.raises(ValueError):
+        AdaptiveCompressor("zstd")
+    with pytest.raises(ValueError):
+        FrameDecompressor("zstd")
+
+
+def test_incompressible_data_is_bypassed_after_the_probe():
+    compressor = AdaptiveCompressor("zlib")
+    frames = [os.urandom(16 * 1024) for _ in range(PROBE_FRAMES + 5)]
+
+    results = [compressor.encode(frame) for frame in frames]
+
+    assert all(not packed for packed, _payload in results)
+    assert all(payload is frame for (_packed, payload), frame in zip(results, frames))
+    # Only the probe frames paid for a compression attempt.
+    calls = []
+    compressor._compress = lambda data: calls.append(data) or data
+    compressor.encode(os.urandom(1024))
+    assert calls == []
+    assert compressor.wire_bytes == compressor.raw_bytes
+
+
+def test_bypass_reprobes_and_picks_compressible_data_back_up():
+    compressor = AdaptiveCompressor("zlib")
+    for _ in range(PROBE_FRAMES):
+        compressor.encode(os.urandom(16 * 1024))
+
+    results = [compressor.encode(TEXT) for _ in range(REPROBE_INTERVAL + 1)]
+
+    packed = [index for index, (was_packed, _payload) in enumerate(results) if was_packed]
+    assert packed[0] == REPROBE_INTERVAL - 1
+    assert results[-1][0]
+
+
+def test_compressible_file_crosses_the_wire_smaller(tmp_path):
+    source = tmp_path / "source.txt"
+    source.write_bytes(TEXT * 100)
+    dest_dir = tmp_path / "dest"
+    dest_dir.mkdir()
+
+    sent, received = transfer(source, dest_dir, compression="zlib")
+
+    assert sent.compression == received.compression == "zlib"
+    assert sent.wire_bytes < sent.bytes_copied // 10
+    assert received.path.read_bytes() == source.read_bytes()
+
+
+def test_random_file_is_sent_raw(tmp_path):
+    source = tmp_path / "source.bin"
+    source.write_bytes(os.urandom(4 * CHUNK))
+    dest_dir = tmp_path / "dest"
+    dest_dir.mkdir()
+
+    sent, received = transfer(source, dest_dir, compression="zlib")
+
+    assert sent.compression_ratio == pytest.approx(1.0, abs=0.01)
+    assert received.path.read_bytes() == source.read_bytes()
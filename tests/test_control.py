@@ -0,0 +1,234 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("websockets")
+
+from hyperdesk.network import control  # noqa: E402
+from hyperdesk.network.control import ControlServer  # noqa: E402
+from hyperdesk.network.protocol import CODEC_BINARY, CODEC_JSON  # noqa: E402
+
+from tests.fakes import FakeConnection, settle  # noqa: E402
+
+UPDATE = {
+    "session_id": "session-1",
+    "status": "active",
+    "mode": "mirror",
+    "approval_required": False,
+    "conflict_rule": "keep_both",
+}
+
+
+async def _ignore(message: dict) -> None:
+    pass
+
+
+async def _connect(server: ControlServer, connection: FakeConnection) -> asyncio.Task:
+    handler = asyncio.ensure_future(server._handler(connection))
+    await settle()
+    return handler
+
+
+def test_broadcast_reaches_every_connection_in_its_codec(monkeypatch):
+    encoded = []
+    encode_for = control.encode_for
+
+    def counting_encode_for(codec, *args, **kwargs):
+        encoded.append(codec)
+        return encode_for(codec, *args, **kwargs)
+
+    monkeypatch.setattr(control, "encode_for", counting_encode_for)
+
+    async def scenario():
+        server = ControlServer("127.0.0.1", 0, _ignore)
+        old, new, newer = FakeConnection(), FakeConnection(), FakeConnection()
+        for connection in (old, new, newer):
+            await _connect(server, connection)
+        old.deliver("DISCOVERY_PING", {"device_id": "a", "name": "a", "capabilities": []}, "0.1")
+        for connection in (new, newer):
+            connection.deliver("DISCOVERY_PING", {"device_id": "b", "name": "b", "capabilities": []})
+        await settle()
+
+        await server.broadcast_message("SESSION_UPDATE", UPDATE)
+        await settle()
+
+        assert sorted(encoded) == sorted([CODEC_JSON, CODEC_BINARY])
+        assert isinstance(old.raw[0], str)
+        assert isinstance(new.raw[0], bytes) and new.raw[0] is newer.raw[0]
+        for connection in (old, new, newer):
+            assert [message["payload"] for message in connection.sent] == [UPDATE]
+        await server.stop()
+
+    asyncio.run(scenario())
+
+
+def test_slow_consumer_is_dropped_when_its_queue_fills():
+    async def scenario():
+        server = ControlServer("127.0.0.1", 0, _ignore, outbox_depth=2)
+        slow, fast = FakeConnection(), FakeConnection()
+        slow.stalled = True
+        await _connect(server, slow)
+        await _connect(server, fast)
+
+        # One message is in the stalled send, two fill the queue.
+        for _ in range(3):
+            await server.broadcast_message("SESSION_UPDATE", UPDATE)
+            await settle()
+        assert sorted(server.queue_lengths()) == [0, 2]
+        assert slow.close_code is None
+
+        await server.broadcast_message("SESSION_UPDATE", UPDATE)
+        await settle()
+
+        assert slow.close_code == 1013
+        assert server.slow_drops == 1
+        assert server.connection_count == 1
+        assert server.queue_lengths() == [0]
+        assert len(fast.sent) == 4
+        slow.release()
+        await server.stop()
+
+    asyncio.run(scenario())
+
+
+def test_stalled_send_is_dropped_after_max_latency():
+    async def scenario():
+        server = ControlServer("127.0.0.1", 0, _ignore, max_latency=0.05)
+        slow = FakeConnection()
+        slow.stalled = True
+        await _connect(server, slow)
+
+        await server.broadcast_message("SESSION_UPDATE", UPDATE)
+        await asyncio.sleep(0.2)
+
+        assert slow.close_code == 1013
+        assert server.slow_drops == 1
+        assert server.connection_count == 0
+        slow.release()
+        await server.stop()
+
+    asyncio.run(scenario())
+
+
+def test_message_that_waited_too_long_drops_the_connection(monkeypatch):
+    async def scenario():
+        server = ControlServer("127.0.0.1", 0, _ignore, max_latency=5.0)
+        connection = FakeConnection()
+        connection.stalled = True
+        await _connect(server, connection)
+        await server.broadcast_message("SESSION_UPDATE", UPDATE)
+        await server.broadcast_message("SESSION_UPDATE", UPDATE)
+        await settle()
+
+        # The second message is now older than max_latency.
+        now = control.time.monotonic()
+        monkeypatch.setattr(control, "time", SimpleNamespace(monotonic=lambda: now + 10.0))
+        connection.release()
+        await settle()
+
+        assert len(connection.sent) == 1
+        assert connection.close_code == 1013
+        assert server.slow_drops == 1
+        await server.stop()
+
+    asyncio.run(scenario())
+
+
+def _binding_server(**kwargs) -> ControlServer:
+    """A server that binds each sender to the session named in its message."""
+
+    async def bind(message: dict) -> None:
+        payload = message["payload"]
+        server.bind_session(payload["session_id"], payload["device_id"])
+
+    server = ControlServer("127.0.0.1", 0, bind, **kwargs)
+    return server
+
+
+def _pair(connection: FakeConnection, session_id: str, device_id: str = "peer") -> None:
+    connection.deliver(
+        "PAIRING_ACCEPT",
+        {"session_id": session_id, "device_id": device_id, "session_token": "token"},
+    )
+
+
+def test_send_to_reaches_only_the_bound_connection():
+    async def scenario():
+        server = _binding_server()
+        paired, other = FakeConnection(), FakeConnection()
+        await _connect(server, paired)
+        await _connect(server, other)
+        _pair(paired, "session-1", "device-1")
+        await settle()
+
+        assert await server.send_to("session-1", "SESSION_UPDATE", UPDATE)
+        assert not await server.send_to("session-2", "SESSION_UPDATE", UPDATE)
+        await settle()
+
+        assert [message["payload"] for message in paired.sent] == [UPDATE]
+        assert other.sent == []
+        assert server.session_ids == ["session-1"]
+        assert server.device_id("session-1") == "device-1"
+        await server.stop()
+
+    asyncio.run(scenario())
+
+
+def test_binding_again_moves_the_session_to_the_new_connection():
+    closed = []
+
+    async def scenario():
+        server = _binding_server(on_session_closed=closed.append)
+        first, second = FakeConnection(), FakeConnection()
+        await _connect(server, first)
+        await _connect(server, second)
+        _pair(first, "session-1")
+        await settle()
+        _pair(second, "session-1")
+        await settle()
+
+        await server.send_to("session-1", "SESSION_UPDATE", UPDATE)
+        await settle()
+        assert first.sent == [] and len(second.sent) == 1
+
+        # The replaced connection no longer holds the session.
+        await first.close()
+        await settle()
+        assert closed == []
+        assert server.session_ids == ["session-1"]
+
+        await second.close()
+        await settle()
+        assert closed == ["session-1"]
+        assert server.session_ids == []
+        await server.stop()
+
+    asyncio.run(scenario())
+
+
+def test_forget_session_keeps_the_connection_open():
+    closed = []
+
+    async def scenario():
+        server = _binding_server(on_session_closed=closed.append)
+        connection = FakeConnection()
+        await _connect(server, connection)
+        _pair(connection, "session-1")
+        await settle()
+
+        server.forget_session("session-1")
+
+        assert not await server.send_to("session-1", "SESSION_UPDATE", UPDATE)
+        assert server.connection_count == 1
+        assert closed == []
+        await server.stop()
+
+    asyncio.run(scenario())
+
+
+def test_bind_session_outside_a_handler_is_refused():
+    server = ControlServer("127.0.0.1", 0, _ignore)
+
+    assert not server.bind_session("session-1", "peer")
+    assert server.session_ids == []
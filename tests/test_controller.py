@@ -0,0 +1,167 @@
+import asyncio
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("websockets")
+pytest.importorskip("zeroconf")
+pytest.importorskip("watchdog")
+
+from hyperdesk.core.controller import MAX_PEER_STREAMS, AppController  # noqa: E402
+from hyperdesk.network.control import ControlServer  # noqa: E402
+
+from tests.fakes import FakeConnection, settle  # noqa: E402
+
+SESSION_ID = "session-1"
+
+
+class _State:
+    def __init__(self) -> None:
+        self.session = SimpleNamespace(
+            id=SESSION_ID,
+            token="token-1",
+            peer_device=SimpleNamespace(id="peer", name="Peer"),
+        )
+        self.logs = []
+
+    def add_log(self, message: str) -> None:
+        self.logs.append(message)
+
+    def set_session(self, session) -> None:
+        self.session = session
+
+    def __getattr__(self, name):
+        # set_pairing_code, set_transfers, set_requests, ...
+        return lambda *args, **kwargs: None
+
+
+@pytest.fixture
+def control_loop():
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    yield loop
+    _on_loop(loop, _cancel_tasks())
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join(5)
+    loop.close()
+
+
+async def _cancel_tasks() -> None:
+    tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+
+def _on_loop(loop, coroutine):
+    return asyncio.run_coroutine_threadsafe(coroutine, loop).result(5)
+
+
+def _controller(loop) -> AppController:
+    """Just the state ``disconnect`` and the control handlers use."""
+    controller = AppController.__new__(AppController)
+    controller.state = _State()
+    controller.storage = SimpleNamespace(
+        update_session_status=lambda *args: None,
+        record_audit_event=lambda *args: None,
+    )
+    controller.pending_pairing = None
+    controller.data_server = None
+    controller._secure_channels = {}
+    controller._peer_local = False
+    controller._local_handoffs = {}
+    controller._control_loop = loop
+
+    async def bind(message: dict) -> None:
+        controller.control_server.bind_session(SESSION_ID, "peer")
+
+    controller.control_server = ControlServer("127.0.0.1", 0, bind)
+    return controller
+
+
+def test_disconnect_tells_the_peer_before_forgetting_its_route(control_loop):
+    controller = _controller(control_loop)
+    server = controller.control_server
+
+    async def pair():
+        connection = FakeConnection()
+        asyncio.ensure_future(server._handler(connection))
+        await settle()
+        connection.deliver(
+            "PAIRING_REQUEST", {"device_id": "peer", "pair_code": "123456"}
+        )
+        await settle()
+        return connection
+
+    connection = _on_loop(control_loop, pair())
+    assert server.session_ids == [SESSION_ID]
+
+    controller.disconnect()
+
+    async def drain():
+        for _ in range(100):
+            if connection.sent and not server.session_ids:
+                return
+            await asyncio.sleep(0.01)
+
+    _on_loop(control_loop, drain())
+    assert [(message["type"], message["payload"]["status"]) for message in connection.sent] == [
+        ("SESSION_UPDATE", "disconnected")
+    ]
+    assert server.session_ids == []
+    assert server.connection_count == 1
+
+
+def _pairing_controller() -> AppController:
+    """Just enough for the PAIRING_REQUEST handler to link a peer."""
+    controller = AppController.__new__(AppController)
+    controller.state = _State()
+    controller.pending_pairing = None
+    session = SimpleNamespace(
+        id=SESSION_ID,
+        status="active",
+        policy=SimpleNamespace(mode="approval", approval_required=True, conflict_rule="keep_both"),
+    )
+    controller.pairing = SimpleNamespace(
+        find_by_code=lambda code: "pending",
+        confirm_pairing=lambda *args, **kwargs: session,
+    )
+    controller.storage = SimpleNamespace(
+        get_preference=lambda key, default: default,
+        record_device=lambda device: None,
+        record_session=lambda session: None,
+        record_audit_event=lambda *args: None,
+    )
+    controller.requests = SimpleNamespace(list_requests=lambda session_id: [])
+    controller.control_server = SimpleNamespace(bind_session=lambda *args: None)
+    controller._broadcast_pairing_accept = lambda session: None
+    controller._broadcast_session_update = lambda *args, **kwargs: None
+    return controller
+
+
+@pytest.mark.parametrize(
+    "offered, expected",
+    [
+        (None, 1),
+        (4, 4),
+        (0, 1),
+        (-3, 1),
+        (10**9, MAX_PEER_STREAMS),
+        ("8", 1),
+        (2.5, 1),
+        (True, 1),
+    ],
+)
+def test_pairing_clamps_the_offered_data_streams(offered, expected):
+    controller = _pairing_controller()
+    payload = {"device_id": "peer", "pair_code": "123456"}
+    if offered is not None:
+        payload["data_streams"] = offered
+
+    asyncio.run(
+        controller._handle_control_message({"type": "PAIRING_REQUEST", "payload": payload})
+    )
+
+    assert controller._peer_data_streams == expected
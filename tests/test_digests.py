@@ -0,0 +1,125 @@
+import hashlib
+import os
+import zlib
+
+import pytest
+
+from hyperdesk.transfer.chunktree import build_chunk_tree
+from hyperdesk.transfer.digests import (
+    DEFAULT_ALGORITHM,
+    compute_digest,
+    export_state,
+    negotiate,
+    new_hasher,
+    restore_hasher,
+    supported_algorithms,
+    update_zeros,
+)
+from hyperdesk.transfer.engine import TransferEngine
+
+from tests.loopback import transfer
+
+
+def test_crc32_state_round_trips():
+    hasher = new_hasher("crc32")
+    hasher.update(b"first half ")
+
+    restored = restore_hasher("crc32", export_state(hasher))
+    restored.update(b"second half")
+
+    assert restored.hexdigest() == f"{zlib.crc32(b'first half second half'):08x}"
+
+
+@pytest.mark.parametrize("algorithm", ["sha256", "blake2b", "blake2s"])
+def test_hashlib_state_cannot_be_exported(algorithm):
+    hasher = new_hasher(algorithm)
+    hasher.update(b"data")
+
+    assert export_state(hasher) == ""
+    assert restore_hasher(algorithm, "") is None
+
+
+@pytest.mark.parametrize(
+    "algorithm, state",
+    [
+        ("crc32", ""),
+        ("crc32", "not hex"),
+        ("crc32", "1ffffffff"),
+        ("sha256", "00000000"),
+        ("nope", "00"),
+    ],
+)
+def test_unusable_states_are_not_restored(algorithm, state):
+    assert restore_hasher(algorithm, state) is None
+
+
+def test_preferred_algorithm_wins_when_shared():
+    assert negotiate(["sha256", "blake2b"], "blake2b") == "blake2b"
+
+
+def test_first_shared_cryptographic_algorithm_is_the_fallback():
+    assert negotiate(["blake2s", "crc32"], "blake2b") == "blake2s"
+    assert negotiate(["crc32", "xxh3_64"], "blake2b") == DEFAULT_ALGORITHM
+    assert negotiate([], "crc32") == DEFAULT_ALGORITHM
+
+
+def test_integrity_only_algorithm_needs_both_sides_to_ask():
+    assert negotiate(["crc32", "sha256"], "crc32") == "crc32"
+    assert negotiate(["sha256"], "crc32") == "sha256"
+
+
+def test_unknown_algorithm_is_rejected():
+    with pytest.raises(ValueError):
+        new_hasher("md5")
+    assert "md5" not in supported_algorithms()
+
+
+@pytest.mark.parametrize("algorithm", ["sha256", "blake2b", "blake2s"])
+def test_digest_matches_hashlib(tmp_path, algorithm):
+    data = os.urandom(3 * 1024 * 1024 + 5)
+    path = tmp_path / "data.bin"
+    path.write_bytes(data)
+
+    assert compute_digest(str(path), algorithm) == hashlib.new(algorithm, data).hexdigest()
+
+
+def test_update_zeros_feeds_zero_bytes():
+    hasher = new_hasher("crc32")
+    update_zeros(hasher, 3 * 1024 * 1024 + 1)
+
+    assert hasher.hexdigest() == f"{zlib.crc32(bytes(3 * 1024 * 1024 + 1)):08x}"
+
+
+@pytest.mark.parametrize("algorithm", ["blake2b", "crc32"])
+def test_copy_uses_the_requested_algorithm(tmp_path, algorithm):
+    data = os.urandom(2 * 1024 * 1024 + 7)
+    source = tmp_path / "source.bin"
+    source.write_bytes(data)
+
+    result = TransferEngine().copy_with_checksum(
+        str(source), str(tmp_path / "dest.bin"), hash_algorithm=algorithm
+    )
+
+    assert result.hash_algorithm == algorithm
+    assert result.checksum == compute_digest(str(source), algorithm)
+
+
+@pytest.mark.parametrize("tree_chunk_size", [None, 1024 * 1024])
+def test_network_transfer_uses_the_negotiated_algorithm(tmp_path, tree_chunk_size):
+    source = tmp_path / "source.bin"
+    source.write_bytes(os.urandom(2 * 1024 * 1024 + 7))
+    dest_dir = tmp_path / "dest"
+    dest_dir.mkdir()
+
+    sent, received = transfer(
+        source, dest_dir, hash_algorithm="blake2s", tree_chunk_size=tree_chunk_size
+    )
+
+    assert sent.hash_algorithm == received.hash_algorithm == "blake2s"
+    assert sent.checksum == received.checksum
+    if tree_chunk_size:
+        assert sent.checksum == build_chunk_tree(
+            str(source), tree_chunk_size, algorithm="blake2s"
+        ).root
+    else:
+        assert sent.checksum == compute_digest(str(source), "blake2s")
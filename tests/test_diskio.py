@@ -0,0 +1,123 @@
+import errno
+import os
+import shutil
+import threading
+
+import pytest
+
+from hyperdesk.transfer import diskio
+from hyperdesk.transfer.diskio import ensure_free_space, pread_into, preallocate
+from hyperdesk.transfer.engine import TransferEngine
+
+from tests.loopback import CHUNK, transfer
+
+
+@pytest.fixture(params=["preadv", "pread", "seek"])
+def backend(request, monkeypatch):
+    """Run with the positional read each platform has: Linux, macOS, Windows."""
+    if request.param != "preadv":
+        monkeypatch.delattr(os, "preadv", raising=False)
+    if request.param == "seek":
+        monkeypatch.delattr(os, "pread", raising=False)
+    elif not hasattr(os, request.param):
+        pytest.skip(f"os.{request.param} is not available")
+    return request.param
+
+
+def test_pread_into_reads_at_the_offset(tmp_path, backend):
+    data = os.urandom(4096)
+    path = tmp_path / "data.bin"
+    path.write_bytes(data)
+    view = memoryview(bytearray(1000))
+    fd = os.open(path, os.O_RDONLY | getattr(os, "O_BINARY", 0))
+    try:
+        assert pread_into(fd, view, 100) == 1000
+        assert bytes(view) == data[100:1100]
+        assert pread_into(fd, view, 3500) == 596
+        assert bytes(view[:596]) == data[3500:]
+        assert pread_into(fd, view, 4096) == 0
+    finally:
+        os.close(fd)
+
+
+def test_threads_can_share_the_descriptor(tmp_path, backend):
+    blocks = [bytes([index]) * 4096 for index in range(16)]
+    path = tmp_path / "data.bin"
+    path.write_bytes(b"".join(blocks))
+    fd = os.open(path, os.O_RDONLY | getattr(os, "O_BINARY", 0))
+    mismatches = []
+
+    def read(index):
+        view = memoryview(bytearray(4096))
+        for _ in range(200):
+            pread_into(fd, view, index * 4096)
+            if bytes(view) != blocks[index]:
+                mismatches.append(index)
+
+    threads = [threading.Thread(target=read, args=(index,)) for index in range(16)]
+    try:
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        os.close(fd)
+
+    assert mismatches == []
+
+
+def test_windowed_send_works_with_every_backend(tmp_path, backend):
+    source = tmp_path / "source.bin"
+    source.write_bytes(os.urandom(3 * CHUNK + 17))
+    dest_dir = tmp_path / "dest"
+    dest_dir.mkdir()
+
+    sent, received = transfer(source, dest_dir)
+
+    assert sent.checksum == received.checksum
+    assert received.path.read_bytes() == source.read_bytes()
+
+
+def _free_space(monkeypatch, free):
+    usage = shutil.disk_usage("/")
+    monkeypatch.setattr(
+        diskio.shutil, "disk_usage", lambda path: usage._replace(free=free)
+    )
+
+
+def test_free_space_check_raises_enospc(tmp_path, monkeypatch):
+    _free_space(monkeypatch, 1000)
+
+    ensure_free_space(str(tmp_path / "fits.bin"), 1000)
+    ensure_free_space(str(tmp_path / "nothing.bin"), -5)
+    with pytest.raises(OSError) as raised:
+        ensure_free_space(str(tmp_path / "too-big.bin"), 1001)
+
+    assert raised.value.errno == errno.ENOSPC
+
+
+def test_copy_without_space_fails_before_writing(tmp_path, monkeypatch):
+    source = tmp_path / "source.bin"
+    source.write_bytes(os.urandom(CHUNK))
+    dest = tmp_path / "dest.bin"
+    _free_space(monkeypatch, 0)
+
+    with pytest.raises(OSError) as raised:
+        TransferEngine().copy_with_checksum(str(source), str(dest))
+
+    assert raised.value.errno == errno.ENOSPC
+    assert not dest.exists()
+
+
+@pytest.mark.skipif(not hasattr(os, "posix_fallocate"), reason="no posix_fallocate")
+def test_preallocate_reserves_and_extends(tmp_path):
+    path = tmp_path / "work.bin"
+    with open(path, "wb") as handle:
+        handle.write(b"x" * 4096)
+        preallocate(handle.fileno(), 4096, 4 * CHUNK)
+        preallocate(handle.fileno(), 0, 0)
+
+    assert path.stat().st_size == 4096 + 4 * CHUNK
+    assert path.read_bytes()[:4096] == b"x" * 4096
+    if path.stat().st_blocks * 512 < 4 * CHUNK:
+        pytest.skip("filesystem does not reserve blocks")
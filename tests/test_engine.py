@@ -0,0 +1,217 @@
+import hashlib
+import os
+import zlib
+
+import pytest
+
+from hyperdesk.transfer import engine as engine_module
+from hyperdesk.transfer.checkpoint import Checkpoint, load_checkpoint, save_checkpoint
+from hyperdesk.transfer.chunktree import build_chunk_tree
+from hyperdesk.transfer.engine import TransferEngine
+from hyperdesk.transfer.finalize import incoming_path
+
+
+def _source(tmp_path, size=3 * 1024 * 1024 + 17):
+    path = tmp_path / "source.bin"
+    path.write_bytes(os.urandom(size))
+    return path
+
+
+def _sha256(path):
+    return hashlib.sha256(path.read_bytes()).hexdigest()
+
+
+def test_partial_file_without_checkpoint_is_not_trusted(tmp_path):
+    source = _source(tmp_path)
+    dest = tmp_path / "dest.bin"
+    # A preallocated work file whose checkpoint never made it to disk.
+    with open(incoming_path(str(dest)), "wb") as handle:
+        handle.truncate(source.stat().st_size)
+
+    result = TransferEngine().copy_with_checksum(str(source), str(dest), resume=True)
+
+    assert result.bytes_copied == source.stat().st_size
+    assert result.checksum == _sha256(source) == _sha256(dest)
+
+
+def test_resume_continues_from_checkpoint(tmp_path):
+    source = _source(tmp_path)
+    dest = tmp_path / "dest.bin"
+    work = incoming_path(str(dest))
+    prefix = 1024 * 1024
+    stat = source.stat()
+    with open(work, "wb") as handle:
+        handle.write(source.read_bytes()[:prefix])
+    save_checkpoint(work, Checkpoint(prefix, stat.st_size, stat.st_mtime_ns))
+    progress = []
+
+    result = TransferEngine().copy_with_checksum(
+        str(source), str(dest), resume=True, on_progress=lambda done, total: progress.append(done)
+    )
+
+    assert progress[0] > prefix
+    assert result.checksum == _sha256(source) == _sha256(dest)
+    assert load_checkpoint(work) is None
+
+
+def test_no_preallocation_when_checkpoint_cannot_be_written(tmp_path, monkeypatch):
+    source = _source(tmp_path)
+    dest = tmp_path / "dest.bin"
+    preallocated = []
+
+    def failing_save(dest_path, checkpoint):
+        raise OSError("read-only")
+
+    monkeypatch.setattr(engine_module, "save_checkpoint", failing_save)
+    monkeypatch.setattr(
+        engine_module, "preallocate", lambda *args: preallocated.append(args)
+    )
+
+    result = TransferEngine().copy_with_checksum(str(source), str(dest))
+
+    assert preallocated == []
+    assert result.checksum == _sha256(source) == _sha256(dest)
+
+
+class _Interrupted(Exception):
+    pass
+
+
+def _interrupt_after(limit):
+    def on_progress(done, total):
+        if done >= limit:
+            raise _Interrupted()
+
+    return on_progress
+
+
+def test_interrupted_copy_resumes_in_a_new_engine(tmp_path):
+    source = _source(tmp_path)
+    dest = tmp_path / "dest.bin"
+    with pytest.raises(_Interrupted):
+        TransferEngine().copy_with_checksum(
+            str(source),
+            str(dest),
+            retry_policy="none",
+            on_progress=_interrupt_after(2 * 1024 * 1024),
+        )
+    checkpoint = load_checkpoint(incoming_path(str(dest)))
+    assert checkpoint.offset == 2 * 1024 * 1024
+    progress = []
+
+    result = TransferEngine().copy_with_checksum(
+        str(source), str(dest), resume=True, on_progress=lambda done, total: progress.append(done)
+    )
+
+    assert progress[0] > checkpoint.offset
+    assert result.checksum == _sha256(source) == _sha256(dest)
+
+
+def test_saved_crc32_state_resumes_without_reading_the_prefix(tmp_path):
+    source = _source(tmp_path)
+    work = incoming_path(str(tmp_path / "dest.bin"))
+    prefix = 1024 * 1024
+    data = source.read_bytes()
+    stat = source.stat()
+    # The partial file holds zeros: only a hasher that never read it can
+    # still match the source prefix.
+    with open(work, "wb") as handle:
+        handle.write(bytes(prefix))
+    state = f"{zlib.crc32(data[:prefix]):08x}"
+    save_checkpoint(
+        work, Checkpoint(prefix, stat.st_size, stat.st_mtime_ns, "crc32", hash_state=state)
+    )
+
+    offset, hasher = TransferEngine()._resume_point(stat, work, 1024 * 1024, "crc32")
+
+    assert offset == prefix
+    hasher.update(data[prefix:])
+    assert hasher.hexdigest() == f"{zlib.crc32(data):08x}"
+
+
+def test_crc32_copy_checkpoints_its_hash_state(tmp_path):
+    source = _source(tmp_path)
+    dest = tmp_path / "dest.bin"
+    with pytest.raises(_Interrupted):
+        TransferEngine().copy_with_checksum(
+            str(source),
+            str(dest),
+            retry_policy="none",
+            hash_algorithm="crc32",
+            on_progress=_interrupt_after(1024 * 1024),
+        )
+    checkpoint = load_checkpoint(incoming_path(str(dest)))
+    prefix = source.read_bytes()[: checkpoint.offset]
+    assert checkpoint.hash_state == f"{zlib.crc32(prefix):08x}"
+
+    result = TransferEngine().copy_with_checksum(
+        str(source), str(dest), resume=True, hash_algorithm="crc32"
+    )
+
+    assert result.checksum == f"{zlib.crc32(source.read_bytes()):08x}"
+    assert _sha256(dest) == _sha256(source)
+
+
+def test_parallel_copy_hashes_one_chunk_per_range(tmp_path):
+    source = _source(tmp_path)
+    dest = tmp_path / "dest.bin"
+    range_size = 1024 * 1024
+
+    result = TransferEngine().copy_with_checksum(
+        str(source), str(dest), workers=3, range_size=range_size
+    )
+
+    assert result.strategy == "parallel"
+    assert result.bytes_copied == source.stat().st_size
+    assert result.checksum == build_chunk_tree(str(source), range_size).root
+    assert len(result.chunk_tree.digests) == 4
+    assert _sha256(dest) == _sha256(source)
+
+
+def test_files_within_one_range_copy_serially(tmp_path):
+    source = _source(tmp_path)
+
+    result = TransferEngine().copy_with_checksum(
+        str(source), str(tmp_path / "dest.bin"), workers=3, range_size=8 * 1024 * 1024
+    )
+
+    assert result.strategy != "parallel"
+    assert result.checksum == _sha256(source)
+
+
+def test_parallel_copy_resumes_only_missing_ranges(tmp_path, monkeypatch):
+    source = _source(tmp_path)
+    dest = tmp_path / "dest.bin"
+    work = incoming_path(str(dest))
+    range_size = 1024 * 1024
+    data = source.read_bytes()
+    stat = source.stat()
+    tree = build_chunk_tree(str(source), range_size)
+    with open(work, "wb") as handle:
+        handle.write(data[: 2 * range_size])
+    save_checkpoint(
+        work,
+        Checkpoint(
+            0,
+            stat.st_size,
+            stat.st_mtime_ns,
+            range_size=range_size,
+            range_digests=[[0, tree.digests[0]], [1, tree.digests[1]]],
+        ),
+    )
+    copied = []
+    copy_range = engine_module._copy_range_positional
+
+    def recording_copy(source_path, dest_path, offset, *args, **kwargs):
+        copied.append(offset)
+        return copy_range(source_path, dest_path, offset, *args, **kwargs)
+
+    monkeypatch.setattr(engine_module, "_copy_range_positional", recording_copy)
+
+    result = TransferEngine().copy_with_checksum(
+        str(source), str(dest), resume=True, workers=2, range_size=range_size
+    )
+
+    assert sorted(copied) == [2 * range_size, 3 * range_size]
+    assert result.checksum == tree.root
+    assert _sha256(dest) == _sha256(source)
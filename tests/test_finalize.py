@@ -0,0 +1,136 @@
+import os
+import threading
+import time
+
+import pytest
+
+from hyperdesk.transfer import finalize as finalize_module
+from hyperdesk.transfer.finalize import (
+    DURABILITY_MODES,
+    GroupCommitter,
+    finalize,
+    incoming_path,
+    is_transient,
+)
+
+
+def _staged(directory, name, data=b"payload"):
+    dest = directory / name
+    temp = incoming_path(str(dest))
+    with open(temp, "wb") as handle:
+        handle.write(data)
+    return temp, dest
+
+
+@pytest.fixture
+def syncs(monkeypatch):
+    """Record fsyncs instead of issuing them."""
+    calls = {"files": [], "dirs": []}
+    lock = threading.Lock()
+
+    def fsync_path(path):
+        with lock:
+            calls["files"].append(path)
+
+    def fsync_dir(directory):
+        with lock:
+            calls["dirs"].append(directory)
+
+    monkeypatch.setattr(finalize_module, "_fsync_path", fsync_path)
+    monkeypatch.setattr(finalize_module, "_fsync_dir", fsync_dir)
+    return calls
+
+
+def test_transient_names():
+    assert is_transient(".incoming_report.pdf")
+    assert is_transient("report.pdf.hdck")
+    assert not is_transient("report.pdf")
+    assert not is_transient("notes.incoming_.txt")
+
+
+@pytest.mark.parametrize("durability", DURABILITY_MODES)
+def test_every_mode_publishes_the_file(tmp_path, durability):
+    temp, dest = _staged(tmp_path, "file.bin")
+
+    finalize(temp, str(dest), durability, committer=GroupCommitter(window=0))
+
+    assert dest.read_bytes() == b"payload"
+    assert not os.path.exists(temp)
+
+
+def test_modes_sync_what_they_promise(tmp_path, syncs):
+    temp, dest = _staged(tmp_path, "none.bin")
+    finalize(temp, str(dest), "none")
+    assert syncs == {"files": [], "dirs": []}
+
+    temp, dest = _staged(tmp_path, "file.bin")
+    finalize(temp, str(dest), "file")
+    assert syncs == {"files": [temp], "dirs": [str(tmp_path)]}
+
+
+def test_unknown_mode_is_rejected(tmp_path):
+    temp, dest = _staged(tmp_path, "file.bin")
+
+    with pytest.raises(ValueError):
+        finalize(temp, str(dest), "paranoid")
+    assert os.path.exists(temp)
+
+
+def _commit_together(committer, staged):
+    errors = {}
+
+    def commit(temp, dest):
+        try:
+            committer.commit(temp, str(dest))
+        except OSError as exc:
+            errors[dest.name] = exc
+
+    threads = [threading.Thread(target=commit, args=pair) for pair in staged]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return errors
+
+
+def test_batch_shares_one_directory_sync(tmp_path, syncs):
+    staged = [_staged(tmp_path, f"file-{index}.bin") for index in range(6)]
+
+    errors = _commit_together(GroupCommitter(window=0.2, max_batch=6), staged)
+
+    assert errors == {}
+    assert sorted(syncs["files"]) == sorted(temp for temp, _dest in staged)
+    assert syncs["dirs"] == [str(tmp_path)]
+    assert all(dest.read_bytes() == b"payload" for _temp, dest in staged)
+
+
+def test_batch_syncs_its_files_concurrently(tmp_path, monkeypatch):
+    active = []
+    peak = []
+    lock = threading.Lock()
+
+    def slow_fsync(path):
+        with lock:
+            active.append(path)
+            peak.append(len(active))
+        time.sleep(0.05)
+        with lock:
+            active.remove(path)
+
+    monkeypatch.setattr(finalize_module, "_fsync_path", slow_fsync)
+    staged = [_staged(tmp_path, f"file-{index}.bin") for index in range(4)]
+
+    _commit_together(GroupCommitter(window=0.2, max_batch=4), staged)
+
+    assert max(peak) == 4
+
+
+def test_batch_failure_only_reaches_its_caller(tmp_path, syncs):
+    staged = [_staged(tmp_path, f"file-{index}.bin") for index in range(3)]
+    missing_dir = tmp_path / "gone"
+    staged.append((_staged(tmp_path, "orphan.bin")[0], missing_dir / "orphan.bin"))
+
+    errors = _commit_together(GroupCommitter(window=0.2, max_batch=4), staged)
+
+    assert list(errors) == ["orphan.bin"]
+    assert all(dest.exists() for _temp, dest in staged[:3])
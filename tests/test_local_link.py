@@ -0,0 +1,137 @@
+import asyncio
+import socket
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("websockets")
+pytest.importorskip("zeroconf")
+pytest.importorskip("watchdog")
+
+from hyperdesk import peer  # noqa: E402
+from hyperdesk.core.controller import AppController  # noqa: E402
+from hyperdesk.network.control import ControlClient, ControlServer  # noqa: E402
+from hyperdesk.network.local import host_identity  # noqa: E402
+
+SESSION_ID = "session-1"
+SESSION_TOKEN = "token-1"
+
+
+class _State:
+    def __init__(self) -> None:
+        self.session = SimpleNamespace(
+            id=SESSION_ID, token=SESSION_TOKEN, peer_device=SimpleNamespace(id="peer")
+        )
+        self.logs = []
+
+    def add_log(self, message: str) -> None:
+        self.logs.append(message)
+
+
+def _free_port() -> int:
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        return probe.getsockname()[1]
+
+
+def _controller(unix_path: str, port: int) -> AppController:
+    """Just the state the LOCAL_LINK and session-closed handlers use."""
+    controller = AppController.__new__(AppController)
+    controller.state = _State()
+    controller._peer_local = False
+    controller._local_handoffs = {}
+    controller.control_server = ControlServer(
+        "127.0.0.1",
+        port,
+        controller._handle_control_message,
+        unix_path=unix_path,
+        on_session_closed=controller._handle_session_closed,
+    )
+    return controller
+
+
+async def _until(condition, timeout: float = 5.0) -> None:
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not condition():
+        assert asyncio.get_running_loop().time() < deadline, "timed out"
+        await asyncio.sleep(0.01)
+
+
+def _link_payload() -> dict:
+    return {
+        "session_id": SESSION_ID,
+        "session_token": SESSION_TOKEN,
+        "host_identity": host_identity(),
+    }
+
+
+def test_local_link_only_over_unix_socket(tmp_path):
+    async def scenario():
+        port = _free_port()
+        controller = _controller(str(tmp_path / "control.sock"), port)
+        server = controller.control_server
+        await server.start()
+        assert server.unix_path
+        try:
+            remote = ControlClient(f"ws://127.0.0.1:{port}")
+            await remote.connect()
+            await remote.send("LOCAL_LINK", _link_payload())
+            await _until(lambda: any("Unix socket" in log for log in controller.state.logs))
+            assert not controller._peer_local
+            assert server.session_ids == []
+            with pytest.raises(asyncio.TimeoutError):
+                await asyncio.wait_for(remote.recv(), 0.2)
+            await remote.disconnect()
+
+            local = ControlClient("ws://localhost/", unix_path=server.unix_path)
+            await local.connect()
+            await local.send("LOCAL_LINK", _link_payload())
+            confirmation = await asyncio.wait_for(local.recv(), 5)
+            assert confirmation["type"] == "LOCAL_LINK"
+            assert confirmation["payload"]["session_id"] == SESSION_ID
+            assert confirmation["payload"]["session_token"] == ""
+            assert controller._peer_local
+            assert server.session_ids == [SESSION_ID]
+            assert server.is_loopback(SESSION_ID)
+
+            # The link does not outlive the connection that made it.
+            await local.disconnect()
+            await _until(lambda: not controller._peer_local)
+            assert server.session_ids == []
+        finally:
+            await server.stop()
+
+    asyncio.run(scenario())
+
+
+@pytest.mark.parametrize("token, switches", [(SESSION_TOKEN, True), ("stolen", False)])
+def test_peer_leaves_tcp_only_once_the_host_confirms(tmp_path, monkeypatch, token, switches):
+    monkeypatch.setattr(peer, "LOCAL_LINK_TIMEOUT", 0.3)
+
+    async def scenario():
+        port = _free_port()
+        controller = _controller(str(tmp_path / "control.sock"), port)
+        server = controller.control_server
+        await server.start()
+        try:
+            remote = ControlClient(f"ws://127.0.0.1:{port}")
+            await remote.connect()
+
+            client = await peer._switch_to_local(remote, server.unix_path, SESSION_ID, token)
+
+            if switches:
+                assert client is not remote
+                assert client.unix_path == server.unix_path
+                assert controller._peer_local
+                await client.disconnect()
+            else:
+                # Refused: the peer is still on its working TCP connection.
+                assert client is remote
+                assert not controller._peer_local
+                await remote.send("LOCAL_LINK", _link_payload())
+                await _until(lambda: any("Unix socket" in log for log in controller.state.logs))
+                await remote.disconnect()
+        finally:
+            await server.stop()
+
+    asyncio.run(scenario())
@@ -0,0 +1,110 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from hyperdesk.core.progress import ProgressCoalescer
+
+
+def test_one_update_per_job_per_interval():
+    coalescer = ProgressCoalescer(interval=10.0)
+
+    assert coalescer.due("a")
+    assert not coalescer.due("a")
+    assert coalescer.due("b")
+
+
+def test_next_interval_lets_an_update_through():
+    coalescer = ProgressCoalescer(interval=0.05)
+    assert coalescer.due("a")
+    assert not coalescer.due("a")
+
+    time.sleep(0.06)
+
+    assert coalescer.due("a")
+
+
+def test_finish_forgets_the_job():
+    coalescer = ProgressCoalescer(interval=10.0)
+    coalescer.due("a")
+
+    coalescer.finish("a")
+
+    assert coalescer.due("a")
+    coalescer.finish("never-seen")
+
+
+class _Client:
+    """Holds every send until ``release`` is called."""
+
+    def __init__(self) -> None:
+        self.sent = []
+        self.gate = asyncio.Event()
+
+    async def send(self, message_type, payload):
+        await self.gate.wait()
+        self.sent.append(payload["bytes_copied"])
+
+
+@pytest.fixture
+def reporter_loop():
+    pytest.importorskip("websockets")
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    yield loop
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join(5)
+    loop.close()
+
+
+def _reporter(loop, interval):
+    from hyperdesk.peer import _ProgressReporter
+
+    client = _Client()
+    return client, _ProgressReporter(client, loop, "job", "file.bin", interval)
+
+
+def _on_loop(loop, callback):
+    asyncio.run_coroutine_threadsafe(_call(callback), loop).result(5)
+
+
+async def _call(callback):
+    callback()
+    await asyncio.sleep(0.05)
+
+
+def test_reporter_keeps_one_update_in_flight_and_sends_the_newest(reporter_loop):
+    client, reporter = _reporter(reporter_loop, interval=0)
+
+    for received in (1, 2, 3):
+        reporter(received, 10)
+    _on_loop(reporter_loop, client.gate.set)
+
+    # 2 was replaced by 3 while 1 was still on its way.
+    assert client.sent == [1, 3]
+
+
+def test_reporter_holds_back_updates_but_not_the_last(reporter_loop):
+    client, reporter = _reporter(reporter_loop, interval=10.0)
+    _on_loop(reporter_loop, client.gate.set)
+
+    for received in range(1, 10):
+        reporter(received, 10)
+    reporter(10, 10)
+    _on_loop(reporter_loop, lambda: None)
+
+    assert client.sent == [10]
+
+
+def test_close_drops_what_is_unsent(reporter_loop):
+    client, reporter = _reporter(reporter_loop, interval=0)
+    reporter(1, 10)
+    reporter(2, 10)
+
+    reporter.close()
+    reporter(3, 10)
+    _on_loop(reporter_loop, client.gate.set)
+
+    assert client.sent == [1]
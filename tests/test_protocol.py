@@ -0,0 +1,132 @@
+import json
+
+import pytest
+
+from hyperdesk.network.protocol import (
+    CODEC_BINARY,
+    CODEC_JSON,
+    PROTOCOL_VERSION,
+    ProtocolError,
+    decode_any,
+    decode_binary,
+    encode_binary,
+    encode_for,
+    encode_message,
+    supports_binary,
+)
+
+
+STATUS = {
+    "job_id": "job-1",
+    "path": "movie.mkv",
+    "status": "receiving",
+    "progress": 0.25,
+    "checksum": "",
+    "bytes_copied": 1024,
+    "size": 4096,
+    "direction": "download",
+    "rate_mbps": 12.5,
+}
+
+
+@pytest.mark.parametrize("codec", [CODEC_JSON, CODEC_BINARY])
+def test_round_trip(codec):
+    raw = encode_for(codec, "TRANSFER_STATUS", STATUS, request_id="req-7")
+
+    message = decode_any(raw)
+
+    assert message["type"] == "TRANSFER_STATUS"
+    assert message["request_id"] == "req-7"
+    assert message["payload"] == STATUS
+
+
+def test_binary_keeps_exact_types():
+    payload = dict(STATUS, progress=1, bytes_copied=True, extra={"nested": [1, 2]})
+
+    decoded = decode_binary(encode_binary("TRANSFER_STATUS", payload))["payload"]
+
+    assert decoded == payload
+    assert type(decoded["progress"]) is int
+    assert type(decoded["bytes_copied"]) is bool
+
+
+def test_binary_is_smaller_than_json():
+    assert len(encode_binary("TRANSFER_STATUS", STATUS)) < len(
+        encode_message("TRANSFER_STATUS", STATUS)
+    )
+
+
+@pytest.mark.parametrize("value", [2**63, -(2**63) - 1, 10**30])
+def test_ints_outside_int64_go_through_extras(value):
+    payload = dict(STATUS, bytes_copied=value)
+
+    decoded = decode_binary(encode_binary("TRANSFER_STATUS", payload))["payload"]
+
+    assert decoded["bytes_copied"] == value
+
+
+@pytest.mark.parametrize("value", [2**63 - 1, -(2**63)])
+def test_int64_limits_are_packed(value):
+    payload = dict(STATUS, size=value)
+
+    raw = encode_binary("TRANSFER_STATUS", payload)
+
+    assert decode_binary(raw)["payload"]["size"] == value
+    assert b"size" not in raw
+
+
+@pytest.mark.parametrize(
+    "payload",
+    [dict(STATUS, checksum="\ud800"), dict(STATUS, extra=object())],
+)
+def test_unencodable_payload_raises_protocol_error(payload):
+    with pytest.raises(ProtocolError):
+        encode_binary("TRANSFER_STATUS", payload)
+
+
+def test_missing_required_field():
+    payload = dict(STATUS)
+    del payload["job_id"]
+    with pytest.raises(ProtocolError):
+        encode_binary("TRANSFER_STATUS", payload)
+
+
+@pytest.mark.parametrize("cut", [1, 5, 20])
+def test_truncated_binary_message(cut):
+    raw = encode_binary("TRANSFER_STATUS", STATUS)
+    with pytest.raises(ProtocolError):
+        decode_binary(raw[:cut])
+
+
+def test_trailing_bytes_are_rejected():
+    raw = encode_binary("TRANSFER_STATUS", STATUS)
+    with pytest.raises(ProtocolError):
+        decode_binary(raw + b"x")
+
+
+def test_unknown_type_id():
+    raw = bytearray(encode_binary("TRANSFER_STATUS", STATUS))
+    raw[1] = 250
+    with pytest.raises(ProtocolError):
+        decode_binary(bytes(raw))
+
+
+def test_json_messages_still_decode():
+    raw = json.dumps(
+        {
+            "version": "0.1",
+            "type": "TRANSFER_STATUS",
+            "request_id": None,
+            "timestamp": "2024-01-01T00:00:00+00:00",
+            "payload": STATUS,
+        }
+    )
+
+    assert decode_any(raw)["payload"] == STATUS
+
+
+def test_supports_binary():
+    assert supports_binary(PROTOCOL_VERSION)
+    assert not supports_binary("0.1")
+    assert not supports_binary("dev")
+    assert not supports_binary(None)
@@ -0,0 +1,106 @@
+import os
+import socket
+import threading
+
+import pytest
+
+from hyperdesk.transfer.channel import FileSender, receive_file
+from hyperdesk.transfer.secure import SecureChannel, is_secure
+
+from tests.loopback import CHUNK
+
+
+def _handshake(server_channel, client_channel):
+    """Wrap both ends of one loopback connection; return both sockets."""
+    with socket.create_server(("127.0.0.1", 0)) as listener:
+        client_raw = socket.create_connection(listener.getsockname())
+        server_raw, _addr = listener.accept()
+    outcome = {}
+
+    def serve():
+        try:
+            outcome["server"] = server_channel.wrap_server(server_raw)
+        except ConnectionError as exc:
+            outcome["error"] = exc
+
+    thread = threading.Thread(target=serve)
+    thread.start()
+    try:
+        client = client_channel.wrap_client(client_raw)
+    finally:
+        thread.join()
+    if "error" in outcome:
+        client.close()
+        raise outcome["error"]
+    return outcome["server"], client
+
+
+def test_matching_tokens_connect_and_resume():
+    server_channel, client_channel = SecureChannel("token"), SecureChannel("token")
+
+    reused = []
+    for _ in range(2):
+        server, client = _handshake(server_channel, client_channel)
+        with server, client:
+            assert is_secure(server) and is_secure(client)
+            client.sendall(b"ping")
+            assert server.recv(4) == b"ping"
+            reused.append(client.session_reused)
+
+    # The second connection skips the key exchange.
+    assert reused == [False, True]
+
+
+def test_peer_without_the_token_is_refused():
+    with pytest.raises(ConnectionError):
+        _handshake(SecureChannel("token"), SecureChannel("guess"))
+
+
+def _secure_transfer(source, dest_dir, sender_token, receiver_token, **options):
+    sender = FileSender(
+        chunk_size=CHUNK, max_streams=options.get("streams", 1), secure=SecureChannel(sender_token)
+    )
+    port = sender.open()
+    outcome = {}
+
+    def send():
+        try:
+            outcome["result"] = sender.send_file(source, **options)
+        except Exception as exc:
+            outcome["error"] = exc
+
+    thread = threading.Thread(target=send)
+    thread.start()
+    try:
+        received = receive_file(
+            "127.0.0.1", port, dest_dir, secure=SecureChannel(receiver_token), **options
+        )
+    finally:
+        thread.join()
+        sender.close()
+    if "error" in outcome:
+        raise outcome["error"]
+    return outcome["result"], received
+
+
+@pytest.mark.parametrize("options", [{}, {"streams": 3, "range_size": 2 * CHUNK}])
+def test_encrypted_transfer_round_trips(tmp_path, options):
+    source = tmp_path / "source.bin"
+    source.write_bytes(os.urandom(7 * CHUNK + 3))
+    dest_dir = tmp_path / "dest"
+
+    sent, received = _secure_transfer(source, dest_dir, "token", "token", **options)
+
+    assert sent.checksum == received.checksum
+    assert received.path.read_bytes() == source.read_bytes()
+
+
+def test_transfer_to_a_receiver_without_the_token_fails(tmp_path):
+    source = tmp_path / "source.bin"
+    source.write_bytes(os.urandom(CHUNK))
+    dest_dir = tmp_path / "dest"
+
+    with pytest.raises(ConnectionError):
+        _secure_transfer(source, dest_dir, "token", "guess")
+
+    assert not (dest_dir / "source.bin").exists()
@@ -0,0 +1,135 @@
+import os
+import threading
+import time
+
+import pytest
+
+from hyperdesk.transfer.channel import RESUME_MIN_SIZE, SessionDataServer, SessionReceiver
+from hyperdesk.transfer.checkpoint import load_checkpoint
+from hyperdesk.transfer.finalize import INCOMING_PREFIX
+
+from tests.loopback import CHUNK
+
+SIZE = RESUME_MIN_SIZE + 4 * CHUNK + 11
+
+
+class _Aborted(Exception):
+    pass
+
+
+class _Completions:
+    """Collects ``on_complete`` calls by the ``job`` in each stream's meta."""
+
+    def __init__(self) -> None:
+        self.outcomes = {}
+        self._cond = threading.Condition()
+
+    def __call__(self, meta, result, error) -> None:
+        with self._cond:
+            self.outcomes[meta.get("job")] = (result, error)
+            self._cond.notify_all()
+
+    def wait(self, job, timeout=10.0):
+        with self._cond:
+            assert self._cond.wait_for(lambda: job in self.outcomes, timeout)
+            return self.outcomes.pop(job)
+
+
+@pytest.fixture
+def session(tmp_path):
+    server = SessionDataServer(
+        lambda hello: "s1" if hello.get("token") == "secret" else None,
+        host="127.0.0.1",
+        chunk_size=CHUNK,
+    )
+    port = server.open()
+    completions = _Completions()
+    receiver = SessionReceiver(
+        "127.0.0.1", port, {"token": "secret"}, tmp_path / "inbox", on_complete=completions
+    )
+    receiver.connect()
+    link = None
+    for _ in range(100):
+        link = server.link("s1")
+        if link:
+            break
+        time.sleep(0.01)
+    assert link is not None
+    yield link, completions, tmp_path / "inbox"
+    receiver.close()
+    server.close()
+
+
+def _source(tmp_path, name):
+    path = tmp_path / name
+    path.write_bytes(os.urandom(SIZE))
+    return path
+
+
+def _abort_after(limit):
+    def on_progress(sent, total):
+        if sent >= limit:
+            raise _Aborted()
+
+    return on_progress
+
+
+def test_concurrent_streams_survive_one_being_aborted(tmp_path, session):
+    link, completions, inbox = session
+    kept, dropped = _source(tmp_path, "kept.bin"), _source(tmp_path, "dropped.bin")
+    outcome = {}
+
+    def send(source, job, **options):
+        try:
+            outcome[job] = link.send_file(link.new_stream(), source, {"job": job}, **options)
+        except _Aborted as exc:
+            outcome[job] = exc
+
+    threads = [
+        threading.Thread(target=send, args=(kept, "kept")),
+        threading.Thread(
+            target=send,
+            args=(dropped, "dropped"),
+            kwargs={"on_progress": _abort_after(3 * CHUNK)},
+        ),
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    result, error = completions.wait("kept")
+    assert error is None
+    assert result.path.read_bytes() == kept.read_bytes()
+    assert result.checksum == outcome["kept"].checksum
+
+    result, error = completions.wait("dropped")
+    assert result is None and isinstance(error, ConnectionError)
+    assert isinstance(outcome["dropped"], _Aborted)
+    assert not (inbox / "dropped.bin").exists()
+    partial = inbox / f"{INCOMING_PREFIX}dropped.bin"
+    checkpoint = load_checkpoint(str(partial))
+    assert checkpoint and checkpoint.offset >= 3 * CHUNK
+
+    # The link is still usable and the aborted file resumes from its checkpoint.
+    sent = link.send_file(link.new_stream(), dropped, {"job": "dropped"})
+
+    result, error = completions.wait("dropped")
+    assert error is None
+    assert sent.resumed_bytes == checkpoint.offset
+    assert result.path.read_bytes() == dropped.read_bytes()
+    assert not partial.exists()
+
+
+def test_unauthenticated_peer_gets_no_link(tmp_path):
+    server = SessionDataServer(lambda hello: None, host="127.0.0.1")
+    port = server.open()
+    receiver = SessionReceiver("127.0.0.1", port, {"token": "wrong"}, tmp_path / "inbox")
+    try:
+        receiver.connect()
+        receiver._thread.join(5)
+        assert not receiver.connected
+        assert server.link("s1") is None
+    finally:
+        receiver.close()
+        server.close()
@@ -0,0 +1,81 @@
+import hashlib
+import os
+
+import pytest
+
+from hyperdesk.transfer.chunktree import build_chunk_tree
+from hyperdesk.transfer.engine import TransferEngine
+from hyperdesk.transfer.sparse import is_sparse, next_extent
+
+from tests.loopback import transfer
+
+MB = 1024 * 1024
+
+
+def _sparse_source(tmp_path):
+    """4 KiB data, 16 MiB hole, 4 KiB data, then a 4 MiB trailing hole."""
+    path = tmp_path / "sparse.bin"
+    with open(path, "wb") as handle:
+        handle.write(os.urandom(4096))
+        handle.seek(16 * MB)
+        handle.write(os.urandom(4096))
+        handle.truncate(20 * MB + 4096)
+    if not is_sparse(path.stat()):
+        pytest.skip("filesystem does not keep holes")
+    return path
+
+
+def _allocated(path):
+    return path.stat().st_blocks * 512
+
+
+def test_extents_alternate_between_data_and_holes(tmp_path):
+    path = _sparse_source(tmp_path)
+    size = path.stat().st_size
+    extents = []
+    with open(path, "rb") as handle:
+        position = 0
+        while position < size:
+            is_data, end = next_extent(handle.fileno(), position, size)
+            extents.append((is_data, position, end))
+            position = end
+
+    assert [is_data for is_data, _start, _end in extents] == [True, False, True, False]
+    assert extents[1][2] <= 16 * MB
+    assert extents[-1][2] == size
+
+
+def test_local_copy_keeps_holes(tmp_path):
+    source = _sparse_source(tmp_path)
+    dest = tmp_path / "dest.bin"
+
+    result = TransferEngine().copy_with_checksum(str(source), str(dest))
+
+    assert result.checksum == hashlib.sha256(source.read_bytes()).hexdigest()
+    assert result.hole_bytes >= 19 * MB
+    assert dest.read_bytes() == source.read_bytes()
+    assert _allocated(dest) < MB
+
+
+def test_chunk_tree_covers_holes_as_zeros(tmp_path):
+    source = _sparse_source(tmp_path)
+
+    result = TransferEngine().copy_with_checksum(
+        str(source), str(tmp_path / "dest.bin"), chunk_size=MB, chunk_hashes=True
+    )
+
+    assert result.checksum == build_chunk_tree(str(source), MB).root
+
+
+def test_network_transfer_keeps_holes(tmp_path):
+    source = _sparse_source(tmp_path)
+    dest_dir = tmp_path / "dest"
+    dest_dir.mkdir()
+
+    sent, received = transfer(source, dest_dir)
+
+    assert sent.hole_bytes >= 19 * MB
+    assert sent.wire_bytes < MB
+    assert received.checksum == hashlib.sha256(source.read_bytes()).hexdigest()
+    assert received.path.read_bytes() == source.read_bytes()
+    assert _allocated(received.path) < MB
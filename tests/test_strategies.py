@@ -0,0 +1,88 @@
+import hashlib
+import os
+
+import pytest
+
+from hyperdesk.transfer import engine as engine_module
+from hyperdesk.transfer.engine import TransferEngine
+from hyperdesk.transfer.strategies import (
+    BufferedCopy,
+    CopyStrategy,
+    StrategyUnsupported,
+    available_strategies,
+)
+
+
+def _buffer(size=1024 * 1024):
+    return memoryview(bytearray(size))
+
+
+def test_buffered_copy_is_always_last():
+    for hashed in (False, True):
+        strategies = available_strategies(_buffer(), hashed=hashed)
+        assert isinstance(strategies[-1], BufferedCopy)
+        assert [s for s in strategies if s.name == "buffered"] == [strategies[-1]]
+
+
+def test_hashed_copies_only_keep_strategies_that_share_extents():
+    strategies = available_strategies(_buffer(), hashed=True)
+
+    assert all(s.shares_extents for s in strategies[:-1])
+    assert "copy_file_range" not in [s.name for s in strategies]
+    assert "sendfile" not in [s.name for s in strategies]
+
+
+@pytest.mark.parametrize(
+    "strategy", available_strategies(_buffer()), ids=lambda strategy: strategy.name
+)
+def test_strategy_copies_the_range_at_its_offset(tmp_path, strategy):
+    data = os.urandom(256 * 1024)
+    source = tmp_path / "source.bin"
+    source.write_bytes(data)
+    dest = tmp_path / "dest.bin"
+    dest.write_bytes(b"\0" * len(data))
+    offset, length = 64 * 1024, 128 * 1024
+
+    with open(source, "rb", buffering=0) as src, open(dest, "r+b", buffering=0) as dst:
+        try:
+            count = strategy.copy_range(src, dst, offset, length)
+        except StrategyUnsupported:
+            pytest.skip(f"{strategy.name} does not work on this filesystem")
+
+    copied = dest.read_bytes()
+    assert count == length
+    assert copied[offset : offset + length] == data[offset : offset + length]
+    assert copied[:offset] == b"\0" * offset
+
+
+class _Unsupported(CopyStrategy):
+    name = "unsupported"
+    zero_copy = True
+
+    def __init__(self):
+        self.calls = 0
+
+    def copy_range(self, source, dest, offset, length):
+        self.calls += 1
+        raise StrategyUnsupported("not here")
+
+
+def test_engine_falls_back_and_remembers_unsupported_pairs(tmp_path, monkeypatch):
+    unsupported = _Unsupported()
+    monkeypatch.setattr(
+        engine_module,
+        "available_strategies",
+        lambda buffer, hashed=False: [unsupported, BufferedCopy(buffer)],
+    )
+    source = tmp_path / "source.bin"
+    source.write_bytes(os.urandom(3 * 1024 * 1024 + 1))
+    engine = TransferEngine()
+
+    for name in ("one.bin", "two.bin"):
+        result = engine.copy_with_checksum(str(source), str(tmp_path / name))
+        assert result.strategy == "buffered"
+        assert result.checksum == hashlib.sha256(source.read_bytes()).hexdigest()
+        assert (tmp_path / name).read_bytes() == source.read_bytes()
+
+    # Failing at offset 0 marks the device pair, so the second file skips it.
+    assert unsupported.calls == 1
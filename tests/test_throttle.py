@@ -0,0 +1,208 @@
+import asyncio
+import threading
+import time
+
+from hyperdesk.transfer.throttle import PRIORITY_WEIGHTS, BandwidthGovernor
+
+KB = 1024
+
+
+def _in_debt(rate: int, debt: int) -> BandwidthGovernor:
+    """A governor that will not hand out tokens for ``debt / rate`` seconds."""
+    governor = BandwidthGovernor(rate, burst=KB)
+    governor.acquire(debt)
+    return governor
+
+
+def test_unlimited_governor_only_measures():
+    governor = BandwidthGovernor(window=10.0)
+    started = time.monotonic()
+    for _ in range(100):
+        governor.acquire(1024 * KB)
+
+    assert time.monotonic() - started < 0.5
+    assert governor.measured_rate() == 100 * 1024 * KB / 10.0
+    assert governor.utilization() is None
+
+
+def test_rate_holds_across_shares():
+    governor = BandwidthGovernor(1024 * KB, burst=64 * KB)
+    shares = [governor.register(f"job-{index}") for index in range(3)]
+    started = time.monotonic()
+
+    def pull(share):
+        for _ in range(4):
+            share.acquire(64 * KB)
+
+    threads = [threading.Thread(target=pull, args=(share,)) for share in shares]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # 768 KiB at 1 MiB/s; the last chunk may overdraw, the first is free.
+    elapsed = time.monotonic() - started
+    assert 0.55 < elapsed < 1.5
+
+
+def test_one_chunk_larger_than_burst_still_goes_through():
+    governor = BandwidthGovernor(1024 * KB, burst=KB)
+    started = time.monotonic()
+
+    governor.acquire(512 * KB)
+
+    assert time.monotonic() - started < 0.2
+
+
+def test_set_limit_wakes_waiting_threads():
+    governor = _in_debt(KB, 1024 * KB)
+    done = threading.Event()
+    thread = threading.Thread(target=lambda: (governor.acquire(KB), done.set()))
+    thread.start()
+    assert not done.wait(0.1)
+
+    governor.set_limit(None)
+
+    assert done.wait(1.0)
+    thread.join()
+
+
+def test_idle_time_does_not_bank_more_than_burst():
+    governor = BandwidthGovernor(1024 * KB, burst=64 * KB)
+    time.sleep(0.3)
+    started = time.monotonic()
+
+    for _ in range(4):
+        governor.acquire(64 * KB)
+
+    # Only one burst was banked while idle; the rest waits at the rate.
+    assert time.monotonic() - started > 0.09
+
+
+def _grant_order(governor, names, rounds, chunk):
+    """Have each (name, priority) pull ``rounds`` chunks; return who got
+    tokens in which order."""
+    order = []
+    lock = threading.Lock()
+
+    def pull(share):
+        for _ in range(rounds):
+            share.acquire(chunk)
+            with lock:
+                order.append(share.name)
+
+    threads = [
+        threading.Thread(target=pull, args=(governor.register(name, priority),))
+        for name, priority in names
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return order
+
+
+def test_contended_shares_are_served_by_weight():
+    # Both jobs queue up while the debt is repaid, then compete.
+    governor = _in_debt(1024 * KB, 256 * KB)
+
+    order = _grant_order(
+        governor, [("bulk", "bulk"), ("interactive", "interactive")], rounds=4, chunk=16 * KB
+    )
+
+    assert PRIORITY_WEIGHTS["interactive"] >= 4 * PRIORITY_WEIGHTS["bulk"]
+    assert order[:4] == ["interactive"] * 4
+    assert order[4:] == ["bulk"] * 4
+
+
+def test_equal_weights_take_turns():
+    governor = _in_debt(1024 * KB, 256 * KB)
+
+    order = _grant_order(governor, [("a", "normal"), ("b", "normal")], rounds=3, chunk=16 * KB)
+
+    assert sorted(order) == ["a", "a", "a", "b", "b", "b"]
+    assert all(first != second for first, second in zip(order, order[1:]))
+
+
+def test_unregistered_shares_drop_out_of_the_listing():
+    governor = BandwidthGovernor()
+    with governor.register("job", priority="bulk"):
+        assert governor.active_shares() == {"job": PRIORITY_WEIGHTS["bulk"]}
+
+    assert governor.active_shares() == {}
+
+
+def test_async_acquire_waits_without_blocking_the_loop():
+    async def scenario():
+        governor = BandwidthGovernor(512 * KB, burst=16 * KB)
+        ticks = 0
+
+        async def tick():
+            nonlocal ticks
+            while True:
+                ticks += 1
+                await asyncio.sleep(0.01)
+
+        ticker = asyncio.ensure_future(tick())
+        started = time.monotonic()
+        for _ in range(8):
+            await governor.acquire_async(32 * KB)
+        elapsed = time.monotonic() - started
+        ticker.cancel()
+        return elapsed, ticks
+
+    elapsed, ticks = asyncio.run(scenario())
+
+    # 256 KiB at 512 KiB/s, minus the first chunk's overdraw.
+    assert 0.35 < elapsed < 1.5
+    assert ticks >= 20
+
+
+def test_set_limit_releases_async_waiters():
+    async def scenario():
+        governor = _in_debt(KB, 1024 * KB)
+        waiter = asyncio.ensure_future(governor.acquire_async(KB))
+        await asyncio.sleep(0.05)
+        assert not waiter.done()
+
+        governor.set_limit(None)
+
+        await asyncio.wait_for(waiter, 1.0)
+
+    asyncio.run(scenario())
+
+
+def test_async_shares_are_served_by_weight():
+    async def scenario():
+        governor = _in_debt(1024 * KB, 256 * KB)
+        order = []
+
+        async def pull(share):
+            for _ in range(4):
+                await share.acquire_async(16 * KB)
+                order.append(share.name)
+
+        bulk = governor.register("bulk", priority="bulk")
+        interactive = governor.register("interactive", priority="interactive")
+        await asyncio.gather(pull(bulk), pull(interactive))
+        return order
+
+    order = asyncio.run(scenario())
+
+    assert order[:4] == ["interactive"] * 4
+
+
+def test_thread_ahead_in_the_queue_wakes_a_coroutine():
+    governor = _in_debt(1024 * KB, 128 * KB)
+    thread = threading.Thread(target=governor.acquire, args=(64 * KB,))
+    thread.start()
+    time.sleep(0.02)
+
+    async def behind():
+        started = time.monotonic()
+        await governor.acquire_async(KB)
+        return time.monotonic() - started
+
+    # 128 KiB of debt plus the thread's 64 KiB, at 1 MiB/s.
+    assert asyncio.run(behind()) < 0.4
+    thread.join()
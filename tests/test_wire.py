@@ -0,0 +1,109 @@
+import os
+import socket
+import struct
+import threading
+
+import pytest
+
+from hyperdesk.transfer.channel import FileSender, SessionDataServer, receive_file
+from hyperdesk.transfer.wire import (
+    CONTROL_PAYLOAD_LIMIT,
+    FRAME_DATA,
+    FRAME_HELLO,
+    MAX_CHUNK_SIZE,
+    MAX_FRAME_LENGTH,
+    BufferPool,
+    FrameReader,
+    frame_header,
+    payload_limit,
+    read_mux_frame,
+    send_frame,
+)
+
+from tests.loopback import CHUNK
+
+
+class _RecordingPool(BufferPool):
+    def __init__(self) -> None:
+        super().__init__(size=0)
+        self.requested = []
+
+    def acquire(self, size: int = 0) -> bytearray:
+        self.requested.append(size)
+        return super().acquire(size)
+
+
+def test_payload_limit_falls_back_to_the_largest_chunk():
+    assert payload_limit(CHUNK) == CHUNK + CONTROL_PAYLOAD_LIMIT
+    assert payload_limit(0) == payload_limit(-1) == MAX_CHUNK_SIZE + CONTROL_PAYLOAD_LIMIT
+    assert payload_limit(2 * MAX_CHUNK_SIZE) == payload_limit()
+
+
+def test_reader_accepts_payloads_up_to_the_limit():
+    ours, theirs = socket.socketpair()
+    with ours, theirs:
+        payload = os.urandom(CONTROL_PAYLOAD_LIMIT)
+        send_frame(theirs, FRAME_DATA, 0, len(payload), payload)
+        with FrameReader(ours, max_payload=len(payload)) as reader:
+            assert bytes(reader.read()[3]) == payload
+
+
+def test_oversized_payload_is_refused_before_allocating():
+    ours, theirs = socket.socketpair()
+    pool = _RecordingPool()
+    with ours, theirs:
+        theirs.sendall(frame_header(FRAME_DATA, 0, MAX_FRAME_LENGTH, MAX_FRAME_LENGTH))
+        with FrameReader(ours, pool, max_payload=payload_limit(CHUNK)) as reader:
+            with pytest.raises(ConnectionError, match="exceeds"):
+                reader.read()
+
+    assert pool.requested == []
+
+
+def test_control_frames_are_capped():
+    ours, theirs = socket.socketpair()
+    with ours, theirs:
+        theirs.sendall(
+            struct.pack("!IBQIII", 0, FRAME_HELLO, 0, 0, CONTROL_PAYLOAD_LIMIT + 1, 0)
+        )
+        with pytest.raises(ConnectionError, match="exceeds"):
+            read_mux_frame(ours)
+
+
+def test_receiver_refuses_frames_larger_than_the_offer(tmp_path):
+    source = tmp_path / "source.bin"
+    source.write_bytes(os.urandom(2 * CHUNK))
+    sender = FileSender(chunk_size=CHUNK)
+    port = sender.open()
+    outcome = {}
+
+    def send():
+        try:
+            sender.send_file(source)
+        except OSError as exc:
+            outcome["error"] = exc
+
+    thread = threading.Thread(target=send)
+    thread.start()
+    try:
+        with pytest.raises(ConnectionError, match="exceeds"):
+            receive_file("127.0.0.1", port, tmp_path / "dest", frame_size=CHUNK // 2)
+    finally:
+        thread.join()
+        sender.close()
+
+    assert "error" in outcome
+    assert not (tmp_path / "dest" / "source.bin").exists()
+
+
+def test_session_server_drops_an_oversized_hello():
+    server = SessionDataServer(lambda hello: "s1", host="127.0.0.1")
+    port = server.open()
+    try:
+        with socket.create_connection(("127.0.0.1", port)) as conn:
+            conn.sendall(struct.pack("!IBQIII", 0, FRAME_HELLO, 0, 0, MAX_FRAME_LENGTH, 0))
+            conn.settimeout(5)
+            assert conn.recv(1) == b""
+        assert server.link("s1") is None
+    finally:
+        server.close()